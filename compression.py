@@ -0,0 +1,68 @@
+"""
+Read and write input files that may be compressed, e.g., loads.tab.gz.
+
+scenario_data.write_tables() writes the large .tab files with gzip (or lzma,
+if available) compression if the compress_tables argument is set. Compressed
+files are identified by their extension (see openers), so uncompressed files
+can still be used as before. switch_patch.py decompresses these files as they
+are loaded.
+"""
+
+import os, collections, gzip
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # lzma compression not available
+        lzma = None
+
+# extension for each available compression method, and the function to open it
+openers = collections.OrderedDict([('.gz', gzip.open)])
+if lzma is not None:
+    openers['.xz'] = lzma.open
+
+def extension(method):
+    """Return the file extension for the specified compression method ('gz' or
+    'xz'; True means 'gz')."""
+    ext = '.gz' if method is True else '.' + str(method).lstrip('.')
+    if ext not in openers:
+        raise ValueError(
+            'Compression method "{m}" is not available; use one of {l}.'
+            .format(m=method, l=', '.join(e[1:] for e in openers))
+        )
+    return ext
+
+def open_file(file_name, mode='r'):
+    """Open a file for reading or writing, compressing or decompressing it if
+    needed, based on its extension."""
+    ext = os.path.splitext(file_name)[1]
+    if ext in openers:
+        return openers[ext](file_name, mode.rstrip('b') + 'b')
+    else:
+        return open(file_name, mode)
+
+def file_names(file_name):
+    """Return a list of the uncompressed and compressed names for file_name."""
+    return [file_name] + [file_name + ext for ext in openers]
+
+def uncompressed_name(file_name):
+    """Return file_name without any compression extension."""
+    base, ext = os.path.splitext(file_name)
+    return base if ext in openers else file_name
+
+def find_file(file_name):
+    """Return the name of the uncompressed or compressed version of file_name
+    that exists (preferring the uncompressed one), or None if there isn't one."""
+    for f in file_names(file_name):
+        if os.path.exists(f):
+            return f
+    return None
+
+def remove_other_versions(file_name):
+    """Remove any uncompressed or compressed versions of file_name other than
+    file_name itself, so they won't be loaded by mistake."""
+    for f in file_names(uncompressed_name(file_name)):
+        if f != file_name and os.path.lexists(f):
+            os.remove(f)
@@ -0,0 +1,161 @@
+"""
+Check the input files written by scenario_data.write_tables() for references
+to items that are not defined in the files that define them, e.g., a project
+in variable_capacity_factors.tab that is not in project_info.tab, or a fuel in
+gen_multiple_fuels.dat with no entries in fuel_supply_curves.tab. Pyomo only
+reports these errors while it constructs the model, which may be long after
+the inputs are loaded, so write_tables() runs check_inputs() as soon as the
+files are written.
+
+Each file is read once. The values in the columns that define sets (see
+definitions) and the distinct values in the columns that refer to them (see
+references) are gathered into python sets, and then each reference is checked
+against the set it refers to. Files that are missing (e.g., because the
+module that uses them wasn't exported) are skipped, along with any checks that
+depend on them.
+"""
+
+import os, re, shlex, collections
+import compression
+
+# sets defined by the input files: (set name, file, column)
+definitions = [
+    ('PERIODS', 'periods.tab', 'INVESTMENT_PERIOD'),
+    ('TIMESERIES', 'timeseries.tab', 'TIMESERIES'),
+    ('TIMEPOINTS', 'timepoints.tab', 'timepoint_id'),
+    ('LOAD_ZONES', 'load_zones.tab', 'LOAD_ZONE'),
+    ('GENERATION_TECHNOLOGIES', 'generator_info.tab', 'generation_technology'),
+    ('PROJECTS', 'project_info.tab', 'PROJECT'),
+    ('FUELS', 'fuels.tab', 'fuel'),
+    ('REGIONAL_FUEL_MARKETS', 'regional_fuel_markets.tab', 'regional_fuel_market'),
+    ('SUPPLIED_FUELS', 'fuel_supply_curves.tab', 'fuel'),
+    ('CAP_FACTOR_PROFILES', 'cap_factor_profiles.tab', 'PROFILE'),
+]
+
+# columns that refer to the sets above: (file, column, set name)
+# for indexed sets in .dat files, the column is 'index' or 'members'
+references = [
+    ('timeseries.tab', 'ts_period', 'PERIODS'),
+    ('timepoints.tab', 'timeseries', 'TIMESERIES'),
+    ('loads.tab', 'LOAD_ZONE', 'LOAD_ZONES'),
+    ('loads.tab', 'TIMEPOINT', 'TIMEPOINTS'),
+    ('regional_fuel_markets.tab', 'fuel', 'FUELS'),
+    ('lz_to_regional_fuel_market.tab', 'load_zone', 'LOAD_ZONES'),
+    ('lz_to_regional_fuel_market.tab', 'regional_fuel_market', 'REGIONAL_FUEL_MARKETS'),
+    ('fuel_supply_curves.tab', 'regional_fuel_market', 'REGIONAL_FUEL_MARKETS'),
+    ('fuel_supply_curves.tab', 'fuel', 'FUELS'),
+    ('fuel_supply_curves.tab', 'period', 'PERIODS'),
+    ('gen_multiple_fuels.dat', 'index', 'GENERATION_TECHNOLOGIES'),
+    ('gen_multiple_fuels.dat', 'members', 'FUELS'),
+    ('gen_multiple_fuels.dat', 'members', 'SUPPLIED_FUELS'),
+    ('gen_new_build_costs.tab', 'generation_technology', 'GENERATION_TECHNOLOGIES'),
+    ('gen_new_build_costs.tab', 'investment_period', 'PERIODS'),
+    ('project_info.tab', 'proj_gen_tech', 'GENERATION_TECHNOLOGIES'),
+    ('project_info.tab', 'proj_load_zone', 'LOAD_ZONES'),
+    ('proj_existing_builds.tab', 'PROJECT', 'PROJECTS'),
+    ('proj_build_costs.tab', 'PROJECT', 'PROJECTS'),
+    ('existing_plant_aggregates.tab', 'PROJECT', 'PROJECTS'),
+    ('variable_capacity_factors.tab', 'PROJECT', 'PROJECTS'),
+    ('variable_capacity_factors.tab', 'timepoint', 'TIMEPOINTS'),
+    ('cap_factor_profiles.tab', 'timepoint', 'TIMEPOINTS'),
+    ('project_cap_factor_profiles.tab', 'PROJECT', 'PROJECTS'),
+    ('project_cap_factor_profiles.tab', 'PROFILE', 'CAP_FACTOR_PROFILES'),
+    ('proj_commit_bounds_timeseries.tab', 'PROJECT', 'PROJECTS'),
+    ('proj_commit_bounds_timeseries.tab', 'TIMEPOINT', 'TIMEPOINTS'),
+    ('proj_commit_bounds_defaults.tab', 'PROJECT', 'PROJECTS'),
+    ('ev_energy.tab', 'LOAD_ZONE', 'LOAD_ZONES'),
+    ('ev_energy.tab', 'period', 'PERIODS'),
+]
+
+# number of missing values to show for each reference
+max_listed = 5
+
+def check_inputs(inputs_dir):
+    """Check the input files in inputs_dir for references to undefined items.
+    Raises ValueError describing all the dangling references, if any are found."""
+    # columns needed from each file
+    columns = collections.defaultdict(set)
+    for (set_name, file, col) in definitions:
+        columns[file].add(col)
+    for (file, col, set_name) in references:
+        columns[file].add(col)
+
+    # read each file once, gathering the distinct values in each column needed
+    values = {}
+    for file, cols in columns.items():
+        path = compression.find_file(os.path.join(inputs_dir, file))
+        if path is not None:
+            if file.endswith('.dat'):
+                values[file] = read_indexed_sets(path)
+            else:
+                values[file] = read_columns(path, cols)
+
+    defined = {
+        set_name: values[file].get(col, set())
+        for (set_name, file, col) in definitions if file in values
+    }
+    defining_file = {set_name: file for (set_name, file, col) in definitions}
+
+    problems = []
+    for (file, col, set_name) in references:
+        if file in values and set_name in defined:
+            missing = values[file].get(col, set()) - defined[set_name]
+            if missing:
+                listed = sorted(missing)[:max_listed]
+                problems.append(
+                    '{f}: {n} value(s) in {c} not found in {df} ({s}): {l}{more}'.format(
+                        f=file, n=len(missing), c=col, df=defining_file[set_name], s=set_name,
+                        l=', '.join(str(v) for v in listed),
+                        more=', ...' if len(missing) > max_listed else ''
+                    )
+                )
+    if problems:
+        raise ValueError(
+            'Dangling references found in input files in {d}:\n    {p}'
+            .format(d=inputs_dir, p='\n    '.join(problems))
+        )
+
+def read_columns(tab_file, cols):
+    """Return a dictionary with the set of distinct values in each of the
+    specified columns of tab_file (any columns that are missing are omitted).
+    Missing values ('.') are ignored."""
+    with compression.open_file(tab_file) as f:
+        headers = f.readline().rstrip('\n').split('\t')
+        indexes = [(c, headers.index(c)) for c in cols if c in headers]
+        found = {c: set() for (c, i) in indexes}
+        for line in f:
+            row = line.rstrip('\n').split('\t')
+            for (c, i) in indexes:
+                found[c].add(row[i])
+    return {c: set(key_value(v) for v in vals if v != '.') for c, vals in found.items()}
+
+# set NAME[index] := member member ... ;
+indexed_set = re.compile(r'set\s+\w+\s*\[(.*?)\]\s*:=(.*?);', re.DOTALL)
+
+def read_indexed_sets(dat_file):
+    """Return a dictionary with the set of indexes ('index') and the set of
+    members of all the sets ('members') defined in an indexed-set .dat file,
+    as written by scenario_data.write_indexed_set_dat_file()."""
+    with open(dat_file) as f:
+        text = f.read()
+    found = {'index': set(), 'members': set()}
+    for index, members in indexed_set.findall(text):
+        found['index'].add(tuple(key_value(v.strip()) for v in index.split(',')))
+        found['members'].update(key_value(v) for v in shlex.split(members))
+    # single-dimensional indexes are compared as plain values
+    found['index'] = set(k[0] if len(k) == 1 else k for k in found['index'])
+    return found
+
+def key_value(val):
+    """Convert a value from an input file into a form that can be compared
+    between files (numbers are compared by value, as pyomo does)."""
+    if len(val) >= 2 and val[0] == '"' and val[-1] == '"':
+        return val[1:-1].replace('""', '"')
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return val
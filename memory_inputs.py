@@ -0,0 +1,130 @@
+"""
+Pass the inputs exported by scenario_data directly to the model, without
+writing and parsing the text files.
+
+If the in_memory argument is set, scenario_data.write_tables() keeps a typed
+copy of each table it exports, registers it here under the name of its input
+file, and returns all of them in a dictionary keyed by file name (e.g.,
+'variable_capacity_factors.tab'). switch_patch.py then loads the model data
+from these tables instead of the files, when the model is built in the same
+process. The text files are written later by a background thread (if at all),
+so the loaders wait for a file only if they need to read it (see
+wait_for_file()).
+
+Tables from .tab files are stored as an OrderedDict of columns ({column name:
+list of values}, with None for missing values). Tables from .dat files are
+stored as an OrderedDict of parameter values or indexed sets ({index: list of
+members}). Values are converted the same way pyomo converts the values in the
+text files (numbers become ints or floats, and everything else becomes a
+string). Floats are rounded to the precision str() writes in the text files,
+so the archived files reproduce the in-memory inputs exactly.
+"""
+
+import os, collections, threading
+import compression
+
+tables = {}         # absolute name of uncompressed input file -> table
+written = {}        # same keys -> threading.Event, set once the text file is written
+lock = threading.Lock()
+
+def table_key(file_name):
+    return os.path.abspath(compression.uncompressed_name(file_name))
+
+def store(file_name, table, archived):
+    """Register the table for file_name. archived should be True if the text
+    file will also be written (see file_written())."""
+    key = table_key(file_name)
+    with lock:
+        tables[key] = table
+        written[key] = threading.Event() if archived else None
+
+def find_table(file_name):
+    """Return the table for file_name, or None if it wasn't exported in memory."""
+    with lock:
+        return tables.get(table_key(file_name), None)
+
+def file_written(file_name):
+    """Report that the text file for file_name has been written (or that it
+    won't be, because writing failed)."""
+    with lock:
+        event = written.get(table_key(file_name), None)
+    if event is not None:
+        event.set()
+
+def wait_for_file(file_name):
+    """Wait until the text file for file_name has been written, if it was
+    exported in memory. Raises ValueError if the text file won't be written."""
+    key = table_key(file_name)
+    with lock:
+        if key not in tables:
+            return
+        event = written[key]
+    if event is None:
+        raise ValueError(
+            '{f} was exported in memory only (archive_inputs=False), and cannot '
+            'be loaded with these options.'.format(f=file_name)
+        )
+    event.wait()
+
+def clear():
+    """Discard all the tables registered so far."""
+    with lock:
+        tables.clear()
+        written.clear()
+
+def tab_table(columns, rows):
+    """Return a table of typed columns for the specified column names and rows."""
+    rows = list(rows)
+    values = zip(*rows) if rows else [() for c in columns]
+    return collections.OrderedDict(
+        (c, column_values(v)) for c, v in zip(columns, values)
+    )
+
+def indexed_set_table(set_name, sets):
+    """Return a table for a .dat file defining the indexed set set_name, with
+    the members for each index (a tuple) in sets."""
+    return collections.OrderedDict([(set_name, collections.OrderedDict(
+        (
+            model_value(k[0]) if len(k) == 1 else tuple(model_value(i) for i in k),
+            [model_value(v) for v in members]
+        )
+        for k, members in sets
+    ))])
+
+def column_values(col):
+    """Convert a column of database values into the values pyomo would read
+    from the text file. Each distinct value is only converted once."""
+    converted = {}
+    out = []
+    for v in col:
+        if v is None or type(v) in (int, long):
+            out.append(v)
+        elif type(v) is float:
+            out.append(float(str(v)))
+        else:
+            # (the converted value only depends on the text written in the 
+            # file, and values that compare equal, e.g., True, Decimal('1') 
+            # and Decimal('1.0'), may be written differently)
+            key = str(v)
+            if key not in converted:
+                converted[key] = model_value(v)
+            out.append(converted[key])
+    return out
+
+def model_value(val):
+    """Convert a value into the value pyomo would read from the text file, 
+    where it was written with str() (see scenario_data.stringify())."""
+    if val is None or type(val) in (int, long):
+        return val
+    if type(val) is float:
+        return float(str(val))
+    # e.g., Decimal('0.5') -> 0.5, True -> 'True', as in the text files
+    val = str(val)
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return val
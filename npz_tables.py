@@ -0,0 +1,147 @@
+"""
+Write and read binary (.npz) copies of large .tab input files.
+
+scenario_data.write_tables() can write a sidecar file next to each of the large
+timepoint-indexed .tab files (e.g., variable_capacity_factors.npz next to
+variable_capacity_factors.tab) if the npz_sidecars argument is set. Each
+sidecar holds the column names and one numpy array per column: 64-bit ints or
+floats for numeric columns (with NaN for missing values) and byte strings for
+other columns.
+
+The sidecar is normally built from the rows scenario_data has just written to
+the .tab file, so the file doesn't have to be read back. switch_patch.py uses
+read_npz() to load parameters from the sidecar instead of parsing the .tab
+file, when the sidecar was made from the current version of the .tab file.
+(Each sidecar records the size and modification time of the file it was made
+from, so this can be checked without reading the file.) The values are 
+converted the same way pyomo converts values in .tab files, so the model gets
+the same data either way.
+"""
+
+import os, csv
+import numpy as np
+import compression
+
+def sidecar_file(tab_file):
+    """Return the name of the .npz sidecar for tab_file (which may be compressed)."""
+    return os.path.splitext(compression.uncompressed_name(tab_file))[0] + '.npz'
+
+def sidecar_is_current(tab_file):
+    """Report whether tab_file has a sidecar that was made from its current contents."""
+    npz_file = sidecar_file(tab_file)
+    if not os.path.exists(npz_file):
+        return False
+    with np.load(npz_file) as data:
+        if 'source_size' not in data.files or 'source_mtime' not in data.files:
+            # made by an older version of this module
+            return False
+        size, mtime = int(data['source_size']), float(data['source_mtime'])
+    stat = os.stat(tab_file)
+    return size == stat.st_size and mtime == stat.st_mtime
+
+def write_npz(tab_file, table=None):
+    """Create or update the .npz sidecar for tab_file, which should have been
+    written by scenario_data. If table is given, it should hold the typed 
+    columns that were written to tab_file (see memory_inputs.tab_table());
+    otherwise the data are read back from tab_file (tab-separated, with '.' 
+    for missing values and double quotes around strings that contain spaces,
+    tabs or quotes), if the sidecar isn't already current. The file may be 
+    compressed (see compression.py)."""
+    if table is not None:
+        columns = list(table)
+        values = [typed_column_array(c) for c in table.values()]
+    elif sidecar_is_current(tab_file):
+        return
+    else:
+        with compression.open_file(tab_file) as f:
+            # fields are separated by tabs, and quoted strings may contain tabs
+            # or doubled quotes (see scenario_data.stringify())
+            rows = list(csv.reader(f, delimiter='\t', quotechar='"', doublequote=True))
+        columns, rows = rows[0], rows[1:]
+        values = [column_array(c) for c in zip(*rows)]
+    if not values or len(values[0]) == 0:
+        values = [np.array([], dtype=np.float64) for c in columns]
+    stat = os.stat(tab_file)
+    arrays = {'col{}'.format(i): v for i, v in enumerate(values)}
+    arrays['columns'] = np.array(columns)
+    arrays['source_size'] = np.array(stat.st_size, dtype=np.int64)
+    arrays['source_mtime'] = np.array(stat.st_mtime, dtype=np.float64)
+    # write to a temporary file first, so readers never see a partial sidecar
+    npz_file = sidecar_file(tab_file)
+    temp_file = npz_file + '.{}.tmp'.format(os.getpid())
+    with open(temp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    if os.path.exists(npz_file):
+        os.remove(npz_file)     # needed on Windows
+    os.rename(temp_file, npz_file)
+
+def column_array(col):
+    """Convert a column of (unquoted) text values from a .tab file into a numpy array."""
+    if all(v == '.' or is_number(v) for v in col):
+        if '.' not in col and all(is_int(v) for v in col):
+            return np.array([int(v) for v in col], dtype=np.int64)
+        else:
+            return np.array([np.nan if v == '.' else float(v) for v in col], dtype=np.float64)
+    else:
+        return np.array(col)
+
+def typed_column_array(col):
+    """Convert a column of values as pyomo would read them from a .tab file 
+    (numbers, strings or None for missing values) into the same numpy array 
+    that column_array() makes from the text values."""
+    if all(v is None or type(v) in (int, long, float) for v in col):
+        if None not in col and all(type(v) in (int, long) for v in col):
+            return np.array(col, dtype=np.int64)
+        else:
+            return np.array([np.nan if v is None else v for v in col], dtype=np.float64)
+    else:
+        return np.array(['.' if v is None else str(v) for v in col])
+
+def is_int(val):
+    try:
+        int(val)
+        return True
+    except ValueError:
+        return False
+
+def is_number(val):
+    try:
+        float(val)
+        return True
+    except ValueError:
+        return False
+
+def pyomo_value(val):
+    """Convert a string from a .tab file into a number, if possible, like pyomo does."""
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return val
+
+def read_npz(npz_file):
+    """Return a list of column names and a list of values for each column
+    from an .npz sidecar. Missing values are returned as None."""
+    with np.load(npz_file) as data:
+        columns = data['columns'].tolist()
+        arrays = [data['col{}'.format(i)] for i in range(len(columns))]
+    values = []
+    for a in arrays:
+        if a.dtype.kind == 'f':
+            missing = np.isnan(a)
+            col = a.tolist()
+            if missing.any():
+                for i in np.flatnonzero(missing).tolist():
+                    col[i] = None
+        elif a.dtype.kind in 'iu':
+            col = a.tolist()
+        else:
+            # convert each distinct string once, then expand to the full column
+            unique, inverse = np.unique(a, return_inverse=True)
+            converted = [None if v == '.' else pyomo_value(v) for v in unique.tolist()]
+            col = [converted[i] for i in inverse.tolist()]
+        values.append(col)
+    return columns, values
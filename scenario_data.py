@@ -1,6 +1,7 @@
-import time, sys, collections, os
+import time, sys, collections, os, re, json, shutil, hashlib, tempfile, threading, functools, itertools, inspect, heapq, Queue
 from textwrap import dedent
 import psycopg2
+import sqlite_snapshot, compression, input_checks, memory_inputs
 
 # NOTE: instead of using the python csv writer, this directly writes tables to 
 # file in the pyomo .tab format. This uses tabs between columns and the standard
@@ -21,6 +22,57 @@ import psycopg2
 # NOTE: write_table() will automatically convert null values to '.', 
 # so pyomo will recognize them as missing data
 
+# NOTE: if the use_copy argument is set, the large timepoint-indexed tables (see 
+# large_tables below) are streamed straight to disk with postgres' COPY command
+# instead of passing each row through python. The quoting and null translations 
+# above are then done by the database (see copy_table()), and the header row is 
+# written by python as usual. Floating point values are written with the full 
+# precision reported by postgres, instead of python's str() precision.
+
+# NOTE: if the fetch_batch_size argument is set, other queries are run on 
+# server-side cursors, which retrieve that many rows at a time, so memory use 
+# doesn't grow with the size of the table (see query_rows()). In this mode 
+# write_indexed_set_dat_file() also has the database group the rows by index 
+# (keeping the order of the members) and writes each set as soon as it is 
+# complete, instead of gathering all the sets in memory first.
+
+# NOTE: if the prefetch_batches argument is also set, the batches are fetched
+# by a separate thread, which stays up to that many batches ahead of the 
+# thread that formats and writes the rows. This keeps the database connection
+# and the CPU busy at the same time, even with a single connection (see 
+# prefetched_rows()).
+
+# NOTE: if the npz_sidecars argument is set, a binary copy of each of the large 
+# timepoint-indexed tables (see large_tables below) is also saved as an .npz 
+# file, which switch_patch.py can load much faster than the .tab file (see 
+# npz_tables.py).
+
+# NOTE: if the compress_tables argument is set to 'gz' (or True) or 'xz', the 
+# large timepoint-indexed tables are written with that compression, e.g., as
+# loads.tab.gz. switch_patch.py decompresses them as they are loaded.
+
+# NOTE: if the dedup_cap_factors argument is set, variable_capacity_factors.tab
+# is replaced by cap_factor_profiles.tab, which holds each distinct hourly 
+# capacity factor profile once, and project_cap_factor_profiles.tab, which 
+# shows the profile used by each project (see write_profile_tables()). 
+# switch_patch.py expands these into proj_max_capacity_factor when loading.
+
+# NOTE: if the hours_per_timepoint argument is set to 2 or more, consecutive
+# hours in each timeseries are grouped into timepoints of that many hours. 
+# Each timepoint is identified by its first hour, ts_duration_of_tp and 
+# ts_num_tps are adjusted to match, and the hourly loads, capacity factors and
+# commitment bounds are averaged over the hours in each timepoint (see 
+# timepoint_average()). This gives smaller models for screening studies 
+# without defining a separate time_sample in the database. The number of 
+# hours in each timeseries must be a multiple of hours_per_timepoint.
+
+# NOTE: after all the files are written, they are checked for references to
+# items that aren't defined in the other files, e.g., projects in 
+# variable_capacity_factors.tab that aren't in project_info.tab (see 
+# input_checks.py). Any problems are reported with a ValueError, instead of 
+# during model construction. Set the check_inputs argument to False to skip 
+# this.
+
 # NOTE: the code below could be made more generic, e.g., a list of
 # table names and queries, which are then processed at the end.
 # But that would be harder to debug, and wouldn't allow for ad hoc 
@@ -28,6 +80,11 @@ import psycopg2
 
 def write_tables(**args):
 
+    # if the user asks for more than one export worker, the write_* calls below
+    # only queue up their jobs; finish_export() then runs them in parallel
+    # at the end of this function.
+    start_export(args)
+
     #########################
     # timescales
     
@@ -54,7 +111,9 @@ def write_tables(**args):
 
     write_table('timeseries.tab', """
         SELECT study_date as "TIMESERIES", period as ts_period, 
-            ts_duration_of_tp, ts_num_tps, ts_scale_to_period
+            ts_duration_of_tp * %(hours_per_timepoint)s AS ts_duration_of_tp, 
+            CAST(ts_num_tps / %(hours_per_timepoint)s AS integer) AS ts_num_tps, 
+            ts_scale_to_period
         FROM study_date
         WHERE time_sample = %(time_sample)s
         ORDER BY 1;
@@ -62,12 +121,14 @@ def write_tables(**args):
 
     write_table('timepoints.tab', """
         SELECT h.study_hour as timepoint_id, 
-                to_char(date_time + (period - extract(year from date_time)) * interval '1 year',
+                to_char(h.date_time + (d.period - extract(year from h.date_time)) * interval '1 year',
                     'YYYY-MM-DD-HH24:MI') as timestamp,
                 h.study_date as timeseries 
             FROM study_hour h JOIN study_date d USING (study_date, time_sample)
+                JOIN study_timepoint t USING (study_date, time_sample, study_hour)
             WHERE h.time_sample = %(time_sample)s
-            ORDER BY period, extract(doy from date), study_hour;
+                AND t.hour_index %% %(hours_per_timepoint)s = 0
+            ORDER BY d.period, extract(doy from date), h.study_hour;
     """, args)
 
     #########################
@@ -96,22 +157,21 @@ def write_tables(**args):
 
     # get system loads, scaled from the historical years to the model years
     # note: 'offset' is a keyword in postgresql, so we use double-quotes to specify the column name
-    write_table('loads.tab', """
+    write_table('loads.tab', timepoint_average("""
         SELECT 
             l.load_zone AS "LOAD_ZONE", 
             study_hour AS "TIMEPOINT",
             system_load * scale + "offset" AS lz_demand_mw
-        FROM study_date d 
-            JOIN study_hour h USING (time_sample, study_date)
+        FROM study_timepoint t
             JOIN system_load l USING (date_time)
             JOIN system_load_scale s ON (
                 s.load_zone = l.load_zone 
                 AND s.year_hist = extract(year from l.date_time)
-                AND s.year_fore = d.period)
+                AND s.year_fore = t.period)
         WHERE l.load_zone in %(load_zones)s
-            AND d.time_sample = %(time_sample)s
+            AND t.time_sample = %(time_sample)s
             AND load_scen_id = %(load_scen_id)s;
-    """, args)
+    """, '"LOAD_ZONE"', '"TIMEPOINT"', ['lz_demand_mw'], args), args)
 
 
     #########################
@@ -121,13 +181,13 @@ def write_tables(**args):
         SELECT DISTINCT fuel AS "NON_FUEL_ENERGY_SOURCES"
             FROM generator_costs 
             WHERE fuel NOT IN (SELECT fuel_type FROM fuel_costs)
-                AND min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND min_vintage_year <= %(last_period)s
         UNION DISTINCT 
             SELECT aer_fuel_code AS "NON_FUEL_ENERGY_SOURCES" 
             FROM existing_plants 
             WHERE aer_fuel_code NOT IN (SELECT fuel_type FROM fuel_costs)
                 AND load_zone in %(load_zones)s
-                AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND insvyear <= %(last_period)s
                 AND technology NOT IN %(exclude_technologies)s;
     """, args)
 
@@ -145,7 +205,8 @@ def write_tables(**args):
         'rps_targets.tab', 
         headers=('year', 'rps_target'), 
         data=[(y, args['rps_targets'][y]) for y in sorted(args['rps_targets'].keys())],
-        arguments=args
+        arguments=args,
+        arg_names=['rps_targets']
     )
 
     #########################
@@ -253,7 +314,7 @@ def write_tables(**args):
                 null AS g_unit_size
             FROM generator_costs
             WHERE technology NOT IN %(exclude_technologies)s
-                AND min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND min_vintage_year <= %(last_period)s
         UNION SELECT
                 g.technology as generation_technology, 
                 g.technology as g_dbid, 
@@ -275,7 +336,7 @@ def write_tables(**args):
                 AVG(peak_mw) AS g_unit_size  -- minimum block size for unit commitment
             FROM existing_plants_gen_tech g JOIN existing_plants p USING (technology)
             WHERE p.load_zone in %(load_zones)s
-                AND p.insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND p.insvyear <= %(last_period)s
                 AND g.technology NOT IN %(exclude_technologies)s
             GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
         ORDER BY 1;
@@ -296,7 +357,7 @@ def write_tables(**args):
                 fuel as orig_fuel,
                 0 as cogen
             FROM generator_costs c
-            WHERE min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+            WHERE min_vintage_year <= %(last_period)s
                 AND technology NOT IN %(exclude_technologies)s
             UNION DISTINCT
             SELECT DISTINCT
@@ -305,7 +366,7 @@ def write_tables(**args):
                 g.cogen
             FROM existing_plants_gen_tech g JOIN existing_plants p USING (technology)
             WHERE p.load_zone in %(load_zones)s
-                AND p.insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND p.insvyear <= %(last_period)s
                 AND g.technology NOT IN %(exclude_technologies)s
         ), all_fueled_techs AS (
             SELECT * from all_techs WHERE orig_fuel NOT IN ('SUN', 'WND', 'MSW')
@@ -349,7 +410,7 @@ def write_tables(**args):
         FROM generator_costs, study_periods
         WHERE technology NOT IN %(exclude_technologies)s
             AND time_sample = %(time_sample)s
-            AND min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+            AND min_vintage_year <= %(last_period)s
         ORDER BY 1, 2;
     """.format(inflator=inflator), args)
 
@@ -429,7 +490,7 @@ def write_tables(**args):
                 cast(null as float) AS proj_variable_om    -- this is supplied in generator_info.tab for new projects
             FROM t_all_projects a JOIN generator_costs g on g.technology=a.proj_gen_tech
             WHERE a.proj_load_zone IN %(load_zones)s
-                AND g.min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND g.min_vintage_year <= %(last_period)s
                 AND g.technology NOT IN %(exclude_technologies)s
             UNION
             -- collect data on existing projects
@@ -444,7 +505,7 @@ def write_tables(**args):
                    / sum(avg_mw) AS proj_variable_om
             FROM existing_plants
             WHERE load_zone IN %(load_zones)s
-                AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND insvyear <= %(last_period)s
                 AND technology NOT IN %(exclude_technologies)s
             GROUP BY 1, 2, 3, 4, 5, 6
             ORDER BY 4, 3, 1;
@@ -457,7 +518,7 @@ def write_tables(**args):
                 sum(peak_mw) as proj_existing_cap
         FROM existing_plants
         WHERE load_zone in %(load_zones)s
-            AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+            AND insvyear <= %(last_period)s
             AND technology NOT IN %(exclude_technologies)s
         GROUP BY 1, 2;
     """, args)
@@ -472,11 +533,22 @@ def write_tables(**args):
                 sum(fixed_o_m * 1000.0 * peak_mw) / sum(peak_mw) as proj_fixed_om
         FROM existing_plants
         WHERE load_zone in %(load_zones)s
-            AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+            AND insvyear <= %(last_period)s
             AND technology NOT IN %(exclude_technologies)s
         GROUP BY 1, 2;
     """, args)
 
+    if args.get('aggregate_plants', False):
+        # units in each aggregate existing project (see start_plant_aggregation())
+        write_tab_file(
+            'existing_plant_aggregates.tab', 
+            ['PROJECT', 'unit', 'unit_peak_mw', 'capacity_share'],
+            plant_aggregate_units(),
+            args
+        )
+    else:
+        remove_input_file('existing_plant_aggregates.tab', args)
+
 
     #########################
     # project.dispatch
@@ -485,15 +557,15 @@ def write_tables(**args):
     if args.get("skip_cf", False):
         print "SKIPPING variable_capacity_factors.tab"
     else:
-        write_table('variable_capacity_factors.tab', """
+        cap_factor_query = """
             SELECT 
                 concat_ws('_', load_zone, technology, site, orientation) as "PROJECT",
                 study_hour as timepoint,
                 cap_factor as proj_max_capacity_factor
             FROM generator_costs g JOIN cap_factor c USING (technology)
-                JOIN study_hour h using (date_time)
+                JOIN study_timepoint h using (date_time)
             WHERE load_zone in %(load_zones)s and time_sample = %(time_sample)s
-                AND min_vintage_year <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND min_vintage_year <= %(last_period)s
                 AND g.technology NOT IN %(exclude_technologies)s
             UNION 
             SELECT 
@@ -501,14 +573,28 @@ def write_tables(**args):
                 study_hour as timepoint, 
                 cap_factor as proj_max_capacity_factor
             FROM existing_plants p JOIN existing_plants_cap_factor c USING (project_id)
-                JOIN study_hour h USING (date_time)
+                JOIN study_timepoint h USING (date_time)
             WHERE h.date_time = c.date_time 
                 AND c.load_zone in %(load_zones)s
                 AND h.time_sample = %(time_sample)s
-                AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+                AND insvyear <= %(last_period)s
                 AND p.technology NOT IN %(exclude_technologies)s
             ORDER BY 1, 2
-        """, args)
+        """
+        cap_factor_query = timepoint_average(
+            cap_factor_query, '"PROJECT"', 'timepoint', ['proj_max_capacity_factor'], args
+        )
+        if args.get('dedup_cap_factors', False):
+            # write each distinct hourly profile once, and the profile used by each
+            # project; switch_patch.py expands these into proj_max_capacity_factor
+            write_profile_tables(
+                'cap_factor_profiles.tab', 'project_cap_factor_profiles.tab', cap_factor_query, args
+            )
+            remove_input_file('variable_capacity_factors.tab', args)
+        else:
+            write_table('variable_capacity_factors.tab', cap_factor_query, args)
+            remove_input_file('cap_factor_profiles.tab', args)
+            remove_input_file('project_cap_factor_profiles.tab', args)
 
 
     #########################
@@ -528,21 +614,48 @@ def write_tables(**args):
     # TODO: eventually add code to only provide these values for the timepoints before 
     # each project retires (providing them after retirement will cause an error).
 
-    write_table('proj_commit_bounds_timeseries.tab', """
-        SELECT * FROM (
-            SELECT project_id as "PROJECT",
-                study_hour AS "TIMEPOINT",
-                case when %(enable_must_run)s = 1 and must_run = 1 then 1.0 else null end as proj_min_commit_fraction, 
-                null as proj_max_commit_fraction,
-                null as proj_min_load_fraction
-            FROM existing_plants, study_hour
-            WHERE load_zone in %(load_zones)s
-                AND time_sample = %(time_sample)s
-                AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
-                AND technology NOT IN %(exclude_technologies)s
-        ) AS the_data
-        WHERE proj_min_commit_fraction IS NOT NULL OR proj_max_commit_fraction IS NOT NULL OR proj_min_load_fraction IS NOT NULL;
-    """, args)
+    if args.get('sparse_commit_bounds', False):
+        # The commitment bounds are currently the same for every timepoint, so
+        # write them once per project; switch_patch.py expands these defaults to 
+        # all timepoints when loading proj_commit_bounds_timeseries.tab. Any 
+        # timepoint-specific bounds (e.g., for maintenance outages) should be 
+        # written as overrides in proj_commit_bounds_timeseries.tab; there are 
+        # none for now, so we remove any older copy of that file.
+        write_table('proj_commit_bounds_defaults.tab', """
+            SELECT * FROM (
+                SELECT DISTINCT project_id as "PROJECT",
+                    case when %(enable_must_run)s = 1 and must_run = 1 then 1.0 else null end as proj_min_commit_fraction, 
+                    null as proj_max_commit_fraction,
+                    null as proj_min_load_fraction
+                FROM existing_plants
+                WHERE load_zone in %(load_zones)s
+                    AND insvyear <= %(last_period)s
+                    AND technology NOT IN %(exclude_technologies)s
+            ) AS the_data
+            WHERE proj_min_commit_fraction IS NOT NULL OR proj_max_commit_fraction IS NOT NULL OR proj_min_load_fraction IS NOT NULL;
+        """, args)
+        remove_input_file('proj_commit_bounds_timeseries.tab', args)
+    else:
+        write_table('proj_commit_bounds_timeseries.tab', timepoint_average("""
+            SELECT * FROM (
+                SELECT DISTINCT project_id as "PROJECT",
+                    study_hour AS "TIMEPOINT",
+                    case when %(enable_must_run)s = 1 and must_run = 1 then 1.0 else null end as proj_min_commit_fraction, 
+                    null as proj_max_commit_fraction,
+                    null as proj_min_load_fraction
+                FROM existing_plants, study_timepoint
+                WHERE load_zone in %(load_zones)s
+                    AND time_sample = %(time_sample)s
+                    AND insvyear <= %(last_period)s
+                    AND technology NOT IN %(exclude_technologies)s
+            ) AS the_data
+            WHERE proj_min_commit_fraction IS NOT NULL OR proj_max_commit_fraction IS NOT NULL OR proj_min_load_fraction IS NOT NULL;
+        """, 
+            '"PROJECT"', '"TIMEPOINT"', 
+            ['proj_min_commit_fraction', 'proj_max_commit_fraction', 'proj_min_load_fraction'], 
+            args
+        ), args)
+        remove_input_file('proj_commit_bounds_defaults.tab', args)
 
     # TODO: get minimum loads for new and existing power plants and then activate the query below
 
@@ -560,7 +673,7 @@ def write_tables(**args):
     #         null AS g_startup_om
     #     FROM existing_plants
     #     WHERE load_zone in %(load_zones)s
-    #        AND insvyear <= (SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s)
+    #        AND insvyear <= %(last_period)s
     #        AND technology NOT IN %(exclude_technologies)s
     #     GROUP BY 1
     #     ORDER by 1;
@@ -608,9 +721,10 @@ def write_tables(**args):
     #########################
     # batteries
     # TODO: put these data in a database and write a .tab file instead
+    # note: the parameters are sorted, so the file doesn't depend on the order of args
     write_dat_file(
         'batteries.dat',
-        [k for k in args if k.startswith('battery_')],
+        sorted(k for k in args if k.startswith('battery_')),
         args
     )
 
@@ -634,7 +748,8 @@ def write_tables(**args):
             'pumped_hydro.tab',
             headers=args["pumped_hydro_headers"],
             data=args["pumped_hydro_projects"],
-            arguments=args
+            arguments=args,
+            arg_names=["pumped_hydro_headers", "pumped_hydro_projects"]
         )
 
     # write_dat_file(
@@ -648,32 +763,243 @@ def write_tables(**args):
     # TODO: put these data in a database and write a .tab file instead
     write_dat_file(
         'hydrogen.dat',
-        [k for k in args if k.startswith('hydrogen_') or k.startswith('liquid_hydrogen_')],
+        sorted(k for k in args if k.startswith('hydrogen_') or k.startswith('liquid_hydrogen_')),
         args
     )
 
-# the two functions below could be used as the start of a system
-# to write placeholder files for any files in the current scenario 
-# that match the base files. This could be used to avoid creating large
-# files (variable_cap_factor.tab) for alternative scenarios that are 
-# otherwise very similar. i.e., placeholder .tab or .dat files could 
-# be written with just the line 'include ../variable_cap_factor.tab' or 
-# 'include ../financial.dat'.
+    return finish_export(args)
+
+#########################
+# module-aware export
+
+# NOTE: if the modules argument is set to the list of modules used by the 
+# scenario (or the name of a modules.txt file listing them), the optional 
+# input files listed in module_files below are only written if one of the 
+# modules that reads them is in the list; any older copies of the others are
+# removed. Files not listed in module_files are read by core modules and are 
+# always written. The module list, the files written and the files skipped 
+# because no module reads them are recorded in module_inputs.json in the 
+# inputs directory. (.dat files with none of their arguments set, e.g., 
+# hydrogen.dat without any hydrogen arguments, are in neither list.) A module in the 
+# list matches a reader if they have the same name, if the reader is inside 
+# the listed package (e.g., switch_mod.project.unitcommit), or if the listed
+# module is the reader inside some other package (e.g., switch_hawaii.rps).
+
+# modules that read each optional input file
+module_files = {
+    'rps_targets.tab': ['rps'],
+    'batteries.dat': ['batteries'],
+    'ev_energy.tab': ['ev'],
+    'pumped_hydro.tab': ['pumped_hydro'],
+    'hydrogen.dat': ['hydrogen'],
+    'fuel_cost.tab': ['switch_mod.fuel_cost'],
+    'regional_fuel_markets.tab': ['switch_mod.fuel_markets'],
+    'fuel_supply_curves.tab': ['switch_mod.fuel_markets', 'fuel_markets_expansion'],
+    'lz_to_regional_fuel_market.tab': ['switch_mod.fuel_markets'],
+    'proj_commit_bounds_timeseries.tab': ['switch_mod.project.unitcommit.commit'],
+    'proj_commit_bounds_defaults.tab': ['switch_mod.project.unitcommit.commit'],
+}
+
+# output file -> whether it was needed by the scenario's modules, for the current export
+module_file_status = {}
+module_file_lock = threading.Lock()
+
+def scenario_modules(args):
+    """Return the list of modules for this scenario, or None if not specified."""
+    modules = args.get('modules', None)
+    if isinstance(modules, basestring):
+        with open(modules) as f:
+            modules = [
+                line.split('#')[0].strip() for line in f if line.split('#')[0].strip()
+            ]
+    return modules
+
+def module_reads(module, reader):
+    """Report whether listing module in the module list would load reader."""
+    return (
+        module == reader 
+        or reader.startswith(module + '.') 
+        or module.endswith('.' + reader)
+    )
+
+def file_needed(output_file, args):
+    """Report whether any module in the scenario's module list reads output_file
+    (always True if no module list was given or the file is always needed)."""
+    modules = scenario_modules(args)
+    readers = module_files.get(output_file, None)
+    if modules is None or readers is None:
+        return True
+    return any(module_reads(m, r) for m in modules for r in readers)
+
+def record_module_file(output_file, needed):
+    with module_file_lock:
+        module_file_status[output_file] = needed
+
+def input_written(output_file, args):
+    """Report whether output_file was created by this export (as a file, 
+    possibly compressed, or as a table kept in memory)."""
+    return memory_inputs.find_table(make_file_path(output_file, args)) is not None or any(
+        os.path.exists(make_file_path(f, args)) for f in compression.file_names(output_file)
+    )
+
+def write_module_inputs(args):
+    """Record the modules used for this export, the input files written and 
+    the files skipped because no module reads them in module_inputs.json."""
+    modules = scenario_modules(args)
+    if modules is None:
+        return
+    with open(make_file_path('module_inputs.json', args), 'w') as f:
+        json.dump(collections.OrderedDict([
+            ('modules', modules),
+            ('files', sorted(k for k, v in module_file_status.items() if v and input_written(k, args))),
+            ('skipped', sorted(k for k, v in module_file_status.items() if not v)),
+        ]), f, indent=2)
+
+#########################
+# shared base inputs
+
+# NOTE: alternative scenarios that differ only slightly from a base scenario 
+# can share the base scenario's input files. To do this, export the base 
+# scenario into inputs_dir, then export each alternative scenario with an 
+# inputs_subdir and an alt_args dictionary holding the arguments that differ 
+# from the base scenario. Any file that doesn't depend on any of the alt_args
+# (according to the functions below) is then written once in inputs_dir (if
+# it isn't there already) and linked from inputs_subdir, so each subdirectory
+# only holds the files that actually differ. Links are symbolic links where 
+# available. Otherwise, .dat files get a placeholder with the line 
+# 'include "../financials.dat";' and other files are copied.
+# Files from write_tab_file() are always written in inputs_subdir, unless the 
+# caller lists the arguments their data came from (arg_names).
+# Some arguments are calculated from others during the export (e.g., 
+# last_period from time_sample), and session tables are filled in from the 
+# arguments (e.g., study_timepoint holds the timepoints in time_sample, and 
+# existing_plants is replaced by a copy with aggregated plants), so a file 
+# also depends on the arguments these come from (see derived_args,
+# session_table_args and argument_dependencies()). Some arguments also change
+# the format of a file, or which file is written (see file_format_args).
+
+# arguments set during the export, and the arguments they are calculated from
+derived_args = {
+    'last_period': ['time_sample'],
+    # replaced by the representative days (see choose_representative_days())
+    'time_sample': ['representative_days', 'representative_year', 'peak_days'],
+}
+
+# session tables, and the arguments their contents depend on
+session_table_args = {
+    # queries that use study_timepoint are indexed by timepoint, and 
+    # hours_per_timepoint only appears in them when it is more than 1 (see 
+    # timepoint_average())
+    'study_timepoint': ['time_sample', 'hours_per_timepoint'],
+    # aggregated_tables, replaced by temporary copies (see set_plant_aggregation())
+    'existing_plants': ['aggregate_plants', 'aggregate_plant_max_mw', 'aggregate_plant_tolerance'],
+    'existing_plants_cap_factor': ['aggregate_plants', 'aggregate_plant_max_mw', 'aggregate_plant_tolerance'],
+}
+
+# files whose format depends on the arguments, besides the queries' results
+file_format_args = {
+    'variable_capacity_factors.tab': ['dedup_cap_factors'],
+    'cap_factor_profiles.tab': ['dedup_cap_factors'],
+    'proj_commit_bounds_timeseries.tab': ['sparse_commit_bounds'],
+    'proj_commit_bounds_defaults.tab': ['sparse_commit_bounds'],
+}
+
+def argument_dependencies(names, tables=[]):
+    """Return a set of the names of all the arguments that a file depends on, 
+    if it is written from the arguments listed in names and the tables listed 
+    in tables."""
+    names = set(names)
+    for t in tables:
+        names.update(session_table_args.get(t, []))
+    # follow derived arguments back to the arguments they are calculated from
+    pending = list(names)
+    while pending:
+        for a in derived_args.get(pending.pop(), []):
+            if a not in names:
+                names.add(a)
+                pending.append(a)
+    return names
 
 def any_alt_args_in_list(args, l):
-    """Report whether any arguments in the args list appear in the list l."""
+    """Report whether the list l, or any argument derived from it, uses any 
+    of the alternative scenario's arguments."""
+    dependencies = argument_dependencies(l)
     for a in args.get('alt_args', {}):
-        if a in l:
+        if a in dependencies:
             return True
     return False
     
 def any_alt_args_in_query(args, query):
-    """Report whether any arguments in the args list appear in the list l."""
+    """Report whether the results of the query depend on any of the alternative
+    scenario's arguments, directly or through derived arguments or session tables."""
+    dependencies = argument_dependencies(query_arg_names(query), query_tables(query))
     for a in args.get('alt_args', {}):
-        if '%(' + a + ')s' in query:
+        if a in dependencies:
             return True
     return False    
 
+def shared_with_base(call_args):
+    """Report whether the file to be written by a write_* function (called with 
+    the arguments in the call_args dictionary) is the same as the base scenario's."""
+    arguments = call_args['arguments']
+    if 'alt_args' not in arguments or not arguments.get('inputs_subdir', ''):
+        return False
+    elif any_alt_args_in_list(arguments, file_format_args.get(call_args['output_file'], [])):
+        return False
+    elif 'query' in call_args:
+        return not any_alt_args_in_query(arguments, call_args['query'])
+    elif 'args_to_write' in call_args:
+        return not any_alt_args_in_list(arguments, call_args['args_to_write'])
+    elif call_args.get('arg_names', None) is not None:
+        return not any_alt_args_in_list(arguments, call_args['arg_names'])
+    else:
+        return False
+
+def call_writer(writer, output_file, a, kw):
+    """Call writer(output_file, *a, **kw) to create output_file, or link to the 
+    base scenario's copy if the file doesn't differ from the base scenario."""
+    call_args = inspect.getcallargs(writer, output_file, *a, **kw)
+    if not shared_with_base(call_args):
+        return writer(output_file, *a, **kw)
+
+    arguments = call_args['arguments']
+    base_args = dict(arguments, inputs_subdir='')
+    # the file may have been written with compression (see write_table())
+    file_names = compression.file_names(output_file)
+    if not any(os.path.exists(make_file_path(f, base_args)) for f in file_names):
+        call_args['arguments'] = base_args
+        writer(**call_args)
+    # link to whichever versions of the file exist, and the .npz sidecar (if any)
+    # note: write_dat_file() doesn't create a file if none of its arguments are set
+    if output_file.endswith('.tab'):
+        file_names.append(sidecar_file(output_file))
+    if 'map_file' in call_args:
+        # second file written by write_profile_tables()
+        file_names.append(call_args['map_file'])
+    for f in file_names:
+        base_file = make_file_path(f, base_args)
+        if os.path.exists(base_file):
+            start = time.time()
+            link_to_base_file(make_file_path(f, arguments), base_file)
+            if not f.endswith('.npz'):
+                record_file(
+                    make_file_path(f, arguments), arguments, 'base scenario', start, None, [], 
+                    same_as=base_file
+                )
+
+def link_to_base_file(output_file, base_file):
+    """Make output_file refer to base_file."""
+    if os.path.lexists(output_file):
+        os.remove(output_file)
+    rel_path = os.path.relpath(base_file, os.path.dirname(output_file))
+    if hasattr(os, 'symlink'):
+        os.symlink(rel_path, output_file)
+    elif output_file.endswith('.dat'):
+        with open(output_file, 'w') as f:
+            f.write('include "{f}";\n'.format(f=rel_path.replace(os.sep, '/')))
+    else:
+        shutil.copyfile(base_file, output_file)
+
 def make_file_path(file, args):
     """Create any directories and subdirectories needed to store data in the specified file,
     based on inputs_dir and inputs_subdir arguments. Return a pathname to the file."""
@@ -681,84 +1007,2220 @@ def make_file_path(file, args):
     # and build a path to the specified file.
     path = os.path.join(args.get('inputs_dir', ''), args.get('inputs_subdir', ''))
     if path != '' and not os.path.exists(path):
-        os.makedirs(path)
+        try:
+            os.makedirs(path)
+        except OSError:
+            # another export worker may have created it in the meantime
+            if not os.path.isdir(path):
+                raise
     path = os.path.join(path, file)
     return path
 
+def remove_input_file(file, args):
+    """Remove any existing copies of an input file that is no longer needed
+    (including compressed versions and .npz sidecars)."""
+    if batch_jobs is not None:
+        # only recording the jobs for a batch export; files are removed when
+        # each scenario is exported
+        return
+    for f in compression.file_names(file) + [sidecar_file(file)]:
+        path = make_file_path(f, args)
+        if os.path.lexists(path):
+            os.remove(path)
+
+def sidecar_file(file):
+    """Return the name of the .npz sidecar for file (the same as 
+    npz_tables.sidecar_file(), which can't be used without numpy)."""
+    return os.path.splitext(compression.uncompressed_name(file))[0] + '.npz'
+
 con = None
+# session state of con: time samples loaded into study_timepoint and the 
+# existing plant aggregation in use
+con_state = dict(time_samples=set(), plant_aggregation=None)
+db_snapshot = None      # name of a SQLite snapshot file to use instead of the postgres server
 def db_cursor():
     global con
-    if con is None:
-        try:
-            pghost='redr.eng.hawaii.edu'
+    if getattr(thread_state, 'is_worker', False):
+        # parallel export worker; each worker gets its own connection
+        if thread_state.con is None:
+            thread_state.con = db_connect()
+            thread_state.con_state = dict(time_samples=set(), plant_aggregation=None)
+        c, state = thread_state.con, thread_state.con_state
+    else:
+        if con is None:
             # note: the connection gets created when the module loads and never gets closed (until presumably python exits)
-            con = psycopg2.connect(database='switch', host=pghost) #, user='switch_user')
-    
-        except psycopg2.OperationalError:
-            print dedent("""
-                ############################################################################################
-                Error while connecting to switch database on postgres server {server}.
-                Please ensure that the PGUSER environment variable is set with your postgres username
-                and there is a line like "*:*:*:<user>:<password>" in ~/.pgpass (which should be chmod 0600) 
-                or in %APPDATA%\postgresql\pgpass.conf (Windows).    
-                See http://www.postgresql.org/docs/9.1/static/libpq-pgpass.html for more details.
-                ############################################################################################
-                """.format(server=pghost))
-            raise
-    return con.cursor()
+            con = db_connect()
+            con_state.update(time_samples=set(), plant_aggregation=None)
+        c, state = con, con_state
+    if session_time_sample is not None and session_time_sample not in state['time_samples']:
+        prepare_session(c, session_time_sample)
+        state['time_samples'].add(session_time_sample)
+    if state['plant_aggregation'] != session_plant_aggregation:
+        set_plant_aggregation(c, session_plant_aggregation)
+        state['plant_aggregation'] = session_plant_aggregation
+    return c.cursor()
+
+def db_connect():
+    """Open a new connection to the switch database (or the snapshot, if used)."""
+    if db_snapshot is not None:
+        return sqlite_snapshot.connect(db_snapshot)
+    try:
+        pghost='redr.eng.hawaii.edu'
+        return psycopg2.connect(database='switch', host=pghost) #, user='switch_user')
+
+    except psycopg2.OperationalError:
+        print dedent("""
+            ############################################################################################
+            Error while connecting to switch database on postgres server {server}.
+            Please ensure that the PGUSER environment variable is set with your postgres username
+            and there is a line like "*:*:*:<user>:<password>" in ~/.pgpass (which should be chmod 0600) 
+            or in %APPDATA%\postgresql\pgpass.conf (Windows).    
+            See http://www.postgresql.org/docs/9.1/static/libpq-pgpass.html for more details.
+            ############################################################################################
+            """.format(server=pghost))
+        raise
+
+def set_db_backend(args):
+    """Choose the database to export from: the SQLite snapshot named in the 
+    db_snapshot argument, or the postgres server if that isn't set."""
+    global con, db_snapshot
+    snapshot = args.get('db_snapshot', None)
+    if snapshot != db_snapshot:
+        if con is not None:
+            con.close()
+            con = None
+        db_snapshot = snapshot
+
+#########################
+# session setup
+
+# NOTE: many of the queries need the timepoints in the current time_sample, 
+# joined to their periods, and the last period in the study. To avoid 
+# recalculating these in each query, start_session() looks up the last period
+# once per export and stores it in the last_period argument, and each database 
+# connection gets a temporary study_timepoint table holding the study_hour/
+# study_date join for the time samples exported on it (see prepare_session()).
+# Queries that use study_timepoint should still filter on time_sample, since 
+# one connection may be used for several time samples. 
+
+session_time_sample = None  # time_sample for the current export
+
+# temporary tables created by prepare_session(), and the tables they are based on
+session_tables = {'study_timepoint': ['study_date', 'study_hour']}
+
+def start_session(args):
+    """Look up the scalar study settings for the current export and make sure
+    study_timepoint includes the current time_sample."""
+    global session_time_sample
+    session_time_sample = args['time_sample']
+    set_study_settings(args)
+    cur = db_cursor()
+    if args['hours_per_timepoint'] > 1:
+        cur.execute("""
+            SELECT study_date FROM study_timepoint WHERE time_sample = %(time_sample)s
+                GROUP BY study_date HAVING COUNT(*) %% %(hours_per_timepoint)s <> 0;
+        """, args)
+        uneven = [r[0] for r in cur.fetchall()]
+        if uneven:
+            raise ValueError(
+                'The number of hours in timeseries {l} is not a multiple of hours_per_timepoint ({h}).'
+                .format(l=', '.join(str(d) for d in uneven), h=args['hours_per_timepoint'])
+            )
+    cur.close()
+
+def set_study_settings(args):
+    """Add the scalar study settings (hours_per_timepoint and last_period) to args."""
+    args.setdefault('hours_per_timepoint', 1)
+    cur = db_cursor()
+    cur.execute(
+        "SELECT MAX(period) FROM study_periods WHERE time_sample = %(time_sample)s;", 
+        args
+    )
+    args['last_period'] = cur.fetchone()[0]
+    cur.close()
+
+def timepoint_average(query, index_column, timepoint_column, value_columns, args):
+    """Return a version of query (which returns values for an index column, 
+    then hourly timepoints, then value_columns) which averages the values over 
+    each timepoint of hours_per_timepoint hours, identified by its first hour. 
+    If hours_per_timepoint is 1, query is returned unchanged."""
+    if args.get('hours_per_timepoint', 1) == 1:
+        return query
+    return """
+        SELECT hourly.{i}, b.study_hour AS {tp}, {values}
+        FROM ({query}) AS hourly
+            JOIN study_timepoint t ON t.study_hour = hourly.{tp}
+            JOIN study_timepoint b ON b.time_sample = t.time_sample 
+                AND b.study_date = t.study_date
+                AND b.hour_index = t.hour_index - t.hour_index %% %(hours_per_timepoint)s
+        WHERE t.time_sample = %(time_sample)s
+        GROUP BY 1, 2
+        ORDER BY 1, 2;
+    """.format(
+        i=index_column, tp=timepoint_column, 
+        values=', '.join('AVG(hourly.{c}) AS {c}'.format(c=c) for c in value_columns),
+        query=dedent(query).strip().rstrip(';')
+    )
 
-def write_dat_file(output_file, args_to_write, arguments):
-    """ write a simple .dat file with the arguments specified in args_to_write, 
-    drawn from the arguments dictionary"""
-    
-    if any(arg in arguments for arg in args_to_write):
-        output_file = make_file_path(output_file, arguments)
-        print "Writing {file} ...".format(file=output_file),
+def prepare_session(connection, time_sample):
+    """Add the timepoints for time_sample to the study_timepoint table on this 
+    connection (creating the table if needed). hour_index numbers the hours in
+    each timeseries, starting from 0."""
+    cur = connection.cursor()
+    if time_sample in representative_samples:
+        add_representative_days(cur, time_sample)
+    cur.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS study_timepoint AS
+            SELECT h.time_sample, h.study_date, h.study_hour, h.date_time, d.period, 
+                0 AS hour_index
+            FROM study_hour h JOIN study_date d USING (time_sample, study_date)
+            WHERE 1 = 0;
+        INSERT INTO study_timepoint
+            SELECT h.time_sample, h.study_date, h.study_hour, h.date_time, d.period,
+                ROW_NUMBER() OVER (PARTITION BY h.study_date ORDER BY h.date_time) - 1
+            FROM study_hour h JOIN study_date d USING (time_sample, study_date)
+            WHERE h.time_sample = %(time_sample)s;
+        CREATE INDEX IF NOT EXISTS study_timepoint_date_time ON study_timepoint (date_time);
+        ANALYZE study_timepoint;
+    """, dict(time_sample=time_sample))
+    cur.close()
+
+#########################
+# representative days
+
+# NOTE: if the representative_days argument is set to a number of days, 
+# start_export() chooses that many representative days from a full year of 
+# hourly data (representative_year, by default the first year used in 
+# time_sample) and exports them in place of the days in time_sample. Each day
+# is described by the total hourly load in load_zones and the average hourly 
+# capacity factor of each renewable technology, all scaled to a 0-1 range. The 
+# peak_days days with the highest hourly load (default 1) are always kept, each 
+# representing only itself; the other days are grouped into clusters with 
+# k-medoids, and each cluster is represented by its medoid (the actual day 
+# closest to the rest of the cluster). The days are added to the periods in 
+# time_sample, with ts_scale_to_period set so each day represents its share of 
+# the days in the period. They are stored under a new time_sample name in 
+# temporary copies of study_periods, study_date and study_hour, which take the 
+# place of those tables for the rest of the session, so all the queries below 
+# work as usual (see add_representative_days()). The days chosen, their 
+# weights and the error from using them instead of the full year are reported 
+# and saved in representative_days.json.
+
+# study table rows for each set of representative days, by time_sample name
+representative_samples = {}
+
+def choose_representative_days(args):
+    """Choose representative days for this export, set them up as a new 
+    time_sample, and switch args['time_sample'] to it."""
+    # numpy is only needed for representative days, so it is imported here
+    import numpy as np
+    base_sample = args['time_sample']
+    n_days = int(args['representative_days'])
+    n_peak = int(args.get('peak_days', 1))
+    cur = db_cursor()
+    year = representative_year(args)
+    query_args = dict(args, representative_year=year)
+
+    # hourly values of each feature, by day
+    features = collections.OrderedDict()
+    cur.execute("""
+        SELECT 'load', date_time, SUM(system_load)
+            FROM system_load
+            WHERE load_zone IN %(load_zones)s 
+                AND extract(year from date_time) = %(representative_year)s
+            GROUP BY 2
+        UNION ALL
+        SELECT technology, date_time, AVG(cap_factor)
+            FROM cap_factor
+            WHERE load_zone IN %(load_zones)s 
+                AND technology NOT IN %(exclude_technologies)s
+                AND extract(year from date_time) = %(representative_year)s
+            GROUP BY 1, 2
+        ORDER BY 1, 2;
+    """, query_args)
+    date_times = collections.defaultdict(dict)
+    for (feature, date_time, value) in cur:
+        day, hour = str(date_time)[:10], int(str(date_time)[11:13])
+        features.setdefault(feature, collections.defaultdict(dict))[day][hour] = value
+        date_times[day][hour] = date_time
+    # only use days with all 24 hours of data for every feature
+    days = sorted(
+        d for d in date_times 
+        if all(len(f.get(d, {})) == 24 for f in features.values())
+    )
+    if not days:
+        raise ValueError(
+            'No complete days of load and capacity factor data found for {y}.'.format(y=year)
+        )
+    raw = collections.OrderedDict(
+        (f, np.array([[float(vals[d][h]) for h in range(24)] for d in days]))
+        for f, vals in features.items()
+    )
+
+    peaks = [int(i) for i in np.argsort(-raw['load'].max(axis=1), kind='mergesort')[:n_peak]]
+    others = [i for i in range(len(days)) if i not in peaks]
+    n_clusters = min(n_days - len(peaks), len(others))
+    if n_clusters < 1 and others:
+        raise ValueError('representative_days must be greater than peak_days.')
+    # day represented by each day, and number of days represented by each representative
+    rep_day = np.arange(len(days))
+    if others:
+        x = day_features(raw)[others]
+        medoids, cluster = k_medoids(x, n_clusters)
+        rep_day[others] = np.array(others)[np.array(medoids)[cluster]]
+    chosen = sorted(set(rep_day.tolist()))
+    weights = [int((rep_day == i).sum()) for i in chosen]
+
+    error = representative_day_error(raw, rep_day)
+    sample = add_representative_sample(
+        args, base_sample, [date_times[days[i]] for i in chosen], weights
+    )
+
+    print "Representative days: chose {n} of {t} days in {y} for time_sample {s}.".format(
+        n=len(chosen), t=len(days), y=year, s=sample
+    )
+    for f, e in error.items():
+        print "    {f}: rmse (scaled) {r:.4f}, mean error {m:+.2%}".format(
+            f=f, r=e['rmse_scaled'], m=e['mean_error']
+        )
+    with open(make_file_path('representative_days.json', args), 'w') as f:
+        json.dump(collections.OrderedDict([
+            ('time_sample', sample),
+            ('base_time_sample', base_sample),
+            ('representative_year', year),
+            ('candidate_days', len(days)),
+            ('days', [
+                collections.OrderedDict([
+                    ('date', days[i]), ('days_represented', w), ('peak_day', i in peaks)
+                ])
+                for i, w in zip(chosen, weights)
+            ]),
+            ('error', error),
+        ]), f, indent=2)
+    args['base_time_sample'] = base_sample
+    args['time_sample'] = sample
+
+def representative_year(args):
+    """Return the year of hourly data to choose representative days from."""
+    if 'representative_year' in args:
+        return int(args['representative_year'])
+    cur = db_cursor()
+    cur.execute("""
+        SELECT MIN(extract(year from date_time)) FROM study_hour 
+        WHERE time_sample = %(time_sample)s;
+    """, args)
+    year = int(cur.fetchone()[0])
+    cur.close()
+    return year
+
+def day_features(raw):
+    """Return an array with one row of scaled hourly values for each day. Each 
+    feature is scaled to a 0-1 range over the year, and the capacity factors are
+    weighted so that, together, they count as much as the load."""
+    import numpy as np
+    n_other = max(len(raw) - 1, 1)
+    blocks = []
+    for f, vals in raw.items():
+        spread = vals.max() - vals.min()
+        scaled = (vals - vals.min()) / spread if spread > 0 else np.zeros_like(vals)
+        blocks.append(scaled if f == 'load' else scaled / np.sqrt(n_other))
+    return np.hstack(blocks)
+
+def k_medoids(x, k, max_iterations=100):
+    """Group the rows of x into k clusters. Returns the index of the medoid of
+    each cluster and the cluster number for each row."""
+    import numpy as np
+    dist = np.sqrt(((x[:, np.newaxis, :] - x[np.newaxis, :, :]) ** 2).sum(axis=2))
+    # start with the most central row, then repeatedly add the row that 
+    # most reduces the total distance from rows to their nearest medoid
+    medoids = [int(dist.sum(axis=1).argmin())]
+    while len(medoids) < k:
+        nearest = dist[:, medoids].min(axis=1)
+        gains = np.maximum(nearest[:, np.newaxis] - dist, 0).sum(axis=0)
+        gains[medoids] = -1
+        medoids.append(int(gains.argmax()))
+    # then alternate between assigning rows to the nearest medoid and moving 
+    # each medoid to the row closest to the rest of its cluster
+    for i in range(max_iterations):
+        cluster = dist[:, medoids].argmin(axis=1)
+        new_medoids = []
+        for c in range(k):
+            members = np.flatnonzero(cluster == c)
+            if len(members) == 0:
+                # identical to another medoid, which gets all the rows
+                new_medoids.append(medoids[c])
+                continue
+            new_medoids.append(int(members[dist[np.ix_(members, members)].sum(axis=1).argmin()]))
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+    return medoids, dist[:, medoids].argmin(axis=1)
+
+def representative_day_error(raw, rep_day):
+    """Compare the full year of data to the year rebuilt from the representative
+    days (each day replaced by its representative). Returns the root-mean-square
+    error in the scaled (0-1) values and the relative error in the annual mean
+    for each feature."""
+    import numpy as np
+    error = collections.OrderedDict()
+    for f, vals in raw.items():
+        spread = vals.max() - vals.min()
+        diff = vals[rep_day] - vals
+        error[f] = collections.OrderedDict([
+            ('rmse_scaled', float(np.sqrt((diff ** 2).mean()) / spread) if spread > 0 else 0.0),
+            ('mean_error', float(diff.mean() / vals.mean()) if vals.mean() != 0 else 0.0),
+        ])
+    return error
+
+def add_representative_sample(args, base_sample, day_hours, weights):
+    """Define a new time_sample with the specified days (a dictionary of 
+    date_times by hour for each day) and weights (days represented by each day),
+    for each period in base_sample. Returns the name of the new time_sample."""
+    cur = db_cursor()
+    cur.execute("""
+        SELECT period, SUM(ts_scale_to_period * ts_num_tps * ts_duration_of_tp) / 24
+            FROM study_date WHERE time_sample = %(time_sample)s
+            GROUP BY 1 ORDER BY 1;
+    """, dict(time_sample=base_sample))
+    period_days = cur.fetchall()
+    cur.close()
+    total_weight = float(sum(weights))
+    dates, hours = [], []
+    for (period, n_days) in period_days:
+        for i, (day, w) in enumerate(zip(day_hours, weights)):
+            study_date = int(period) * 1000 + i + 1
+            dates.append(dict(
+                study_date=study_date, period=period, 
+                ts_duration_of_tp=1, ts_num_tps=24,
+                ts_scale_to_period=float(n_days) * w / total_weight,
+                date=str(day[0])[:10],
+            ))
+            hours.extend(
+                dict(study_date=study_date, study_hour=study_date * 100 + h, date_time=day[h])
+                for h in range(24)
+            )
+    # name the sample after its contents, so cached results for other 
+    # selections won't be reused by mistake
+    sample = '{b}_rep{n}_{h}'.format(
+        b=base_sample, n=len(weights), h=hashlib.sha1(repr(dates)).hexdigest()[:8]
+    )
+    for r in dates + hours:
+        r['time_sample'] = sample
+    representative_samples[sample] = [
+        ('study_periods', [dict(time_sample=sample, period=p) for (p, n) in period_days]),
+        ('study_date', dates),
+        ('study_hour', hours),
+    ]
+    return sample
+
+def add_representative_days(cur, time_sample):
+    """Add the rows for a set of representative days to temporary copies of 
+    study_periods, study_date and study_hour on this connection. The copies
+    hold all the rows from the permanent tables as well, so other time samples
+    can still be exported on this connection."""
+    for table, rows in representative_samples[time_sample]:
+        cur.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS {t} AS SELECT * FROM {t};
+            DELETE FROM {t} WHERE time_sample = %(time_sample)s;
+            SELECT * FROM {t} WHERE 1 = 0;
+        """.format(t=table), dict(time_sample=time_sample))
+        # fill in whichever columns the table has (e.g., date may be in study_date or study_hour)
+        columns = [d[0] for d in cur.description]
+        for r in rows:
+            cols = [c for c in columns if c in r]
+            cur.execute("INSERT INTO {t} ({c}) VALUES ({v});".format(
+                t=table, c=', '.join(cols), v=', '.join('%({c})s'.format(c=c) for c in cols)
+            ), r)
+
+#########################
+# existing plant aggregation
+
+# NOTE: if the aggregate_plants argument is set, small existing plants 
+# (aggregate_plant_max_mw or less, default 20 MW) in the same load zone, with
+# the same technology, fuel and must-run status, are merged into aggregate 
+# projects if their heat rates and variable and fixed O&M are all within
+# aggregate_plant_tolerance (default 0.05, i.e., 5%) of each other. Each 
+# aggregate is exported as a single project named 
+# <load_zone>_<technology>_agg<n>. This is done with temporary copies of 
+# existing_plants and existing_plants_cap_factor, which replace those tables on
+# each connection for the rest of the export (see set_plant_aggregation()). In
+# the copy of existing_plants, each unit is renamed to its aggregate, so the 
+# queries below add up its capacity and take capacity-weighted averages of its 
+# heat rate, O&M and costs, as they do for projects with several units (and 
+# technology-level settings like g_unit_size are unchanged). In the copy of 
+# existing_plants_cap_factor, the units' capacity factors are replaced by their
+# capacity-weighted average. existing_plant_aggregates.tab lists the units in 
+# each aggregate and their share of its capacity, so results can be split back
+# out.
+
+# units in each aggregate project and the load zones used, for each aggregation, by name
+plant_aggregations = {}
+session_plant_aggregation = None    # name of the aggregation for the current export
+
+# tables replaced by temporary copies while an aggregation is in use
+aggregated_tables = ['existing_plants', 'existing_plants_cap_factor']
+
+def start_plant_aggregation(args):
+    """Choose the aggregate projects for this export, if requested."""
+    global session_plant_aggregation
+    session_plant_aggregation = None
+    if not args.get('aggregate_plants', False):
+        return
+    max_mw = float(args.get('aggregate_plant_max_mw', 20))
+    tolerance = float(args.get('aggregate_plant_tolerance', 0.05))
+    cur = db_cursor()
+    cur.execute("""
+        SELECT project_id, load_zone, technology, aer_fuel_code, must_run,
+            SUM(peak_mw) AS peak_mw,
+            SUM(heat_rate * avg_mw) / NULLIF(SUM(avg_mw), 0) AS heat_rate,
+            SUM(variable_o_m * avg_mw) / NULLIF(SUM(avg_mw), 0) AS variable_o_m,
+            SUM(fixed_o_m * peak_mw) / NULLIF(SUM(peak_mw), 0) AS fixed_o_m
+        FROM existing_plants
+        WHERE load_zone IN %(load_zones)s
+            AND insvyear <= %(last_period)s
+            AND technology NOT IN %(exclude_technologies)s
+        GROUP BY 1, 2, 3, 4, 5
+        ORDER BY 2, 3, 4, 5, 7, 1;
+    """, args)
+    rows = cur.fetchall()
+    cur.close()
+
+    # group candidate units by load zone, technology, fuel and must-run status
+    # (skipping any with inconsistent data)
+    n_rows = collections.Counter(r[0] for r in rows)
+    groups = collections.OrderedDict()
+    for r in rows:
+        if n_rows[r[0]] == 1 and r[5] is not None and r[5] <= max_mw:
+            groups.setdefault(tuple(r[1:5]), []).append(r)
+    # within each group, add each unit (in order of heat rate) to the first 
+    # cluster whose first unit is similar enough
+    units = []
+    n_aggregates = collections.Counter()
+    for (load_zone, technology, fuel, must_run), group in groups.items():
+        clusters = []
+        for u in group:
+            for c in clusters:
+                if all(similar(u[i], c[0][i], tolerance) for i in (6, 7, 8)):
+                    c.append(u)
+                    break
+            else:
+                clusters.append([u])
+        for c in clusters:
+            if len(c) > 1:
+                n_aggregates[load_zone, technology] += 1
+                aggregate = '{z}_{t}_agg{n}'.format(
+                    z=load_zone, t=technology, n=n_aggregates[load_zone, technology]
+                )
+                total_mw = float(sum(u[5] for u in c))
+                units.extend((aggregate, u[0], u[5], u[5] / total_mw) for u in c)
+
+    n = sum(n_aggregates.values())
+    print "Aggregating {u} existing plants into {n} projects.".format(u=len(units), n=n)
+    if units:
+        name = hashlib.sha1(repr((units, args['load_zones']))).hexdigest()
+        plant_aggregations[name] = dict(units=units, load_zones=args['load_zones'])
+        session_plant_aggregation = name
+
+def similar(a, b, tolerance):
+    """Report whether a and b are equal to within the specified relative tolerance."""
+    if a is None or b is None:
+        return a is None and b is None
+    return abs(a - b) <= tolerance * max(abs(a), abs(b))
+
+def plant_aggregate_units():
+    """Return a list of (aggregate project, unit, peak_mw, capacity share) 
+    tuples for the current export."""
+    if session_plant_aggregation is None:
+        return []
+    return plant_aggregations[session_plant_aggregation]['units']
+
+def set_plant_aggregation(connection, name):
+    """Replace existing_plants and existing_plants_cap_factor on this connection
+    with temporary copies that use the aggregate projects in the named 
+    aggregation, or go back to the standard tables if name is None."""
+    cur = connection.cursor()
+    # note: pg_temp ensures that only the temporary copies are dropped
+    cur.execute("""
+        DROP TABLE IF EXISTS pg_temp.existing_plants;
+        DROP TABLE IF EXISTS pg_temp.existing_plants_cap_factor;
+        DROP TABLE IF EXISTS pg_temp.existing_plant_units;
+    """)
+    if name is not None:
+        aggregation = plant_aggregations[name]
+        cur.execute("""
+            CREATE TEMPORARY TABLE existing_plant_units AS
+                SELECT project_id, project_id AS aggregate_id, peak_mw 
+                FROM existing_plants WHERE 1 = 0;
+        """)
+        for (aggregate, unit, peak_mw, share) in aggregation['units']:
+            cur.execute(
+                "INSERT INTO existing_plant_units VALUES (%(unit)s, %(aggregate)s, %(peak_mw)s);",
+                dict(unit=unit, aggregate=aggregate, peak_mw=peak_mw)
+            )
+        # calculate the aggregate capacity factors from the standard table, then 
+        # create the copies (which hide the standard tables) and add the aggregates
+        cur.execute("""
+            CREATE TEMPORARY TABLE existing_plant_aggregate_cap_factor AS
+                SELECT u.aggregate_id AS project_id, c.load_zone, c.date_time,
+                    SUM(c.cap_factor * u.peak_mw) / SUM(u.peak_mw) AS cap_factor
+                FROM existing_plants_cap_factor c JOIN existing_plant_units u USING (project_id)
+                GROUP BY 1, 2, 3;
+            CREATE TEMPORARY TABLE existing_plants_cap_factor AS
+                SELECT * FROM existing_plants_cap_factor
+                WHERE load_zone IN %(load_zones)s
+                    AND project_id NOT IN (SELECT project_id FROM existing_plant_units);
+            INSERT INTO existing_plants_cap_factor (project_id, load_zone, date_time, cap_factor)
+                SELECT project_id, load_zone, date_time, cap_factor 
+                FROM existing_plant_aggregate_cap_factor;
+            DROP TABLE pg_temp.existing_plant_aggregate_cap_factor;
+            CREATE INDEX existing_plants_cap_factor_date_time 
+                ON existing_plants_cap_factor (date_time);
+            CREATE TEMPORARY TABLE existing_plants AS SELECT * FROM existing_plants;
+            UPDATE existing_plants SET project_id = (
+                    SELECT aggregate_id FROM existing_plant_units u 
+                    WHERE u.project_id = existing_plants.project_id
+                )
+                WHERE project_id IN (SELECT project_id FROM existing_plant_units);
+            ANALYZE existing_plants;
+            ANALYZE existing_plants_cap_factor;
+        """, dict(load_zones=aggregation['load_zones']))
+    cur.close()
+
+#########################
+# database snapshots
+
+# NOTE: write_snapshot() copies the rows needed for a particular time_sample 
+# and set of load_zones from the postgres server into a SQLite file. If the 
+# db_snapshot argument of write_tables() is set to the name of that file, the 
+# export queries run against the snapshot instead of the server (see
+# sqlite_snapshot.py). The arguments used to create the snapshot are stored 
+# in its snapshot_args table, and write_tables() checks that they cover the 
+# scenario being exported. Hourly data are normally only copied for the 
+# timepoints in time_sample, but if representative_days is set, the snapshot 
+# also gets the full year of hourly data that the days are chosen from (see 
+# choose_representative_days()), and that year is recorded as one of its 
+# hourly_years.
+
+# tables to copy into snapshots, and the rows to copy from each (None = all rows)
+snapshot_tables = [
+    ('study_periods', "time_sample = %(time_sample)s"),
+    ('study_date', "time_sample = %(time_sample)s"),
+    ('study_hour', "time_sample = %(time_sample)s"),
+    ('load_zone', "load_zone IN %(load_zones)s"),
+    ('system_load', "load_zone IN %(load_zones)s AND {date_times}"),
+    ('system_load_scale', "load_zone IN %(load_zones)s"),
+    ('generator_costs', None),
+    ('connect_cost', "load_zone IN %(load_zones)s"),
+    ('max_capacity', "load_zone IN %(load_zones)s"),
+    ('cap_factor', "load_zone IN %(load_zones)s AND {date_times}"),
+    ('existing_plants', "load_zone IN %(load_zones)s"),
+    ('existing_plants_gen_tech', None),
+    ('existing_plants_cap_factor', "load_zone IN %(load_zones)s AND {date_times}"),
+    ('energy_source_properties', None),
+    ('fuel_costs', "load_zone IN %(load_zones)s"),
+    ('ev_adoption', "load_zone IN %(load_zones)s"),
+]
+
+# rows of the hourly tables to copy into snapshots ({date_times} above)
+sample_date_times = "date_time IN (SELECT date_time FROM study_hour WHERE time_sample = %(time_sample)s)"
+full_year_date_times = "(" + sample_date_times + " OR extract(year from date_time) IN %(hourly_years)s)"
+
+# columns to index in snapshot tables (if present), to speed up the joins
+snapshot_index_columns = [
+    'time_sample', 'study_date', 'date_time', 'load_zone', 'technology', 'project_id'
+]
+
+def write_snapshot(snapshot_file, **args):
+    """Copy the data needed to export inputs for the time_sample and load_zones
+    in args from the postgres server into a SQLite file. If snapshot_file 
+    already exists, it is replaced."""
+    set_db_backend({})      # read from the postgres server
+    if os.path.exists(snapshot_file):
+        os.remove(snapshot_file)
+    snapshot = sqlite_snapshot.connect(snapshot_file).con
+    start = time.time()
+    if args.get('representative_days', None):
+        hourly_years = [representative_year(args)]
+        date_times = full_year_date_times
+    else:
+        hourly_years = []
+        date_times = sample_date_times
+    args = dict(args, hourly_years=tuple(hourly_years))
+    for (table, condition) in snapshot_tables:
+        print "Copying {t} to snapshot ...".format(t=table),
         sys.stdout.flush()  # display the part line to the user
-        start=time.time()
+        table_start = time.time()
+        query = 'SELECT * FROM ' + table + (
+            '' if condition is None else ' WHERE ' + condition.format(date_times=date_times)
+        )
+        cur = db_cursor()
+        cur.execute(query + ' LIMIT 0', args)
+        snapshot.execute('CREATE TABLE {t} ({c})'.format(
+            t=table, 
+            c=', '.join(
+                '"{n}" {t}'.format(n=d[0], t=sqlite_snapshot.snapshot_column_type(d[1])) 
+                for d in cur.description
+            )
+        ))
+        columns, rows = query_rows(query, dict(args, fetch_batch_size=10000))
+        snapshot.executemany(
+            'INSERT INTO {t} VALUES ({p})'.format(t=table, p=', '.join('?' for c in columns)),
+            (tuple(sqlite_snapshot.snapshot_value(v) for v in r) for r in rows)
+        )
+        for c in snapshot_index_columns:
+            if c in columns:
+                snapshot.execute('CREATE INDEX {t}_{c} ON {t} ("{c}")'.format(t=table, c=c))
+        print "time taken: {dur:.2f}s".format(dur=time.time()-table_start)
+    snapshot.execute('CREATE TABLE snapshot_args (name TEXT, value TEXT)')
+    snapshot.executemany(
+        'INSERT INTO snapshot_args VALUES (?, ?)', 
+        [
+            ('time_sample', json.dumps(args['time_sample'])), 
+            ('load_zones', json.dumps(list(args['load_zones']))),
+            ('hourly_years', json.dumps(hourly_years)),
+        ]
+    )
+    snapshot.commit()
+    snapshot.close()
+    print "Total time taken: {dur:.2f}s".format(dur=time.time()-start)
+
+def check_snapshot(args):
+    """Raise an error if the snapshot named in args doesn't hold the data needed
+    for the time_sample and load_zones in args, or the full year of hourly data
+    needed to choose representative days, if requested."""
+    cur = db_cursor()
+    cur.execute('SELECT name, value FROM snapshot_args')
+    snapshot_args = {k: json.loads(v) for (k, v) in cur.fetchall()}
+    if (
+        snapshot_args['time_sample'] != args['time_sample'] 
+        or not set(args['load_zones']).issubset(snapshot_args['load_zones'])
+    ):
+        raise ValueError(
+            "Database snapshot {f} was created for time_sample {t} and load_zones {z}; "
+            "it can't be used to export data for time_sample {t2} and load_zones {z2}."
+            "".format(
+                f=args['db_snapshot'], 
+                t=snapshot_args['time_sample'], z=', '.join(snapshot_args['load_zones']),
+                t2=args['time_sample'], z2=', '.join(args['load_zones'])
+            )
+        )
+    if args.get('representative_days', None):
+        year = representative_year(args)
+        if year not in snapshot_args.get('hourly_years', []):
+            raise ValueError(
+                "Database snapshot {f} doesn't hold the full year of hourly data for {y} "
+                "needed to choose representative days; create it with "
+                "representative_days set to use it for this export.".format(
+                    f=args['db_snapshot'], y=year
+                )
+            )
+
+#########################
+# parallel export
+
+# NOTE: write_tables() can export several files at the same time, each on its own
+# database connection. This is switched on by setting the export_workers argument
+# to the number of connections to use (default is 1, i.e., write each file in turn).
+# The write_* functions are wrapped with @export_job, so while the export is being
+# set up they only add their job to pending_jobs. Then run_pending_jobs() hands 
+# the jobs to a bounded pool of worker threads. Each job writes its own file in 
+# the same way as a serial export, so the files are identical either way.
+
+# tables with one row per project or load zone per timepoint; these take longest
+# to export, so parallel exports start them first (in this order).
+large_tables = [
+    'variable_capacity_factors.tab', 
+    'cap_factor_profiles.tab',
+    'proj_commit_bounds_timeseries.tab', 
+    'loads.tab', 
+    'timepoints.tab'
+]
+
+pending_jobs = None         # list of queued jobs, or None if jobs should run immediately
+thread_state = threading.local()    # holds the connection used by each worker thread
+print_lock = threading.Lock()
+
+def start_export(args):
+    """Connect to the database and set up the session for this export, and prepare
+    to queue export jobs if more than one export worker was requested."""
+    global pending_jobs, session_time_sample, session_plant_aggregation
+    # finish writing the files from any previous in-memory export first
+    wait_for_archive()
+    memory_inputs.clear()
+    # don't set up the previous export's time sample (e.g., its representative
+    # days) or plant aggregation on connections used before start_session()
+    session_time_sample = None
+    session_plant_aggregation = None
+    set_db_backend(args)
+    if db_snapshot is not None:
+        check_snapshot(args)
+    if batch_jobs is not None:
+        # just collecting jobs for write_batch_tables(), which only needs the 
+        # queries and their arguments; the representative days, study 
+        # timepoints and plant aggregation are set up when the scenario is 
+        # exported
+        set_study_settings(args)
+        return
+    if args.get('representative_days', None):
+        choose_representative_days(args)
+    start_session(args)
+    start_plant_aggregation(args)
+    if args.get('export_workers', 1) > 1:
+        pending_jobs = []
+    else:
+        pending_jobs = None
+    cache_stats.clear()
+    manifest.clear()
+    file_checksums.clear()
+    saved_manifests.clear()
+    query_plans.clear()
+    module_file_status.clear()
+    kept_inputs.clear()
+    start_source_tracking(args)
+
+def finish_export(args):
+    """Run any queued export jobs, save the export state and manifest, and report
+    on the query cache (if used). For in-memory exports, the files are written 
+    and the rest of this is done in the background, and the tables kept in 
+    memory are returned."""
+    if batch_jobs is not None:
+        return
+    run_pending_jobs(args)
+    if keeping_inputs(args):
+        return start_archive(args)
+    finish_files(args)
+
+def finish_files(args):
+    """Save the export state and manifest, check the input files and report on 
+    the query cache (if used), once all the files are written."""
+    finish_source_tracking(args)
+    write_manifest(args)
+    write_module_inputs(args)
+    if args.get('explain_queries', False):
+        write_query_plans(args)
+    if args.get('check_inputs', True) and writing_text_files(args):
+        input_checks.check_inputs(
+            os.path.join(args.get('inputs_dir', ''), args.get('inputs_subdir', ''))
+        )
+    if 'query_cache_dir' in args:
+        print "Query cache: {h} hits, {m} misses.".format(h=cache_stats['hits'], m=cache_stats['misses'])
+    if args.get('skip_unchanged', False):
+        print "Skipped {n} unchanged files.".format(n=cache_stats['unchanged'])
+        changed = changed_arguments()
+        if changed:
+            print "Arguments changed since the last export: {l}.".format(l=', '.join(changed))
+
+def export_job(writer):
+    """Decorator for functions that write a single input file. If a parallel export
+    is being prepared, calls to the function are queued in pending_jobs
+    instead of being run immediately. If a batch export is being prepared, 
+    they are only recorded in batch_jobs."""
+    @functools.wraps(writer)
+    def run_or_queue(output_file, *a, **kw):
+        call_args = inspect.getcallargs(writer, output_file, *a, **kw)
+        arguments = call_args['arguments']
+        if batch_jobs is not None:
+            # just recording the jobs for write_batch_tables()
+            if file_needed(output_file, arguments):
+                batch_jobs.append(dict(file=output_file, writer=writer, a=a, kw=kw))
+            return
+        if not file_needed(output_file, arguments):
+            # no module in the scenario reads this file (see file_needed())
+            remove_input_file(output_file, arguments)
+            # (write_dat_file() wouldn't have written it anyway if none of 
+            # its arguments are set)
+            args_to_write = call_args.get('args_to_write', None)
+            if args_to_write is None or any(n in arguments for n in args_to_write):
+                record_module_file(output_file, False)
+            return
+        record_module_file(output_file, True)
+        if pending_jobs is None:
+            return call_writer(writer, output_file, a, kw)
+        else:
+            pending_jobs.append(dict(file=output_file, writer=writer, a=a, kw=kw))
+    return run_or_queue
+
+def run_pending_jobs(args):
+    """Run all the queued export jobs in parallel, using up to export_workers 
+    connections to the database."""
+    global pending_jobs
+    if pending_jobs is None:
+        return
+    # start the largest tables first, then the others in the order they were queued
+    jobs = sorted(
+        pending_jobs, 
+        key=lambda j: large_tables.index(j['file']) if j['file'] in large_tables else len(large_tables)
+    )
+    pending_jobs = None
 
-        with open(output_file, 'w') as f:
-            f.writelines([
-                'param ' + name + ' := ' + str(arguments[name]) + ';\n' 
-                for name in args_to_write if name in arguments
-            ])
-        
+    job_queue = Queue.Queue()
+    for j in jobs:
+        job_queue.put(j)
+    errors = []
+
+    def worker():
+        thread_state.is_worker = True
+        thread_state.con = None
+        try:
+            while not errors:
+                try:
+                    j = job_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    call_writer(j['writer'], j['file'], j['a'], j['kw'])
+                except Exception:
+                    # stop all the workers and report the error from the main thread
+                    errors.append(sys.exc_info())
+        finally:
+            if thread_state.con is not None:
+                thread_state.con.close()
+
+    print "Writing {n} files with {w} parallel connections.".format(n=len(jobs), w=args['export_workers'])
+    start = time.time()
+    threads = [threading.Thread(target=worker) for i in range(min(args['export_workers'], len(jobs)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    print "Total time taken: {dur:.2f}s".format(dur=time.time()-start)
+
+def report_start(output_file):
+    """Report that we've started writing output_file; return the start time."""
+    if not getattr(thread_state, 'is_worker', False):
+        print "Writing {file} ...".format(file=output_file),
+        sys.stdout.flush()  # display the part line to the user
+    return time.time()
+
+def report_done(output_file, start):
+    """Report the time taken to write output_file."""
+    if getattr(thread_state, 'is_worker', False):
+        # report the whole line at once, so parallel workers don't interleave their messages
+        with print_lock:
+            print "Wrote {file}; time taken: {dur:.2f}s".format(file=output_file, dur=time.time()-start)
+    else:
         print "time taken: {dur:.2f}s".format(dur=time.time()-start)
 
-def write_table(output_file, query, arguments):
-    output_file = make_file_path(output_file, arguments)
+#########################
+# sharded export
+
+# NOTE: if the export_shards argument is set to a number greater than 1, 
+# write_table() splits the queries for the tables in sharded_tables into that 
+# many shards, runs them at the same time on separate database connections and
+# merges the results into the output file. The shard_by argument chooses how 
+# the rows are split: 'load_zone' (groups of load zones), 'technology' (groups 
+# of technologies) or 'hash' (buckets of a hash of the first column, e.g., the 
+# project; this is the default). Queries that don't use the load_zones or 
+# exclude_technologies arguments are split by hash instead. Each shard is
+# sorted on all of its columns, with text in byte order (see 
+# byte_order_expr()), and the shards are streamed into a single merged 
+# sequence in that order. These tables are sorted the same way when they are
+# not sharded (including when they are written with COPY or from a combined
+# batch query), so the file is the same whatever the number of shards and the
+# database's collation. This is separate from export_workers, so a parallel 
+# export may use up to export_workers * export_shards connections.
+
+# tables whose queries can be split into shards
+sharded_tables = ['variable_capacity_factors.tab', 'loads.tab']
+
+def table_shards(output_file, arguments):
+    """Return the number of shards to use for the query for output_file."""
+    if output_file in sharded_tables and not using_copy(output_file, arguments):
+        return max(arguments.get('export_shards', 1), 1)
+    else:
+        return 1
+
+def shard_groups(items, n):
+    """Split items into up to n groups of nearly equal size."""
+    return [items[i::n] for i in range(min(n, len(items)))]
+
+def shard_queries(query, arguments, n):
+    """Return a list of (query, arguments) pairs, one for each shard of the query."""
+    method = arguments.get('shard_by', 'hash')
+    if method not in ('load_zone', 'technology', 'hash'):
+        raise ValueError(
+            'shard_by must be "load_zone", "technology" or "hash", not "{m}".'.format(m=method)
+        )
+    setup, select = split_query(query)
+    if setup:
+        # setup statements may not be safe to repeat on this connection
+        return [(query, arguments)]
+    arg_names = query_arg_names(query)
+    if method == 'load_zone' and 'load_zones' in arg_names:
+        return [
+            (query, dict(arguments, load_zones=tuple(zones)))
+            for zones in shard_groups(sorted(arguments['load_zones']), n)
+        ]
+    if method == 'technology' and 'exclude_technologies' in arg_names:
+        # give each shard a group of technologies by excluding all the others
+        excluded = tuple(arguments['exclude_technologies'])
+        cur = db_cursor()
+        cur.execute("""
+            SELECT technology FROM generator_costs 
+            UNION SELECT technology FROM existing_plants 
+            ORDER BY 1;
+        """)
+        techs = [r[0] for r in cur if r[0] not in excluded]
+        cur.close()
+        return [
+            (query, dict(arguments, exclude_technologies=excluded + tuple(t for t in techs if t not in group)))
+            for group in shard_groups(techs, n)
+        ]
+    # split by a hash of the first column; this needs the column name
     cur = db_cursor()
+    cur.execute('SELECT * FROM (' + select + ') AS q LIMIT 0', arguments)
+    col = 'q."' + cur.description[0][0].replace('"', '""') + '"'
+    cur.close()
+    return [
+        (
+            'SELECT * FROM (' + select + ') AS q '
+            + 'WHERE (hashtext(CAST({c} AS text)) %% {n} + {n}) %% {n} = {i}'.format(c=col, n=n, i=i),
+            arguments
+        )
+        for i in range(n)
+    ]
+
+def sharded_query_rows(query, arguments, n):
+    """Run the query as n shards on separate connections (see shard_queries())
+    and return a list of column names and an iterator over the merged rows.
+    The shards are queried at the same time, and their rows are retrieved as
+    the merged rows are needed (one batch at a time, if fetch_batch_size is 
+    set)."""
+    shards = shard_queries(query, arguments, n)
+    if len(shards) <= 1:
+        return query_rows(query, arguments, sort=True)
+    results = [None] * len(shards)
+    errors = []
+
+    def run_shard(i):
+        thread_state.is_worker = True
+        thread_state.con = None
+        try:
+            columns, rows = query_rows(shards[i][0], shards[i][1], sort=True)
+            # the connection stays open until the merged rows have been read
+            results[i] = (columns, rows, thread_state.con)
+        except Exception:
+            # report the error from the calling thread
+            errors.append(sys.exc_info())
+            if thread_state.con is not None:
+                thread_state.con.close()
+
+    threads = [threading.Thread(target=run_shard, args=(i,)) for i in range(len(shards))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        close_shards([r for r in results if r is not None])
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results[0][0], merged_shard_rows(results)
+
+def merged_shard_rows(results):
+    """Merge the sorted rows from a list of (columns, rows, connection) 
+    tuples, then close the connections."""
+    try:
+        for r in heapq.merge(*[rows for (columns, rows, c) in results]):
+            yield r
+    finally:
+        close_shards(results)
+
+def close_shards(results):
+    """Stop reading the rows in a list of (columns, rows, connection) tuples
+    and close the connections."""
+    for (columns, rows, c) in results:
+        if hasattr(rows, 'close'):
+            # stop any prefetch thread before its connection is closed
+            rows.close()
+        if c is not None:
+            c.close()
+
+#########################
+# in-memory export
+
+# NOTE: if the in_memory argument is set, write_tables() keeps a typed copy of
+# each table it exports and returns them in a dictionary keyed by file name, 
+# and switch_patch.py loads them into the model directly if it is built in the
+# same process (see memory_inputs.py). The text files are written afterwards 
+# by a background thread, so write_tables() returns as soon as the queries are
+# done. The manifest, export state and input checks are also completed by this
+# thread. The next export waits for it to finish, and wait_for_archive() can be
+# used to wait for the files (e.g., before copying them). If the 
+# archive_inputs argument is False, the text files are not written at all (and
+# the inputs are not checked or recorded in a manifest). Files reused from the query cache or left 
+# unchanged are not kept in memory; switch_patch.py loads them from the inputs
+# directory as usual. COPY is not used for in-memory exports.
+
+kept_inputs = collections.OrderedDict()     # file name -> table kept in memory
+archive_jobs = []       # queued file writers for the current in-memory export
+archive_thread = None
+archive_errors = []
+archive_lock = threading.Lock()
+
+def keeping_inputs(arguments):
+    """Report whether this is an in-memory export."""
+    return arguments.get('in_memory', False)
+
+def writing_text_files(arguments):
+    """Report whether the text input files will be written for this export."""
+    return not keeping_inputs(arguments) or arguments.get('archive_inputs', True)
+
+def keep_input(output_file, table, arguments):
+    """Keep a copy of the data for output_file in memory, for the model and 
+    for the caller of write_tables()."""
+    memory_inputs.store(output_file, table, writing_text_files(arguments))
+    with archive_lock:
+        kept_inputs[os.path.basename(compression.uncompressed_name(output_file))] = table
+
+def archive(output_files, arguments, write_file, start):
+    """Call write_file(start) to write output_files and record them in the 
+    manifest, or queue it to run in the background if they were kept in 
+    memory (or skip it, if the text files aren't wanted)."""
+    if not (keeping_inputs(arguments) and memory_inputs.find_table(output_files[0]) is not None):
+        write_file(start)
+    elif writing_text_files(arguments):
+        # the background writer keeps the same time between start and writing
+        with archive_lock:
+            archive_jobs.append((output_files, write_file, time.time() - start))
+
+def start_archive(args):
+    """Start a thread to write the files queued by archive() and then finish 
+    the export. Return the tables kept in memory."""
+    global archive_thread
+    with archive_lock:
+        jobs = list(archive_jobs)
+        del archive_jobs[:]
+        kept = collections.OrderedDict(kept_inputs)
+
+    def run():
+        thread_state.is_worker = True
+        thread_state.con = None
+        start = time.time()
+        try:
+            for (output_files, write_file, elapsed) in jobs:
+                write_file(time.time() - elapsed)
+                for f in output_files:
+                    memory_inputs.file_written(f)
+            finish_files(args)
+            if jobs:
+                with print_lock:
+                    print "Archived {n} input files; time taken: {dur:.2f}s".format(
+                        n=len(jobs), dur=time.time()-start
+                    )
+        except Exception:
+            # reported by wait_for_archive()
+            archive_errors.append(sys.exc_info())
+        finally:
+            # don't leave the model waiting for files that won't be written
+            for (output_files, write_file, elapsed) in jobs:
+                for f in output_files:
+                    memory_inputs.file_written(f)
+            if thread_state.con is not None:
+                thread_state.con.close()
+
+    archive_thread = threading.Thread(target=run)
+    archive_thread.start()
+    return kept
+
+def wait_for_archive():
+    """Wait for the background thread (if any) to finish writing the text files 
+    from the last in-memory export, and raise any error it encountered."""
+    global archive_thread
+    if archive_thread is not None:
+        archive_thread.join()
+        archive_thread = None
+    if archive_errors:
+        error = archive_errors.pop()
+        del archive_errors[:]
+        raise error[0], error[1], error[2]
+
+#########################
+# query cache
+
+# NOTE: if the query_cache_dir argument is set, write_table() and 
+# write_indexed_set_dat_file() keep a copy of each file they create in that 
+# directory, named with a hash of the query text and the values of the 
+# arguments used by the query. If a later export (e.g., for another scenario)
+# runs the same query with the same values for those arguments, the file is 
+# copied from the cache instead of querying the database. The cache is limited 
+# to query_cache_mb megabytes (default 1000); the least recently used files are
+# removed first. Hits and misses are counted in cache_stats.
+
+cache_stats = collections.Counter()
+cache_lock = threading.Lock()
+
+def query_arg_names(query):
+    """Return a sorted list of the names of all the %(name)s arguments used in the query."""
+    return sorted(set(re.findall(r'%\((\w+)\)s', query)))
+
+def query_cache_key(query, arguments, variant):
+    """Return a key identifying the results of the query with the current 
+    arguments. variant should identify the format the results are written in.
+    If source tables are being tracked, the key also depends on the current
+    fingerprints of the tables used by the query."""
+    query = dedent(query)
+    key = (variant, query, [(a, arguments.get(a, None)) for a in query_arg_names(query)])
+    if tracking_sources(arguments):
+        prints = table_fingerprints(query_source_tables(query))
+        if None in prints.values():
+            # we can't tell whether some of the source data have changed, 
+            # so make sure this key won't match any from an earlier export
+            prints[None] = export_id
+        key += (sorted(prints.items()),)
+    if session_plant_aggregation is not None and set(aggregated_tables) & set(query_source_tables(query)):
+        # the query reads the temporary copies of the existing plant tables
+        key += (('plant_aggregation', session_plant_aggregation),)
+    return hashlib.sha1(repr(key)).hexdigest()
+
+def reuse_query_results(cache_key, output_file, query, arguments):
+    """If output_file is already up to date (when skipping unchanged files) or 
+    could be copied from another scenario in the current batch or from the 
+    query cache, return a description of where it came from ('unchanged',
+    'batch' or 'query cache'); otherwise return None."""
+    if file_unchanged(cache_key, output_file, arguments):
+        return 'unchanged'
+    elif batch_results is not None and cache_key in batch_results:
+        # already retrieved for another scenario in this batch
+        copy_output_file(batch_results[cache_key], output_file, arguments)
+        record_sources(cache_key, output_file, query, arguments)
+        with cache_lock:
+            batch_stats['reused'] += 1
+        return 'batch'
+    elif read_query_cache(cache_key, output_file, arguments):
+        record_sources(cache_key, output_file, query, arguments)
+        return 'query cache'
+    else:
+        return None
+
+def save_query_results(cache_key, output_file, query, arguments):
+    """Record a newly written query-based file in the query cache and export state
+    (and for reuse by other scenarios, during a batch export)."""
+    if batch_results is not None:
+        batch_results[cache_key] = output_file
+    write_query_cache(cache_key, output_file, arguments)
+    record_sources(cache_key, output_file, query, arguments)
+
+def read_query_cache(cache_key, output_file, arguments):
+    """Copy the cached file for cache_key to output_file, if available.
+    Return True if the file was found in the cache, otherwise False."""
+    cache_dir = arguments.get('query_cache_dir', None)
+    if cache_dir is None:
+        return False
+    cache_file = os.path.join(cache_dir, cache_key)
+    try:
+        copy_output_file(cache_file, output_file, arguments)
+    except (IOError, OSError):
+        found = False
+    else:
+        found = True
+        try:
+            # mark as recently used
+            os.utime(cache_file, None)
+        except OSError:
+            pass    # removed by another process in the meantime
+    with cache_lock:
+        cache_stats['hits' if found else 'misses'] += 1
+    return found
+
+def write_query_cache(cache_key, output_file, arguments):
+    """Save a copy of output_file in the query cache (if used), then trim the 
+    cache to its size limit."""
+    cache_dir = arguments.get('query_cache_dir', None)
+    if cache_dir is None:
+        return
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # another export worker may have created it in the meantime
+            if not os.path.isdir(cache_dir):
+                raise
+    # copy to a temporary name first, so other processes never see a partial file
+    temp_file = os.path.join(
+        cache_dir, 
+        '{k}.{p}.{t}.tmp'.format(k=cache_key, p=os.getpid(), t=threading.current_thread().ident)
+    )
+    shutil.copyfile(output_file, temp_file)
+    os.rename(temp_file, os.path.join(cache_dir, cache_key))
+    with cache_lock:
+        trim_query_cache(cache_dir, arguments.get('query_cache_mb', 1000) * 1024 * 1024)
+
+def trim_query_cache(cache_dir, max_bytes):
+    """Remove the least recently used files from the cache until it is smaller than max_bytes."""
+    files = []
+    for f in os.listdir(cache_dir):
+        if not f.endswith('.tmp'):
+            path = os.path.join(cache_dir, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue    # removed by another process in the meantime
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for (mtime, size, path) in files)
+    for (mtime, size, path) in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+#########################
+# source table tracking
+
+# NOTE: if the skip_unchanged or query_cache_dir argument is set, we keep 
+# track of which tables each query reads from (see query_source_tables()) and
+# take a fingerprint of each of those tables: the number of rows and the sum 
+# of a hash of each row (see table_fingerprints()). This means reading each 
+# source table once per export, but the fingerprints come from the data 
+# themselves, so they change as soon as an edit is committed, even in a 
+# long-running process (each query on the connection sees the latest committed
+# data). The fingerprints become part of the query cache key, so cached files 
+# are not reused after the source data change. The key for each file written is 
+# also recorded in export_state.json in the inputs directory, along with the 
+# list of source tables and the arguments the file depends on, with their 
+# values. For queries, these are the %(name)s arguments in the query; files 
+# written directly from arguments (write_dat_file() and write_tab_file()) 
+# name the arguments they use, and their keys are based on the values of 
+# those arguments. If skip_unchanged is set, a later export to the same 
+# directory leaves alone any file whose query, arguments and source table 
+# fingerprints are all unchanged, and reports which arguments changed for the 
+# files that are rewritten.
+
+# output file -> {'key': cache key, 'source_tables': [table names], 'arguments': {name: value}}
+export_state = {}
+previous_state = {}     # export_state from the last export to this directory
+fingerprints = {}       # table name -> fingerprint, for the current export
+export_id = None        # random ID for the current export
+fingerprint_lock = threading.Lock()
+
+def tracking_sources(arguments):
+    return arguments.get('skip_unchanged', False) or 'query_cache_dir' in arguments
+
+def start_source_tracking(args):
+    """Load the record of previously exported files and clear the table fingerprints
+    (unless this is part of a batch export)."""
+    global export_state, previous_state, export_id
+    if batch_results is None:
+        fingerprints.clear()
+        export_id = os.urandom(16).encode('hex')
+    export_state = {}
+    if tracking_sources(args):
+        state_file = make_file_path('export_state.json', args)
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                export_state = {
+                    make_file_path(k, args): v for k, v in json.load(f).iteritems()
+                }
+    previous_state = dict(export_state)
+
+def finish_source_tracking(args):
+    """Save the record of the files exported and their source tables."""
+    if tracking_sources(args):
+        with open(make_file_path('export_state.json', args), 'w') as f:
+            json.dump(
+                {os.path.basename(k): v for k, v in export_state.iteritems()}, 
+                f, indent=4, sort_keys=True
+            )
+
+def changed_arguments():
+    """Return a sorted list of the arguments whose values changed since the 
+    last export, for the files that were rewritten."""
+    changed = set()
+    for output_file, state in export_state.iteritems():
+        previous = previous_state.get(output_file, {})
+        if previous and previous.get('key', None) != state['key']:
+            old_args = previous.get('arguments', {})
+            changed.update(
+                a for a, v in state.get('arguments', {}).iteritems() 
+                if a not in old_args or old_args[a] != v
+            )
+    return sorted(changed)
+
+def file_unchanged(key, output_file, arguments):
+    """Report whether output_file was created with the specified key in the last 
+    export to this directory (and still exists), so it doesn't need to be 
+    rewritten (only if skip_unchanged is set)."""
+    if (key is not None 
+        and arguments.get('skip_unchanged', False) 
+        and os.path.exists(output_file)
+        and previous_state.get(output_file, {}).get('key', None) == key):
+        with cache_lock:
+            cache_stats['unchanged'] += 1
+        return True
+    else:
+        return False
+
+def argument_values(arg_names, arguments):
+    """Return a dictionary of the values of the specified arguments, in the form
+    they are stored in export_state.json."""
+    return json.loads(json.dumps(
+        {a: arguments.get(a, None) for a in arg_names}, default=repr
+    ))
+
+def argument_key(output_file, headers, arg_names, arguments):
+    """Return a key identifying the contents of a file written directly from 
+    the specified arguments (and headers, if given)."""
+    return hashlib.sha1(repr((
+        output_file, headers, [(a, arguments.get(a, None)) for a in sorted(arg_names)]
+    ))).hexdigest()
+
+def record_sources(cache_key, output_file, query, arguments):
+    """Record the key, source tables and arguments used to create output_file."""
+    # note: export workers may call this at the same time, but each one only 
+    # changes the entry for its own file.
+    if tracking_sources(arguments):
+        export_state[output_file] = dict(
+            key=cache_key, 
+            source_tables=query_source_tables(query), 
+            arguments=argument_values(query_arg_names(query), arguments)
+        )
 
-    print "Writing {file} ...".format(file=output_file),
-    sys.stdout.flush()  # display the part line to the user
+def record_arguments(key, output_file, arg_names, arguments):
+    """Record the key and arguments used to create output_file, which was 
+    written directly from the arguments."""
+    if tracking_sources(arguments):
+        export_state[output_file] = dict(
+            key=key, source_tables=[], arguments=argument_values(arg_names, arguments)
+        )
 
-    start=time.time()
-    cur.execute(dedent(query), arguments)
+def query_source_tables(query):
+    """Return a sorted list of the tables (or views) that the query reads from,
+    omitting any common table expressions or temporary tables it defines, and
+    replacing session tables with the tables they are based on."""
+    tables = query_tables(query)
+    # use the source tables for any session tables 
+    for t in tables & set(session_tables):
+        tables.remove(t)
+        tables.update(session_tables[t])
+    return sorted(tables)
+
+def query_tables(query):
+    """Return a set of the tables (or views) that the query reads from, 
+    including session tables, but omitting any common table expressions or 
+    temporary tables it defines."""
+    # ignore comments and "extract(year from date_time)", which isn't a table reference
+    query = re.sub(r'--[^\n]*', '', dedent(query))
+    query = re.sub(r'(?i)extract\s*\([^)]*\)', '', query)
+    # find names after FROM or JOIN, including lists like "FROM a, b x, c"
+    tables = set()
+    for m in re.finditer(
+        r'(?i)\b(?:FROM|JOIN)\s+(\w+(?:\s+(?:AS\s+)?\w+)?(?:\s*,\s*\w+(?:\s+(?:AS\s+)?\w+)?)*)', 
+        query
+    ):
+        tables.update(t.split()[0].lower() for t in m.group(1).split(','))
+    # drop common table expressions and temporary tables defined in the query
+    tables -= set(n.lower() for n in re.findall(r'(?i)\b(\w+)\s+AS\s*\(', query))
+    tables -= set(n.lower() for n in re.findall(r'(?i)\bTEMPORARY\s+TABLE\s+(\w+)', query))
+    return tables
+
+def table_fingerprints(tables):
+    """Return a dictionary with a fingerprint for each of the specified tables.
+    Fingerprints are calculated from the data the first time each table is 
+    used in an export, then reused for the rest of the export."""
+    with fingerprint_lock:
+        missing = [t for t in tables if t not in fingerprints]
+        if missing:
+            cur = db_cursor()
+            if db_snapshot is None:
+                cur.execute("""
+                    SELECT relname FROM pg_class 
+                    WHERE relname IN %(tables)s AND relkind IN ('r', 'v', 'm') 
+                        AND pg_table_is_visible(oid);
+                """, dict(tables=tuple(missing)))
+            else:
+                cur.execute("""
+                    SELECT name FROM sqlite_master 
+                        WHERE type IN ('table', 'view') AND name IN %(tables)s
+                    UNION SELECT name FROM sqlite_temp_master 
+                        WHERE type IN ('table', 'view') AND name IN %(tables)s;
+                """, dict(tables=tuple(missing)))
+            found = set(r[0] for r in cur.fetchall())
+            for t in missing:
+                if t in found:
+                    cur.execute(fingerprint_query(cur, t))
+                    fingerprints[t] = ':'.join(str(v) for v in cur.fetchone())
+                else:
+                    # unknown table
+                    fingerprints[t] = None
+            cur.close()
+        return {t: fingerprints[t] for t in tables}
+
+def fingerprint_query(cur, table):
+    """Return a query giving the number of rows in the table and the sum of 
+    a hash of each row."""
+    if db_snapshot is None:
+        row_text = 'CAST(t AS text)'
+    else:
+        # SQLite can't convert whole rows to text, so we join up the columns
+        cur.execute('SELECT * FROM {t} LIMIT 0;'.format(t=table))
+        row_text = " || ',' || ".join(
+            'quote(t."{c}")'.format(c=d[0].replace('"', '""')) for d in cur.description
+        )
+    return 'SELECT count(*), sum(hashtext({r})) FROM {t} AS t;'.format(r=row_text, t=table)
+
+#########################
+# export manifest
+
+# NOTE: each export writes a manifest (export_manifest.json) in the inputs
+# directory, with the arguments used for the export and an entry for each 
+# file written. Each entry shows where the data came from (e.g., 'query', 
+# 'copy', 'query cache', 'unchanged' or 'base scenario'), the time taken to 
+# run the query and to write the file (in seconds; COPY does both at once, so 
+# its query_time is null), the number of rows (for 
+# .tab files), the size of the file in bytes, the SHA-1 checksum of its 
+# (uncompressed) contents and the arguments that the file depends on. The 
+# checksums make it possible to check whether two sets of inputs are identical 
+# without comparing the files. Set the write_manifest argument to False to 
+# skip this.
+# The checksum and number of lines are calculated as each file is written
+# (see ChecksumFile), so the files don't have to be read back. Files that are
+# unchanged or linked to the base scenario reuse the entry from the manifest 
+# that described them when they were written, if they are still the same 
+# size. Only files copied in compressed form from the query cache, or with no
+# earlier entry, are read back to calculate these.
+
+manifest = {}           # full path of file -> manifest entry, for the current export
+manifest_lock = threading.Lock()
+file_checksums = {}     # full path of file -> (sha1, lines), calculated while writing it
+saved_manifests = {}    # directory -> file entries from its export_manifest.json, if read
+
+class ChecksumFile(object):
+    """Wrapper for a file opened for writing, which calculates the SHA-1 
+    checksum and number of lines of the data written to it, and stores them 
+    in file_checksums when the file is closed."""
+    def __init__(self, f, file_name):
+        self.f = f
+        self.file_name = file_name
+        self.checksum = hashlib.sha1()
+        self.lines = 0
+    def write(self, data):
+        self.checksum.update(data)
+        self.lines += data.count('\n')
+        self.f.write(data)
+    def writelines(self, lines):
+        for l in lines:
+            self.write(l)
+    def close(self):
+        self.f.close()
+        with manifest_lock:
+            file_checksums[self.file_name] = (self.checksum.hexdigest(), self.lines)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+
+def open_output_file(output_file, arguments):
+    """Open output_file for writing (compressed, if its name says so), and 
+    calculate its checksum as it is written, if it will be in the manifest."""
+    f = compression.open_file(output_file, 'w')
+    if arguments.get('write_manifest', True):
+        f = ChecksumFile(f, output_file)
+    return f
+
+def copy_output_file(source_file, output_file, arguments):
+    """Copy source_file to output_file, calculating its checksum on the way 
+    (if it will be in the manifest and isn't compressed)."""
+    if compression.uncompressed_name(output_file) == output_file:
+        with open(source_file, 'rb') as src, open_output_file(output_file, arguments) as dst:
+            shutil.copyfileobj(src, dst, 1048576)
+    else:
+        shutil.copyfile(source_file, output_file)
+
+def record_file(output_file, arguments, source, start, query_time, arg_names, same_as=None):
+    """Add an entry to the manifest for output_file, which was written (or reused)
+    starting at time start, after spending query_time retrieving data. same_as 
+    can name the file that output_file was linked to."""
+    if not arguments.get('write_manifest', True):
+        return
+    total_time = time.time() - start
+    size = os.path.getsize(output_file)
+    with manifest_lock:
+        written = file_checksums.pop(output_file, None)
+    earlier = None if written is not None else earlier_manifest_entry(same_as or output_file, size)
+    if written is not None:
+        sha1, rows = written[0], written[1] - 1
+    elif earlier is not None:
+        sha1, rows = earlier['sha1'], earlier['rows']
+    else:
+        # copied in from elsewhere; read it back
+        checksum = hashlib.sha1()
+        lines = 0
+        with compression.open_file(output_file) as f:
+            for block in iter(lambda: f.read(1048576), ''):
+                checksum.update(block)
+                lines += block.count('\n')
+        sha1, rows = checksum.hexdigest(), lines - 1
+    entry = dict(
+        source=source,
+        query_time=query_time,
+        write_time=total_time - (query_time or 0.0),
+        total_time=total_time,
+        rows=rows if '.tab' in output_file else None,
+        bytes=size,
+        sha1=sha1,
+        arguments={a: arguments.get(a, None) for a in arg_names},
+    )
+    with manifest_lock:
+        manifest[output_file] = entry
+
+def earlier_manifest_entry(output_file, size):
+    """Return the manifest entry for output_file from earlier in this export or
+    from the export_manifest.json file in its directory, or None if there isn't
+    one or the file has changed size since then."""
+    inputs_dir, name = os.path.split(output_file)
+    with manifest_lock:
+        entry = manifest.get(output_file, None)
+        if entry is None:
+            if inputs_dir not in saved_manifests:
+                try:
+                    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+                        saved_manifests[inputs_dir] = json.load(f)['files']
+                except (IOError, ValueError, KeyError):
+                    saved_manifests[inputs_dir] = {}
+            entry = saved_manifests[inputs_dir].get(name, None)
+    if entry is None or entry.get('bytes', None) != size or 'sha1' not in entry:
+        return None
+    return entry
+
+def write_manifest(args):
+    """Save the manifest entries for files in this export's inputs directory.
+    No manifest is written for in-memory exports without text files."""
+    if not args.get('write_manifest', True) or not writing_text_files(args):
+        return
+    manifest_file = make_file_path('export_manifest.json', args)
+    inputs_dir = os.path.dirname(manifest_file)
+    with open(manifest_file, 'w') as f:
+        json.dump(
+            dict(
+                arguments=args,
+                files={
+                    os.path.basename(k): dict(
+                        v, **({} if k not in query_plans else dict(
+                            explain_runtime=query_plans[k]['runtime'], 
+                            slow_query=query_plans[k]['slow']
+                        ))
+                    )
+                    for k, v in manifest.iteritems() if os.path.dirname(k) == inputs_dir
+                },
+            ), 
+            f, indent=4, sort_keys=True, default=repr
+        )
 
-    with open(output_file, 'w') as f:
-        # write header row
-        writerow(f, [d[0] for d in cur.description])
-        # write the query results (cur is used as an iterator here to get all the rows one by one)
-        writerows(f, cur)
+#########################
+# query plans
 
-    print "time taken: {dur:.2f}s".format(dur=time.time()-start)
+# NOTE: if the explain_queries argument is set, each query that retrieves data
+# from the database is also run with EXPLAIN (ANALYZE, BUFFERS), using the 
+# same arguments, after its file has been written. The plans are saved in 
+# query_plans.txt next to the export manifest, slowest first, with the query 
+# text (arguments included) so it can be pasted into psql for tuning. Queries 
+# that take longer than slow_query_seconds (default 10) are flagged in that 
+# file, in the manifest and on the screen. SQLite snapshots don't support 
+# EXPLAIN ANALYZE, so for those the plan comes from EXPLAIN QUERY PLAN and the
+# query is timed separately.
 
-def write_tab_file(output_file, headers, data, arguments={}):
-    "Write a tab file using the headers and data supplied."
-    output_file = make_file_path(output_file, arguments)
+query_plans = {}        # full path of file -> dict(query, plan, runtime), for the current export
 
-    print "Writing {file} ...".format(file=output_file),
-    sys.stdout.flush()  # display the part line to the user
+def explain_query(output_file, query, arguments):
+    """Run the query for output_file with EXPLAIN ANALYZE and save its plan and runtime."""
+    cur = db_cursor()
+    setup, select = split_query(query)
+    if setup:
+        cur.execute(setup, arguments)
+    if db_snapshot is None:
+        query_text = cur.mogrify(dedent(query), arguments)
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + select, arguments)
+        plan = [r[0] for r in cur]
+        runtime = re.search(r'(?:Execution time|Total runtime): ([\d.]+) ms', '\n'.join(plan))
+        runtime = float(runtime.group(1)) / 1000.0 if runtime else None
+    else:
+        query_text = ';\n'.join(sqlite_snapshot.translate_query(dedent(query), arguments)) + ';'
+        cur.execute('EXPLAIN QUERY PLAN ' + select, arguments)
+        plan = [' '.join(str(c) for c in r) for r in cur]
+        start = time.time()
+        cur.execute(select, arguments)
+        for r in cur:
+            pass
+        runtime = time.time() - start
+    cur.close()
+    slow = runtime is not None and runtime > arguments.get('slow_query_seconds', 10)
+    if slow:
+        with print_lock:
+            print "SLOW QUERY: {f} took {t:.2f}s (see query_plans.txt)".format(
+                f=os.path.basename(output_file), t=runtime
+            )
+    with manifest_lock:
+        query_plans[output_file] = dict(query=query_text, plan=plan, runtime=runtime, slow=slow)
+
+def write_query_plans(args):
+    """Save the query plans for files in this export's inputs directory, slowest first."""
+    inputs_dir = os.path.dirname(make_file_path('query_plans.txt', args))
+    plans = sorted(
+        [(k, v) for k, v in query_plans.iteritems() if os.path.dirname(k) == inputs_dir],
+        key=lambda (k, v): -(v['runtime'] or 0)
+    )
+    if not plans:
+        return
+    with open(make_file_path('query_plans.txt', args), 'w') as f:
+        for k, v in plans:
+            f.write('#' * 80 + '\n')
+            f.write('# {f}: {t}{s}\n'.format(
+                f=os.path.basename(k), 
+                t='unknown runtime' if v['runtime'] is None else '{:.3f}s'.format(v['runtime']),
+                s=' (SLOW)' if v['slow'] else ''
+            ))
+            f.write('#' * 80 + '\n\n')
+            f.write(dedent(v['query']).strip() + '\n\n')
+            f.write('\n'.join(v['plan']) + '\n\n')
+
+#########################
+# batch export
+
+# NOTE: write_batch_tables() exports inputs for several scenarios (e.g., a sweep 
+# over load_scen_id or fuel_scen_id) in one pass. It first runs write_tables() 
+# for each scenario in a mode that just records the export jobs (batch_jobs),
+# without writing or removing any files. 
+# Then, for each query whose arguments differ between scenarios in only one 
+# value, which is compared to a single column (e.g., "load_scen_id = 
+# %(load_scen_id)s"), it runs the query once for all the values, with the 
+# comparison changed to an IN list and the column added to the results, and 
+# splits the rows into a separate file for each value (see batch_select()). 
+# Finally it exports each scenario normally. During this step, query results 
+# that were already retrieved for an earlier scenario, or by the combined 
+# queries, are copied from that file instead of querying the database again
+# (see batch_results and reuse_query_results()).
+
+batch_jobs = None       # list of jobs recorded for a batch export, or None
+batch_results = None    # cache key -> file holding those query results, during a batch export
+batch_stats = collections.Counter()
+
+def write_batch_tables(scenarios):
+    """Export inputs for each of the scenarios in the list, each of which should be a 
+    dictionary of arguments for write_tables() with its own inputs_dir or inputs_subdir."""
+    global batch_jobs, batch_results
+    batch_stats.clear()
+    # record all the jobs needed for all the scenarios
+    batch_jobs = []
+    try:
+        for args in scenarios:
+            write_tables(**args)
+        jobs = batch_jobs
+    finally:
+        batch_jobs = None
+
+    # start a new export, so the whole batch uses one set of table fingerprints 
+    # (all the scenarios are assumed to use the same database or snapshot)
+    set_db_backend(scenarios[0])
+    start_source_tracking({})
+    temp_dir = tempfile.mkdtemp()
+    batch_results = {}
+    try:
+        run_combined_queries(jobs, temp_dir)
+        for args in scenarios:
+            write_tables(**args)
+    finally:
+        batch_results = None
+        shutil.rmtree(temp_dir)
+    print (
+        "Batch export: {n} scenarios; {c} combined queries; "
+        "{r} files reused from other scenarios or combined queries."
+    ).format(n=len(scenarios), c=batch_stats['combined'], r=batch_stats['reused'])
+
+def run_combined_queries(jobs, temp_dir):
+    """Find write_table() jobs that differ in only one argument between scenarios and
+    can be run as a single query (see batch_select()), then run them and store the 
+    results for each scenario in temp_dir, registered in batch_results."""
+    global session_time_sample
+    # group the jobs by file and query
+    groups = collections.OrderedDict()
+    for j in jobs:
+        if j['writer'].__name__ == 'write_table':
+            call_args = inspect.getcallargs(j['writer'], j['file'], *j['a'], **j['kw'])
+            query = dedent(call_args['query'])
+            groups.setdefault((j['file'], query), []).append(call_args['arguments'])
+
+    for (output_file, query), arg_list in groups.iteritems():
+        # find the arguments used by this query that vary between scenarios
+        names = query_arg_names(query)
+        varying = [n for n in names if len(set(repr(a.get(n, None)) for a in arg_list)) > 1]
+        if len(varying) != 1 or any(
+            table_variant(output_file, a) != ('tab', False, '') for a in arg_list
+        ):
+            # only plain, uncompressed files can be split from a combined query
+            continue
+        if any(a.get('representative_days', None) for a in arg_list):
+            # the representative days (and their time_sample) are only chosen
+            # when the scenario is exported
+            continue
+        if any(a.get('aggregate_plants', False) for a in arg_list) and (
+            set(aggregated_tables) & set(query_source_tables(query))
+        ):
+            # existing plant tables may differ between scenarios (see set_plant_aggregation())
+            continue
+        arg = varying[0]
+        values = []
+        for a in arg_list:
+            if a[arg] not in values:
+                values.append(a[arg])
+        if any(isinstance(v, (tuple, list)) for v in values):
+            continue
+        setup, select = split_query(query)
+        if '%(' + arg + ')s' in setup:
+            continue
+        select = batch_select(select, arg)
+        if select is None:
+            continue
+
+        print "Writing {file} for {n} values of {a} ...".format(file=output_file, n=len(values), a=arg),
+        sys.stdout.flush()  # display the part line to the user
+        start = time.time()
+        # make sure study_timepoint holds all the time samples used by the query
+        for a in arg_list:
+            session_time_sample = a['time_sample']
+            db_cursor().close()
+        # open a file for each value, then send each row to the right one
+        files = {}
+        file_names = {}
+        for i, v in enumerate(values):
+            file_names[str(v)] = os.path.join(temp_dir, '{i}_{f}'.format(i=i, f=output_file))
+            files[str(v)] = open(file_names[str(v)], 'w')
+        try:
+            # (sharded tables are sorted by batch value and then the same way
+            # as in write_table())
+            columns, rows = query_rows(
+                setup + '\n' + select, dict(arg_list[0], batch_values=tuple(values)), 
+                sort=output_file in sharded_tables
+            )
+            for f in files.itervalues():
+                writerow(f, columns[1:])
+            for r in rows:
+                writerow(files[str(r[0])], r[1:])
+        finally:
+            for f in files.itervalues():
+                f.close()
+        for a in arg_list:
+            batch_results[query_cache_key(query, a, ('tab', False, ''))] = file_names[str(a[arg])]
+        batch_stats['combined'] += 1
+        print "time taken: {dur:.2f}s".format(dur=time.time()-start)
 
-    start=time.time()
+def batch_select(select, arg):
+    """Rewrite a SELECT statement that compares one column to %(arg)s, so that it 
+    retrieves rows for all the values of arg listed in %(batch_values)s, with the
+    value of that column added as the first column of each row. Returns None if 
+    the statement doesn't have this simple form."""
+    placeholder = '%(' + arg + ')s'
+    comparisons = re.findall(r'([\w."]+)\s*=\s*' + re.escape(placeholder), select)
+    if (
+        len(comparisons) != 1 or select.count(placeholder) != 1
+        # only one SELECT (no subqueries or unions), and no grouping
+        or len(re.findall(r'(?i)\bSELECT\b', select)) != 1
+        or re.search(r'(?i)\b(UNION|INTERSECT|EXCEPT|GROUP\s+BY|LIMIT)\b', select)
+    ):
+        return None
+    col = comparisons[0]
+    select = re.sub(
+        re.escape(col) + r'\s*=\s*' + re.escape(placeholder), 
+        lambda m: col + ' IN %(batch_values)s', 
+        select
+    )
+    select = re.sub(
+        r'(?i)^(\s*SELECT(\s+DISTINCT)?)\s', 
+        lambda m: m.group(1) + ' ' + col + ' AS batch_value, ', 
+        select, count=1
+    )
+    # shift any column numbers in the ORDER BY clause to allow for the new column
+    select = re.sub(
+        r'(?i)(\bORDER\s+BY\s+)([\d\s,]+)$', 
+        lambda m: m.group(1) + re.sub(r'\d+', lambda n: str(int(n.group(0)) + 1), m.group(2)),
+        select.strip()
+    )
+    return select
 
-    with open(output_file, 'w') as f:
-        writerow(f, headers)
-        writerows(f, data)
+@export_job
+def write_dat_file(output_file, args_to_write, arguments):
+    """ write a simple .dat file with the arguments specified in args_to_write, 
+    drawn from the arguments dictionary"""
+    
+    if any(arg in arguments for arg in args_to_write):
+        key = argument_key(output_file, None, args_to_write, arguments)
+        output_file = make_file_path(output_file, arguments)
+        start = report_start(output_file)
+
+        if file_unchanged(key, output_file, arguments):
+            source = 'unchanged'
+        else:
+            source = 'arguments'
+            if keeping_inputs(arguments):
+                keep_input(output_file, collections.OrderedDict(
+                    (name, memory_inputs.model_value(arguments[name]))
+                    for name in args_to_write if name in arguments
+                ), arguments)
+
+        def write_file(start):
+            if source == 'arguments':
+                with open_output_file(output_file, arguments) as f:
+                    f.writelines([
+                        'param ' + name + ' := ' + str(arguments[name]) + ';\n' 
+                        for name in args_to_write if name in arguments
+                    ])
+                record_arguments(key, output_file, args_to_write, arguments)
+            record_file(output_file, arguments, source, start, None, args_to_write)
+        archive([output_file], arguments, write_file, start)
+        report_done(output_file, start)
+
+@export_job
+def write_table(output_file, query, arguments):
+    use_copy = using_copy(output_file, arguments)
+    shards = table_shards(output_file, arguments)
+    # sharded tables are always sorted in byte order (see sharded_tables)
+    sort = output_file in sharded_tables
+    write_sidecar = arguments.get('npz_sidecars', False) and output_file in large_tables
+    cache_key = query_cache_key(query, arguments, table_variant(output_file, arguments))
+    output_file = make_file_path(table_file_name(output_file, arguments), arguments)
+
+    start = report_start(output_file)
+    query_time = None
+    source = reuse_query_results(cache_key, output_file, query, arguments)
+    if not source:
+        if use_copy:
+            source = 'copy'
+            copy_table(output_file, query, arguments, sort=sort)
+        else:
+            source = 'query'
+            if shards > 1:
+                columns, rows = sharded_query_rows(query, arguments, shards)
+            else:
+                columns, rows = query_rows(query, arguments, sort=sort)
+            if keeping_inputs(arguments) or write_sidecar:
+                # retrieve all the rows now, so they can be kept (or saved in 
+                # the sidecar) and written later
+                rows = list(rows)
+            query_time = time.time() - start
+            if keeping_inputs(arguments) or write_sidecar:
+                table = memory_inputs.tab_table(columns, rows)
+            if keeping_inputs(arguments):
+                keep_input(output_file, table, arguments)
+
+    def write_file(start):
+        if source == 'query':
+            with open_output_file(output_file, arguments) as f:
+                # write header row
+                writerow(f, columns)
+                # write the query results (rows is an iterator that gets all the rows one by one)
+                writerows(f, rows)
+        if source in ('query', 'copy'):
+            save_query_results(cache_key, output_file, query, arguments)
+        compression.remove_other_versions(output_file)
+        if write_sidecar:
+            # npz_tables needs numpy, so it is only imported if sidecars are used
+            import npz_tables
+            # files that weren't written from the query results here (e.g., 
+            # from COPY or the query cache) are read back to make the sidecar
+            npz_tables.write_npz(output_file, table if source == 'query' else None)
+        record_file(output_file, arguments, source, start, query_time, query_arg_names(query))
+    archive([output_file], arguments, write_file, start)
+
+    if arguments.get('explain_queries', False) and source in ('query', 'copy'):
+        explain_query(output_file, query, arguments)
+    report_done(output_file, start)
+
+def using_copy(output_file, arguments):
+    """Report whether write_table() will write output_file using COPY."""
+    return (
+        arguments.get('use_copy', False) and output_file in large_tables 
+        and db_snapshot is None and not keeping_inputs(arguments)
+    )
 
-    print "time taken: {dur:.2f}s".format(dur=time.time()-start)
+def table_file_name(output_file, arguments):
+    """Return the name to use for output_file, with a compression extension if 
+    the compress_tables argument is set and this is one of the large tables."""
+    method = arguments.get('compress_tables', False)
+    if method and output_file in large_tables:
+        return output_file + compression.extension(method)
+    else:
+        return output_file
+
+def table_variant(output_file, arguments):
+    """Return a tuple identifying the way write_table() will format output_file,
+    for use in query cache keys."""
+    return ('tab', using_copy(output_file, arguments), table_file_name(output_file, arguments)[len(output_file):])
+
+def query_rows(query, arguments, sort=False, group_columns=0):
+    """Execute the query and return a list of column names and an iterator
+    over the resulting rows. If the fetch_batch_size argument is set, the rows
+    are retrieved that many at a time from a server-side cursor; otherwise
+    they are all retrieved at once. If sort is True, the rows are sorted 
+    on all columns, in order, in the same order python uses to compare them
+    (see byte_order_expr()). If group_columns is set, rows with the same 
+    values in the leading columns selected by columns[:group_columns] are 
+    brought together (e.g., -1 for all but the last column), in the order each
+    group first appears in the query, and otherwise keep their order."""
+    cur = db_cursor()
+    batch_size = arguments.get('fetch_batch_size', None)
+    if batch_size is None and not sort and not group_columns:
+        cur.execute(dedent(query), arguments)
+        return [d[0] for d in cur.description], iter(cur)
+
+    setup, select = split_query(query)
+    if setup:
+        cur.execute(setup, arguments)
+    if sort:
+        # find the column names and types, then order by each column in turn
+        cur.execute('SELECT * FROM (' + select + ') AS q LIMIT 0', arguments)
+        select = 'SELECT * FROM (' + select + ') AS q ORDER BY ' + ', '.join(
+            byte_order_expr(d[0], d[1]) for d in cur.description
+        )
+    elif group_columns:
+        # number the rows in the order the query returns them, then order by 
+        # the first row number in each group and the row number (these two
+        # columns are dropped below)
+        cur.execute('SELECT * FROM (' + select + ') AS q LIMIT 0', arguments)
+        select = (
+            'SELECT * FROM ('
+            + 'SELECT g.*, MIN(g.export_row) OVER (PARTITION BY ' 
+            + ', '.join('g."' + d[0].replace('"', '""') + '"' for d in cur.description[:group_columns])
+            + ') AS export_group '
+            + 'FROM (SELECT q.*, ROW_NUMBER() OVER () AS export_row FROM (' + select + ') AS q) AS g'
+            + ') AS o ORDER BY export_group, export_row'
+        )
+    if batch_size is None:
+        cur.execute(select, arguments)
+        columns, rows = [d[0] for d in cur.description], iter(cur)
+    else:
+        # server-side cursors must be created on the same connection as any 
+        # temporary tables, and must have unique names
+        cur = cur.connection.cursor(name='export_cursor_{}'.format(next(cursor_ids)))
+        cur.itersize = batch_size
+        cur.execute(select, arguments)
+        if arguments.get('prefetch_batches', 0) > 0:
+            columns, rows = prefetched_rows(cur, batch_size, arguments['prefetch_batches'])
+        else:
+            # the column names aren't available until the first batch has been fetched
+            rows = iter(cur)
+            first_row = next(rows, None)
+            columns = [d[0] for d in cur.description]
+            if first_row is not None:
+                rows = itertools.chain([first_row], rows)
+    if group_columns and not sort:
+        columns, rows = columns[:-2], (r[:-2] for r in rows)
+    return columns, rows
+
+cursor_ids = itertools.count()
+
+def prefetched_rows(cur, batch_size, queue_size):
+    """Return a list of column names and an iterator over the rows from cur. 
+    The rows are fetched batch_size at a time by a separate thread, which stays 
+    up to queue_size batches ahead of the caller."""
+    batches = Queue.Queue(maxsize=queue_size)
+    stop = threading.Event()    # set when the caller is done with the rows
+
+    def put(item):
+        # wait for space in the queue, unless the caller stops reading rows
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def fetch():
+        try:
+            while not stop.is_set():
+                batch = cur.fetchmany(batch_size)
+                put((batch, None))
+                if not batch:
+                    break
+        except Exception:
+            put(([], sys.exc_info()))
+
+    def next_batch():
+        batch, error = batches.get()
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return batch
+
+    def rows(batch):
+        try:
+            while batch:
+                for r in batch:
+                    yield r
+                batch = next_batch()
+        finally:
+            stop.set()
+            fetcher.join()
+
+    fetcher = threading.Thread(target=fetch)
+    fetcher.daemon = True
+    fetcher.start()
+    try:
+        # the column names aren't available until the first batch has been fetched
+        first_batch = next_batch()
+    except Exception:
+        stop.set()
+        raise
+    return [d[0] for d in cur.description], rows(first_batch)
+
+def copy_table(output_file, query, arguments, sort=False):
+    """Write the results of the query to output_file using COPY ... TO STDOUT,
+    so the rows stream straight from the database to the file. If sort is 
+    True, the rows are sorted on all columns, as in query_rows()."""
+    cur = db_cursor()
+    setup, select = split_query(query)
+    if setup:
+        cur.execute(setup, arguments)
+
+    # get the column names and types without retrieving any rows
+    cur.execute('SELECT * FROM (' + select + ') AS q LIMIT 0', arguments)
+    columns = [(d[0], d[1]) for d in cur.description]
+
+    # COPY doesn't accept query parameters, so we bind them into the query here
+    select = cur.mogrify(select, arguments)
+    copy_query = (
+        'COPY (SELECT ' 
+        + ', '.join(copy_column_expr(name, type_code) for (name, type_code) in columns)
+        + ' FROM (' + select + ') AS q'
+        + (' ORDER BY ' + ', '.join(byte_order_expr(*c) for c in columns) if sort else '')
+        + ') TO STDOUT WITH NULL AS \'.\''
+    )
+    with open_output_file(output_file, arguments) as f:
+        writerow(f, [name for (name, type_code) in columns])
+        cur.copy_expert(copy_query, f)
+
+# postgres type codes for text and boolean columns
+text_types = set([18, 19, 25, 1042, 1043])    # char, name, text, bpchar, varchar
+bool_types = set([16])
+
+def copy_column_expr(name, type_code):
+    """Return an SQL expression that formats the specified column of a query the
+    same way stringify() would, for use in a COPY command."""
+    col = 'q."' + name.replace('"', '""') + '"'
+    if type_code in text_types:
+        # double any double quotes, then wrap in double quotes if needed 
+        # (same rules as stringify())
+        return (
+            r"""CASE WHEN {c} ~ E'[ \\t"'']' THEN '"' || replace({c}, '"', '""') || '"' ELSE {c} END"""
+            .format(c=col)
+        )
+    elif type_code in bool_types:
+        # match str(True) and str(False)
+        return "CASE WHEN {c} THEN 'True' WHEN NOT {c} THEN 'False' END".format(c=col)
+    else:
+        return col
+
+def byte_order_expr(name, type_code):
+    """Return an ORDER BY term for the specified column of a query, which sorts
+    it the same way python compares the values retrieved from it: text in byte
+    order and nulls first. (Postgres' default collation may sort text
+    differently; SQLite already uses byte order, and doesn't report column
+    types.)"""
+    col = 'q."' + name.replace('"', '""') + '"'
+    if type_code in text_types:
+        col += ' COLLATE "C"'
+    return col + ' NULLS FIRST'
+
+def split_query(query):
+    """Split a query into any setup statements (e.g., creating temporary tables)
+    and the final SELECT statement (without its trailing semicolon)."""
+    # note: comments are removed first, since they may contain semicolons
+    query = re.sub(r'--[^\n]*', '', dedent(query))
+    setup, sep, select = query.strip().rstrip(';').rpartition(';')
+    return setup + sep, select
+
+@export_job
+def write_tab_file(output_file, headers, data, arguments={}, arg_names=None):
+    """Write a tab file using the headers and data supplied. arg_names should 
+    list the arguments that the data were drawn from, if known; then the file 
+    is left alone if those arguments haven't changed since the last export 
+    (when skipping unchanged files)."""
+    key = None if arg_names is None else argument_key(
+        table_file_name(output_file, arguments), headers, arg_names, arguments
+    )
+    output_file = make_file_path(table_file_name(output_file, arguments), arguments)
 
+    start = report_start(output_file)
 
+    if file_unchanged(key, output_file, arguments):
+        source = 'unchanged'
+    else:
+        source = 'data'
+        if keeping_inputs(arguments):
+            data = list(data)
+            keep_input(output_file, memory_inputs.tab_table(headers, data), arguments)
+
+    def write_file(start):
+        if source == 'data':
+            with open_output_file(output_file, arguments) as f:
+                writerow(f, headers)
+                writerows(f, data)
+            if key is not None:
+                record_arguments(key, output_file, arg_names, arguments)
+        compression.remove_other_versions(output_file)
+        record_file(output_file, arguments, source, start, None, arg_names or [])
+    archive([output_file], arguments, write_file, start)
+    report_done(output_file, start)
+
+
+@export_job
+def write_profile_tables(output_file, map_file, query, arguments):
+    """Write the results of the query as a table of distinct profiles (output_file)
+    and a table showing the profile for each project (map_file). 
+
+    Note: the query should produce a table with project names in the first 
+    column, timepoints in the second and values in the third, sorted by project
+    and timepoint. Profiles are numbered in the order they are first used."""
+    output_file = make_file_path(table_file_name(output_file, arguments), arguments)
+    map_file = make_file_path(map_file, arguments)
+    start = report_start(output_file)
+
+    cache_keys = [
+        query_cache_key(query, arguments, ('profiles', table_file_name(f, arguments)))
+        for f in [os.path.basename(output_file), os.path.basename(map_file)]
+    ]
+    query_time = None
+    source = (
+        reuse_query_results(cache_keys[0], output_file, query, arguments)
+        and reuse_query_results(cache_keys[1], map_file, query, arguments)
+    )
+    if not source:
+        source = 'query'
+        columns, rows = query_rows(query, arguments)
+        query_time = time.time() - start
+        profile_ids = {}    # checksum of profile -> profile number
+        profile_rows, map_rows = [], []
+        for project, group in itertools.groupby(rows, key=lambda r: r[0]):
+            profile = [tuple(r[1:]) for r in group]
+            key = hashlib.sha1(repr(profile)).digest()
+            if key not in profile_ids:
+                profile_ids[key] = len(profile_ids) + 1
+                profile_rows.extend((profile_ids[key],) + r for r in profile)
+            map_rows.append((project, profile_ids[key]))
+        profile_headers, map_headers = ['PROFILE'] + columns[1:], [columns[0], 'PROFILE']
+        if keeping_inputs(arguments):
+            keep_input(output_file, memory_inputs.tab_table(profile_headers, profile_rows), arguments)
+            keep_input(map_file, memory_inputs.tab_table(map_headers, map_rows), arguments)
+
+    def write_file(start):
+        if source == 'query':
+            with open_output_file(output_file, arguments) as pf, open_output_file(map_file, arguments) as mf:
+                writerow(pf, profile_headers)
+                writerows(pf, profile_rows)
+                writerow(mf, map_headers)
+                writerows(mf, map_rows)
+            save_query_results(cache_keys[0], output_file, query, arguments)
+            save_query_results(cache_keys[1], map_file, query, arguments)
+        compression.remove_other_versions(output_file)
+        record_file(output_file, arguments, source, start, query_time, query_arg_names(query))
+        record_file(map_file, arguments, source, start, query_time, query_arg_names(query))
+    archive([output_file, map_file], arguments, write_file, start)
+    report_done(output_file, start)
+
+@export_job
 def write_indexed_set_dat_file(output_file, set_name, query, arguments):
     """Write a .dat file defining an indexed set, based on the query provided.
     
@@ -767,32 +3229,57 @@ def write_indexed_set_dat_file(output_file, set_name, query, arguments):
     be multiple rows with the same values in the index columns.)"""
 
     output_file = make_file_path(output_file, arguments)
-    print "Writing {file} ...".format(file=output_file),
-    sys.stdout.flush()  # display the part line to the user
-
-    start=time.time()
-
-    cur = db_cursor()
-    cur.execute(dedent(query), arguments)
-    
-    # build a dictionary grouping all values (last column) according to their index keys (earlier columns)
-    data_dict = collections.defaultdict(list)
-    for r in cur:
-        # note: data_dict[(index vals)] is created as an empty list on first reference,
-        # then gets data from all matching rows appended to it
-        data_dict[tuple(r[:-1])].append(r[-1])
-
-    # .dat file format based on p. 161 of http://ampl.com/BOOK/CHAPTERS/12-data.pdf
-    with open(output_file, 'w') as f:
-        f.writelines([
-            'set {sn}[{idx}] := {items} ;\n'.format(
-                sn=set_name, 
-                idx=', '.join(k),
-                items=' '.join(v))
-            for k, v in data_dict.iteritems()
-        ])
-
-    print "time taken: {dur:.2f}s".format(dur=time.time()-start)
+    start = report_start(output_file)
+
+    streaming = arguments.get('fetch_batch_size', None) is not None
+    cache_key = query_cache_key(query, arguments, ('set', set_name, streaming))
+    source = reuse_query_results(cache_key, output_file, query, arguments)
+    if source:
+        record_file(output_file, arguments, source, start, None, query_arg_names(query))
+        report_done(output_file, start)
+        return
+
+    if not streaming:
+        columns, rows = query_rows(query, arguments)
+        # build a dictionary grouping all values (last column) according to their index keys (earlier columns)
+        # (in the order the keys first appear, as in streaming mode)
+        data_dict = collections.OrderedDict()
+        for r in rows:
+            # note: data_dict[(index vals)] is created as an empty list on first reference,
+            # then gets data from all matching rows appended to it
+            data_dict.setdefault(tuple(r[:-1]), []).append(r[-1])
+        sets = data_dict.iteritems()
+        query_time = time.time() - start
+    else:
+        # retrieve the rows grouped by index (keeping the order of the members),
+        # then write each set as soon as all its rows have arrived
+        columns, rows = query_rows(query, arguments, group_columns=-1)
+        query_time = time.time() - start
+        sets = (
+            (k, [r[-1] for r in group]) 
+            for k, group in itertools.groupby(rows, key=lambda r: tuple(r[:-1]))
+        )
+    if keeping_inputs(arguments):
+        sets = list(sets)
+        keep_input(output_file, memory_inputs.indexed_set_table(set_name, sets), arguments)
+
+    def write_file(start):
+        # .dat file format based on p. 161 of http://ampl.com/BOOK/CHAPTERS/12-data.pdf
+        with open_output_file(output_file, arguments) as f:
+            f.writelines(
+                'set {sn}[{idx}] := {items} ;\n'.format(
+                    sn=set_name, 
+                    idx=', '.join(k),
+                    items=' '.join(v))
+                for k, v in sets
+            )
+        save_query_results(cache_key, output_file, query, arguments)
+        record_file(output_file, arguments, 'query', start, query_time, query_arg_names(query))
+    archive([output_file], arguments, write_file, start)
+
+    if arguments.get('explain_queries', False):
+        explain_query(output_file, query, arguments)
+    report_done(output_file, start)
 
 
 def stringify(val):
@@ -809,9 +3296,55 @@ def stringify(val):
 def writerow(f, row):
     f.write('\t'.join(stringify(c) for c in row) + '\n')
 
+# NOTE: writerows() produces the same output as calling writerow() for each
+# row, but works on chunks of writerows_chunk_size rows at a time. Each chunk
+# is split into columns, and each column is formatted in one step, based on 
+# the types it contains (see format_column()). Then the chunk is written to 
+# the file with a single write() call.
+
+writerows_chunk_size = 10000
+
+# characters that cause a string to be quoted by stringify()
+quote_chars = re.compile('[ \t"\']')
+
 def writerows(f, rows):
-    for r in rows:
-        writerow(f, r)
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, writerows_chunk_size))
+        if not chunk:
+            break
+        width = len(chunk[0])
+        if width == 0 or any(len(r) != width for r in chunk):
+            # unusual data; fall back to the row-by-row writer
+            for r in chunk:
+                writerow(f, r)
+        else:
+            columns = [format_column(c) for c in zip(*chunk)]
+            f.write('\n'.join('\t'.join(r) for r in zip(*columns)) + '\n')
+
+def format_column(col):
+    """Return a list with the result of stringify() for each value in col."""
+    types = set(type(v) for v in col)
+    if str not in types:
+        # numbers, etc.
+        if type(None) in types:
+            return ['.' if v is None else str(v) for v in col]
+        else:
+            return map(str, col)
+    elif types <= set([str, type(None)]) and not quote_chars.search(
+        '\n'.join(v for v in col if v is not None)
+    ):
+        # strings that don't need quoting or escaping
+        if type(None) in types:
+            return ['.' if v is None else v for v in col]
+        else:
+            return col
+    else:
+        # strings usually repeat (e.g., project names), so format each one 
+        # once; other values are formatted directly, since values that compare
+        # equal (e.g., True, 1, 1.0 and Decimal('1.00')) may be written differently
+        formatted = {v: stringify(v) for v in set(v for v in col if type(v) is str)}
+        return [formatted[v] if type(v) is str else stringify(v) for v in col]
 
 def tuple_dict(keys, vals):
     "Create a tuple of dictionaries, one for each row in vals, using the specified keys."
@@ -0,0 +1,203 @@
+"""
+Run the scenario_data export queries against a local SQLite snapshot of the
+switch database, instead of the postgres server.
+
+A snapshot is created by scenario_data.write_snapshot(), which copies the rows
+needed for one time_sample and set of load_zones into a SQLite file. Then
+setting the db_snapshot argument of scenario_data.write_tables() to the name
+of that file makes all the export queries run against the snapshot. This makes
+it possible to export inputs without network access (e.g., on compute nodes
+or for testing), and to benchmark the export without network latency.
+
+The queries in scenario_data are written for postgres, so translate_query()
+converts the postgres-specific parts they use (parameter binding, extract(),
+interval arithmetic, to_char(), UNION DISTINCT, pg_temp) into SQLite 
+equivalents, and connect() adds SQLite versions of the postgres functions they
+use (concat(), concat_ws(), power(), to_char(), hashtext()). Other postgres features are 
+not translated.
+"""
+
+import sqlite3, re, datetime, decimal, zlib
+
+# postgres type codes, used to choose column types for snapshot tables
+int_types = set([16, 20, 21, 23])       # bool, int8, int2, int4
+float_types = set([700, 701, 1700])     # float4, float8, numeric
+
+def connect(snapshot_file):
+    """Open a connection to a snapshot database, with the extra functions
+    needed by the scenario_data queries."""
+    # note: connections may be used from a prefetch thread (but only by one 
+    # thread at a time), so they aren't limited to the thread that created them
+    con = sqlite3.connect(snapshot_file, check_same_thread=False)
+    # return text as str (like psycopg2), so stringify() quotes it correctly
+    con.text_factory = str
+    con.create_function('concat', -1, concat)
+    con.create_function('concat_ws', -1, concat_ws)
+    con.create_function('power', 2, power)
+    con.create_function('to_char', 2, to_char)
+    con.create_function('add_years', 2, add_years)
+    con.create_function('hashtext', 1, hashtext)
+    return SnapshotConnection(con)
+
+class SnapshotConnection(object):
+    """Wrapper for a SQLite connection, which provides cursors that accept
+    postgres queries."""
+    def __init__(self, con):
+        self.con = con
+    def cursor(self, name=None):
+        # note: name is accepted for compatibility with psycopg2 server-side
+        # cursors; SQLite cursors always retrieve rows as they are needed.
+        return SnapshotCursor(self)
+    def commit(self):
+        self.con.commit()
+    def close(self):
+        self.con.close()
+
+class SnapshotCursor(object):
+    """Wrapper for a SQLite cursor, which translates postgres queries before
+    executing them (see translate_query())."""
+    def __init__(self, connection):
+        self.connection = connection
+        self.cur = connection.con.cursor()
+        self.itersize = None
+    def execute(self, query, arguments={}):
+        for statement in translate_query(query, arguments):
+            self.cur.execute(statement)
+    @property
+    def description(self):
+        return self.cur.description
+    def __iter__(self):
+        return iter(self.cur)
+    def fetchone(self):
+        return self.cur.fetchone()
+    def fetchall(self):
+        return self.cur.fetchall()
+    def fetchmany(self, size=None):
+        return self.cur.fetchmany(size or self.cur.arraysize)
+    def close(self):
+        self.cur.close()
+
+def translate_query(query, arguments={}):
+    """Convert a postgres query (possibly with several statements) into a list
+    of SQLite statements, with the arguments bound into them."""
+    # note: comments are removed first, since they may contain semicolons
+    query = re.sub(r'--[^\n]*', '', query)
+    statements = [s.strip() for s in query.split(';')]
+    return [translate_statement(bind_arguments(s, arguments)) for s in statements if s]
+
+def bind_arguments(query, arguments):
+    """Replace each %(name)s in the query with an SQL literal for arguments[name]
+    (the same way psycopg2 binds them), and %% with %."""
+    parts = re.split(r'(%\(\w+\)s|%%)', query)
+    return ''.join(
+        '%' if p == '%%'
+        else sql_literal(arguments[p[2:-2]]) if p.startswith('%(')
+        else p
+        for p in parts
+    )
+
+def sql_literal(val):
+    """Return an SQL literal for the value, e.g., 'Oahu' or ('Oahu', 'Maui')."""
+    if val is None:
+        return 'NULL'
+    elif isinstance(val, bool):
+        return '1' if val else '0'
+    elif isinstance(val, (int, long, float)):
+        return repr(val)
+    elif isinstance(val, decimal.Decimal):
+        return str(val)
+    elif isinstance(val, (tuple, list)):
+        return '(' + ', '.join(sql_literal(v) for v in val) + ')'
+    elif isinstance(val, (datetime.date, datetime.datetime)):
+        return sql_literal(str(val))
+    else:
+        return "'" + str(val).replace("'", "''") + "'"
+
+# strftime() codes for the fields used in extract(field from date)
+extract_fields = dict(year='%Y', month='%m', day='%d', doy='%j', dow='%w', hour='%H')
+
+def translate_statement(query):
+    """Convert the postgres-specific syntax used in scenario_data into SQLite syntax."""
+    # extract(year from date_time) -> CAST(strftime('%Y', date_time) AS INTEGER)
+    query = re.sub(
+        r'(?i)\bextract\s*\(\s*(\w+)\s+from\s+([^)]+)\)',
+        lambda m: "CAST(strftime('{f}', {d}) AS INTEGER)".format(
+            f=extract_fields[m.group(1).lower()], d=m.group(2).strip()
+        ),
+        query
+    )
+    # date_time + (n) * interval '1 year' -> add_years(date_time, n)
+    query = re.sub(
+        r"(?i)([\w.]+)\s*\+\s*\((.+?)\)\s*\*\s*interval\s+'1 year'",
+        r'add_years(\1, \2)',
+        query
+    )
+    # SQLite only accepts plain UNION (which is the same as UNION DISTINCT)
+    query = re.sub(r'(?i)\bUNION\s+DISTINCT\b', 'UNION', query)
+    # pg_temp.table -> temp.table
+    query = re.sub(r'(?i)\bpg_temp\.', 'temp.', query)
+    return query
+
+def concat(*vals):
+    return ''.join(str(v) for v in vals if v is not None)
+
+def concat_ws(sep, *vals):
+    return str(sep).join(str(v) for v in vals if v is not None)
+
+def power(x, y):
+    return None if x is None or y is None else float(x) ** y
+
+def hashtext(val):
+    """Return a 32-bit hash of a text value. This is not the same hash as 
+    postgres's hashtext(), but it is only used to split queries into shards
+    and to fingerprint tables."""
+    return None if val is None else zlib.crc32(str(val))
+
+def parse_timestamp(ts):
+    return datetime.datetime.strptime(ts[:19], '%Y-%m-%d %H:%M:%S')
+
+def add_years(ts, n):
+    """Add n years to a timestamp stored as text. Like postgres, this moves
+    February 29 to February 28 in non-leap years."""
+    if ts is None or n is None:
+        return None
+    t = parse_timestamp(ts)
+    try:
+        t = t.replace(year=t.year + int(n))
+    except ValueError:
+        t = t.replace(year=t.year + int(n), day=28)
+    return str(t)
+
+def to_char(ts, fmt):
+    """Format a timestamp stored as text, using the postgres format codes
+    YYYY, MM, DD, HH24, MI and SS."""
+    if ts is None:
+        return None
+    t = parse_timestamp(ts)
+    for (code, val) in [
+        ('YYYY', '%04d' % t.year), ('HH24', '%02d' % t.hour), ('MM', '%02d' % t.month),
+        ('DD', '%02d' % t.day), ('MI', '%02d' % t.minute), ('SS', '%02d' % t.second)
+    ]:
+        fmt = fmt.replace(code, val)
+    return fmt
+
+def snapshot_column_type(type_code):
+    """Return the SQLite type to use for a column with the specified postgres type."""
+    if type_code in int_types:
+        return 'INTEGER'
+    elif type_code in float_types:
+        return 'REAL'
+    else:
+        return 'TEXT'
+
+def snapshot_value(val):
+    """Convert a value retrieved from postgres into a form that can be stored
+    in the snapshot (dates and times are stored as ISO-format text)."""
+    if isinstance(val, decimal.Decimal):
+        return float(val)
+    elif isinstance(val, bool):
+        return int(val)
+    elif isinstance(val, (datetime.date, datetime.datetime)):
+        return str(val)
+    else:
+        return val
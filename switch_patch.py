@@ -1,3 +1,4 @@
+import os
 from pyomo.environ import *
 import switch_mod.utilities as utilities
 from util import get
@@ -27,6 +28,272 @@ if pyomo.version.version_info >= (4, 2, 0, '', 0):
         print "      The Pyomo patch in switch_patch.py is probably obsolete."
     del m
 
+# Load parameters from the .npz sidecars written by scenario_data for large .tab
+# files (see npz_tables.py), instead of parsing the .tab files. This is used for
+# simple parameter tables; all other calls go to the standard load_aug().
+# Compressed input files (e.g., loads.tab.gz; see compression.py) are also 
+# accepted in place of the uncompressed files.
+try:
+    import npz_tables
+except ImportError:
+    # numpy not available; always read the .tab files
+    npz_tables = None
+import compression, tempfile, shutil, collections
+
+# Tables kept in memory by an in-memory export in the same process (see 
+# memory_inputs.py) are loaded directly, instead of reading the input files. 
+# Loads that use options the in-memory tables don't support wait for the 
+# file to be written by the export, and then read it as usual.
+import memory_inputs
+
+# Files with one row per project, holding default values for parameters that 
+# are indexed by project and timepoint (see scenario_data.py), and the files 
+# with timepoint-specific values which they supplement. The default values are
+# applied to all timepoints that don't have a value in the timepoint-specific 
+# file (which may be omitted).
+project_default_files = {
+    'proj_commit_bounds_timeseries.tab': 'proj_commit_bounds_defaults.tab',
+}
+
+# Files that may be replaced by a table of distinct profiles (e.g., hourly 
+# capacity factors) and a table showing the profile for each project (see 
+# scenario_data.write_profile_tables()).
+profile_files = {
+    'variable_capacity_factors.tab': ('cap_factor_profiles.tab', 'project_cap_factor_profiles.tab'),
+}
+
+standard_load_aug = DataPortal.load_aug
+def load_aug(switch_data, optional=False, auto_select=False, optional_params=[], **kwds):
+    filename = kwds.get('filename', '')
+    defaults_file = project_default_files.get(os.path.basename(filename), None)
+    if defaults_file is not None:
+        defaults_file = find_input(os.path.join(os.path.dirname(filename), defaults_file))
+    profile_tables = [
+        find_input(os.path.join(os.path.dirname(filename), f))
+        for f in profile_files.get(os.path.basename(filename), ())
+    ]
+    if profile_tables and None not in profile_tables and find_input(filename) is None:
+        load_profiles(switch_data, profile_tables[0], profile_tables[1], kwds.get('param', ()))
+    elif defaults_file is not None:
+        if find_input(filename) is not None:
+            load_file(switch_data, optional, auto_select, optional_params, **kwds)
+        load_project_defaults(switch_data, defaults_file, kwds.get('param', ()))
+    else:
+        load_file(switch_data, optional, auto_select, optional_params, **kwds)
+DataPortal.load_aug = load_aug
+
+standard_load = DataPortal.load
+def load(switch_data, **kwds):
+    filename = kwds.get('filename', '')
+    table = memory_inputs.find_table(filename) if filename else None
+    if table is not None and filename.endswith('.dat') and set(kwds) == set(['filename']):
+        load_memory_dat(switch_data, table)
+    else:
+        memory_inputs.wait_for_file(filename)
+        standard_load(switch_data, **kwds)
+DataPortal.load = load
+
+def find_input(file_name):
+    """Return file_name if it was kept in memory by an in-memory export, or else
+    the name of the uncompressed or compressed version of it that exists, or 
+    None if there isn't one."""
+    if memory_inputs.find_table(file_name) is not None:
+        return file_name
+    return compression.find_file(file_name)
+
+def load_file(switch_data, optional, auto_select, optional_params, **kwds):
+    filename = kwds.get('filename', '')
+    params = kwds.get('param', ())
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    table = memory_inputs.find_table(filename) if filename else None
+    if table is not None and filename.endswith('.dat') and set(kwds) == set(['filename']):
+        load_memory_dat(switch_data, table)
+        return
+    if (
+        table is not None and filename.endswith('.tab')
+        and set(kwds) <= set(['filename', 'param', 'select', 'index', 'set'])
+        and load_memory_table(switch_data, table, params, kwds, auto_select)
+    ):
+        return
+    memory_inputs.wait_for_file(filename)
+    actual_file = compression.find_file(filename) if filename else None
+    if (
+        npz_tables is not None and params and actual_file is not None
+        and filename.endswith('.tab')
+        and set(kwds) <= set(['filename', 'param', 'select'])
+        and npz_tables.sidecar_is_current(actual_file)
+        and load_npz_params(switch_data, filename, params, kwds.get('select', None), auto_select)
+    ):
+        return
+    if actual_file is None or actual_file == filename:
+        standard_load_aug(
+            switch_data, optional=optional, auto_select=auto_select, optional_params=optional_params, **kwds
+        )
+    else:
+        # stream the compressed file into an uncompressed copy with the standard 
+        # name (pyomo chooses the file format based on the extension), then load that
+        temp_dir = tempfile.mkdtemp()
+        try:
+            temp_file = os.path.join(temp_dir, os.path.basename(filename))
+            with compression.open_file(actual_file) as src, open(temp_file, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            kwds['filename'] = temp_file
+            standard_load_aug(
+                switch_data, optional=optional, auto_select=auto_select, optional_params=optional_params, **kwds
+            )
+        finally:
+            shutil.rmtree(temp_dir)
+
+def load_project_defaults(switch_data, defaults_file, params):
+    """Assign the default value for each project from defaults_file to all 
+    the timepoints that don't already have a value for each of the params."""
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    columns, rows = input_rows(defaults_file)
+    # timepoints are defined by the timescales module, which loads first
+    timepoints = switch_data._data[None]['tp_ts'].keys()
+    data = switch_data._data.setdefault(None, {})
+    for p in params:
+        if p.name in columns:
+            col = columns.index(p.name)
+            param_data = data.setdefault(p.name, {})
+            for r in rows:
+                if r[col] is not None:
+                    for tp in timepoints:
+                        param_data.setdefault((r[0], tp), r[col])
+
+def load_profiles(switch_data, profiles_file, map_file, params):
+    """Assign values to the params for each project and timepoint, based on the 
+    profile for that project (from map_file) and the values for each timepoint
+    in that profile (from profiles_file). Projects with the same profile share 
+    the same value objects."""
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    columns, rows = input_rows(profiles_file)
+    project_profiles = input_rows(map_file)[1]
+    data = switch_data._data.setdefault(None, {})
+    for p in params:
+        # use the column with the same name as the param, or else the last one
+        col = columns.index(p.name) if p.name in columns else len(columns) - 1
+        profiles = collections.defaultdict(list)
+        for r in rows:
+            if r[col] is not None:
+                profiles[r[0]].append((r[1], r[col]))
+        param_data = data.setdefault(p.name, {})
+        for project, profile in project_profiles:
+            param_data.update(((project, tp), val) for (tp, val) in profiles[profile])
+
+def input_rows(file_name):
+    """Return the column names and a list of rows from an input table, from 
+    memory if it was kept there by an in-memory export, otherwise from the 
+    file (with missing values as None)."""
+    table = memory_inputs.find_table(file_name)
+    if table is not None:
+        return table.keys(), zip(*table.values())
+    with compression.open_file(file_name) as f:
+        columns = f.readline().rstrip('\n').split('\t')
+        rows = [
+            [None if v == '.' else tab_value(v) for v in line.rstrip('\n').split('\t')]
+            for line in f
+        ]
+    return columns, rows
+
+def tab_value(val):
+    """Convert a string from a .tab file into a number or an unquoted string, 
+    like pyomo does."""
+    if len(val) >= 2 and val[0] == '"' and val[-1] == '"':
+        return val[1:-1].replace('""', '"')
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return val
+
+def load_npz_params(switch_data, tab_file, params, select, auto_select):
+    """Load the params from the sidecar for tab_file into switch_data.
+    Returns False if the sidecar doesn't have the expected columns."""
+    columns, values = npz_tables.read_npz(npz_tables.sidecar_file(tab_file))
+    return assign_params(switch_data, columns, values, params, select, auto_select) is not None
+
+def load_memory_table(switch_data, table, params, kwds, auto_select):
+    """Load the params (and their index set, if specified) or the set from a
+    table kept in memory by an in-memory export into switch_data. Returns False 
+    if the table doesn't have the expected columns."""
+    columns, values = table.keys(), table.values()
+    select = kwds.get('select', None)
+    data = switch_data._data.setdefault(None, {})
+    if 'set' in kwds:
+        if params or 'index' in kwds:
+            return False
+        set_columns = list(select) if select is not None else columns
+        if any(c not in columns for c in set_columns):
+            return False
+        set_values = [values[columns.index(c)] for c in set_columns]
+        members = set_values[0] if len(set_values) == 1 else zip(*set_values)
+        data[component_name(kwds['set'])] = {None: list(members)}
+        return True
+    keys = assign_params(switch_data, columns, values, params, select, auto_select)
+    if keys is None:
+        return False
+    if 'index' in kwds:
+        data[component_name(kwds['index'])] = {None: list(keys)}
+    return True
+
+def load_memory_dat(switch_data, table):
+    """Load the params and indexed sets from a .dat file kept in memory by an 
+    in-memory export into switch_data."""
+    data = switch_data._data.setdefault(None, {})
+    for name, value in table.iteritems():
+        if isinstance(value, dict):
+            # indexed set: {index: list of members}
+            data.setdefault(name, {}).update(value)
+        else:
+            data[name] = {None: value}
+
+def component_name(component):
+    return component if isinstance(component, basestring) else component.name
+
+def assign_params(switch_data, columns, values, params, select, auto_select):
+    """Assign values (a list of values for each of the columns) to the params in
+    switch_data. Returns the index keys, or None if the columns don't match 
+    the params."""
+    names = [p.name for p in params]
+    if not names:
+        return None
+    if select is not None:
+        # index columns, then param columns, in the order given
+        select = list(select)
+        if len(select) <= len(names) or any(c not in columns for c in select):
+            return None
+        index_cols, value_cols = select[:-len(names)], select[-len(names):]
+    elif auto_select:
+        # columns matching the param names hold the values; the rest are indexes
+        if any(n not in columns for n in names):
+            return None
+        index_cols, value_cols = [c for c in columns if c not in names], names
+    else:
+        # last columns hold the values; the rest are indexes
+        if len(columns) <= len(names):
+            return None
+        index_cols, value_cols = columns[:-len(names)], columns[-len(names):]
+
+    index_values = [values[columns.index(c)] for c in index_cols]
+    if len(index_values) == 1:
+        keys = index_values[0]
+    else:
+        keys = zip(*index_values)
+    data = switch_data._data.setdefault(None, {})
+    for name, col in zip(names, value_cols):
+        # missing values ('.' in the .tab file) are omitted, as pyomo does
+        data.setdefault(name, {}).update(
+            (k, v) for (k, v) in zip(keys, values[columns.index(col)]) if v is not None
+        )
+    return keys
+
 def define_components(m):
     """Make various changes to the model to facilitate reporting and avoid unwanted behavior"""
     
@@ -0,0 +1,238 @@
+"""
+Shared fixtures for the scenario_data tests. These build a small SQLite
+snapshot of the switch database (see sqlite_snapshot.py), so the export can be
+tested without the postgres server.
+"""
+
+import os, sys, json, datetime
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scenario_data, sqlite_snapshot, memory_inputs
+
+load_zones = ('Oahu', 'Maui')
+periods = [2020, 2025]
+days_per_period = 2
+hours_per_day = 4
+
+# schema and rows for each table in the snapshot
+snapshot_schema = [
+    ('study_periods', 'time_sample TEXT, period INTEGER'),
+    ('study_date',
+        'time_sample TEXT, study_date INTEGER, period INTEGER, ts_duration_of_tp REAL, '
+        'ts_num_tps INTEGER, ts_scale_to_period REAL, date TEXT'),
+    ('study_hour',
+        'time_sample TEXT, study_date INTEGER, study_hour INTEGER, date_time TEXT, hour_of_day INTEGER'),
+    ('load_zone', 'load_zone TEXT'),
+    ('system_load', 'load_zone TEXT, date_time TEXT, system_load REAL'),
+    ('system_load_scale',
+        'load_zone TEXT, year_hist INTEGER, year_fore INTEGER, scale REAL, "offset" REAL, load_scen_id TEXT'),
+    ('generator_costs',
+        'technology TEXT, fuel TEXT, min_vintage_year INTEGER, max_age_years INTEGER, '
+        'scheduled_outage_rate REAL, forced_outage_rate REAL, intermittent INTEGER, '
+        'variable_o_m REAL, heat_rate REAL, capital_cost_per_kw REAL, fixed_o_m REAL, '
+        'connect_cost_per_kw_generic REAL'),
+    ('connect_cost',
+        'load_zone TEXT, technology TEXT, site TEXT, orientation TEXT, '
+        'connect_length_km REAL, connect_cost_per_kw REAL'),
+    ('max_capacity',
+        'load_zone TEXT, technology TEXT, site TEXT, orientation TEXT, max_capacity REAL'),
+    ('cap_factor',
+        'load_zone TEXT, technology TEXT, site TEXT, orientation TEXT, date_time TEXT, cap_factor REAL'),
+    ('existing_plants',
+        'project_id TEXT, load_zone TEXT, technology TEXT, aer_fuel_code TEXT, insvyear INTEGER, '
+        'peak_mw REAL, avg_mw REAL, heat_rate REAL, variable_o_m REAL, fixed_o_m REAL, '
+        'overnight_cost REAL, must_run INTEGER'),
+    ('existing_plants_gen_tech',
+        'technology TEXT, max_age INTEGER, scheduled_outage_rate REAL, forced_outage_rate REAL, '
+        'variable INTEGER, baseload INTEGER, cogen INTEGER, competes_for_space INTEGER, '
+        'variable_o_m REAL'),
+    ('existing_plants_cap_factor',
+        'project_id TEXT, load_zone TEXT, date_time TEXT, cap_factor REAL'),
+    ('energy_source_properties',
+        'energy_source TEXT, co2_intensity REAL, rps_eligible INTEGER, fuel_rank INTEGER'),
+    ('fuel_costs',
+        'load_zone TEXT, fuel_type TEXT, year INTEGER, tier TEXT, price_mmbtu REAL, fuel_scen_id TEXT'),
+    ('ev_adoption', 'load_zone TEXT, year INTEGER, ev_gwh REAL, ev_scen_id TEXT'),
+]
+
+def snapshot_rows():
+    """Return a dictionary with a list of rows for each snapshot table."""
+    rows = dict((t, []) for (t, schema) in snapshot_schema)
+    date_times = []
+    for p in periods:
+        rows['study_periods'].append(('test', p))
+        for d in range(days_per_period):
+            day = datetime.date(2007, 1 + 6 * d, 15)
+            study_date = p * 1000 + 100 * d + 11
+            rows['study_date'].append(
+                ('test', study_date, p, 1.0, hours_per_day, 182.5, str(day))
+            )
+            for h in range(hours_per_day):
+                date_time = str(datetime.datetime.combine(day, datetime.time(6 * h)))
+                date_times.append(date_time)
+                rows['study_hour'].append(('test', study_date, study_date * 100 + h, date_time, 6 * h))
+    date_times = sorted(set(date_times))
+
+    for i, z in enumerate(load_zones):
+        rows['load_zone'].append((z,))
+        for j, dt in enumerate(date_times):
+            # loads with more digits than str() keeps
+            rows['system_load'].append((z, dt, 1000.0 / (3 + i + j)))
+        for p in periods:
+            rows['system_load_scale'].append((z, 2007, p, 1.0 + (p - 2020) / 97.0, 12.5, 'med'))
+            rows['system_load_scale'].append((z, 2007, p, 1.1 + (p - 2020) / 89.0, 12.5, 'high'))
+        for tech, site, orientation in [
+            ('CentralTrackingPV', 'Site_1', 'na'), ('CentralTrackingPV', 'Site_2', 'na'),
+            ('OnshoreWind', 'Ridge', 'na')
+        ]:
+            rows['connect_cost'].append((z, tech, site, orientation, 2.5, 100.0 + i))
+            rows['max_capacity'].append((z, tech, site, orientation, 50.0 * (1 + i)))
+            for j, dt in enumerate(date_times):
+                hour = int(dt[11:13])
+                if tech == 'CentralTrackingPV':
+                    # Site_1 and Site_2 have the same profile on Oahu
+                    cf = 0.0 if hour in (0, 18) else (0.3 + 0.1 * i) * hour / 12.0
+                else:
+                    cf = (j % 5) / 7.0
+                rows['cap_factor'].append((z, tech, site, orientation, dt, cf))
+    rows['cap_factor'] = [
+        r for r in rows['cap_factor'] if not (r[0] == 'Maui' and r[2] == 'Site_2')
+    ] + [
+        ('Maui', 'CentralTrackingPV', 'Site_2', 'na', dt, 0.25)
+        for dt in date_times
+    ]
+
+    rows['generator_costs'] = [
+        ('CentralTrackingPV', 'SUN', 2015, 25, 0.0, 0.0, 1, 0.0, None, 2000.0, 25.0, 0.1),
+        ('OnshoreWind', 'WND', 2015, 25, 0.0, 0.0, 1, 0.0, None, 2400.0, 40.0, 0.1),
+        ('LNG_CC', 'LNG', 2015, 30, 0.04, 0.04, 0, 0.004, 7000.0, 1300.0, 15.0, 0.05),
+    ]
+    plants = [
+        # project_id, load_zone, technology, fuel, insvyear, peak_mw, avg_mw, heat_rate, must_run
+        ('Oahu_Kahe_1', 'Oahu', 'Oahu_Steam', 'LSFO', 1963, 86.0, 70.0, 10500.0, 1),
+        ('Oahu_Kahe_2', 'Oahu', 'Oahu_Steam', 'LSFO', 1964, 86.0, 70.0, 10550.0, 1),
+        ('Oahu_Waiau_9', 'Oahu', 'Oahu_CT', 'Diesel', 1973, 52.0, 5.0, 13000.0, 0),
+        ("Oahu_Honolulu's_IC", 'Oahu', 'Oahu_IC', 'LSFO', 1995, 8.0, 4.0, 9800.0, 0),
+        ('Oahu_Kahuku_Wind', 'Oahu', 'Oahu_Wind', 'WND', 2011, 30.0, 9.0, None, 0),
+        ('Maui_Kahului_1', 'Maui', 'Maui_IC', 'LSFO', 1985, 12.0, 6.0, 9900.0, 1),
+        ('Maui_Kahului_2', 'Maui', 'Maui_IC', 'LSFO', 1986, 12.0, 6.0, 9950.0, 1),
+    ]
+    for (project, z, tech, fuel, year, peak, avg, heat_rate, must_run) in plants:
+        rows['existing_plants'].append(
+            (project, z, tech, fuel, year, peak, avg, heat_rate, 0.005, 20.0, 1500.0, must_run)
+        )
+    rows['existing_plants_gen_tech'] = [
+        (tech, 40, 0.05, 0.05, 1 if tech.endswith('Wind') else 0, 0, 0, 0, 0.005)
+        for tech in sorted(set(p[2] for p in plants))
+    ]
+    for j, dt in enumerate(date_times):
+        rows['existing_plants_cap_factor'].append(('Oahu_Kahuku_Wind', 'Oahu', dt, (j % 3) / 3.0))
+
+    rows['energy_source_properties'] = [
+        ('LSFO', 0.08, 0, 1), ('Diesel', 0.07, 0, 2), ('LNG', 0.05, 0, 3),
+        ('SUN', 0.0, 1, 0), ('WND', 0.0, 1, 0),
+    ]
+    for z in load_zones:
+        for year in periods:
+            for fuel, price in [('LSFO', 15.0), ('Diesel', 20.0), ('LNG', 11.0)]:
+                rows['fuel_costs'].append((z, fuel, year, 'base', price + year / 1000.0, '2'))
+            rows['fuel_costs'].append((z, 'LNG', year, 'bulk', 9.0, '2'))
+            rows['ev_adoption'].append((z, year, 10.0 + (year - 2020) / 3.0, 'ev_med'))
+    return rows
+
+def make_snapshot(snapshot_file):
+    """Create a SQLite snapshot for the scenario in scenario_args()."""
+    con = sqlite_snapshot.connect(snapshot_file).con
+    rows = snapshot_rows()
+    for (table, schema) in snapshot_schema:
+        con.execute('CREATE TABLE {t} ({s})'.format(t=table, s=schema))
+        if rows[table]:
+            con.executemany(
+                'INSERT INTO {t} VALUES ({p})'.format(t=table, p=', '.join('?' for v in rows[table][0])),
+                rows[table]
+            )
+    con.execute('CREATE TABLE snapshot_args (name TEXT, value TEXT)')
+    con.executemany('INSERT INTO snapshot_args VALUES (?, ?)', [
+        ('time_sample', json.dumps('test')), ('load_zones', json.dumps(list(load_zones)))
+    ])
+    con.commit()
+    con.close()
+
+def scenario_args(snapshot_file, inputs_dir, **kw):
+    """Return arguments for scenario_data.write_tables() to export the test
+    scenario from snapshot_file into inputs_dir."""
+    args = dict(
+        db_snapshot=snapshot_file,
+        inputs_dir=inputs_dir,
+        time_sample='test',
+        load_zones=load_zones,
+        load_scen_id='med',
+        fuel_scen_id='2',
+        ev_scen_id='ev_med',
+        base_financial_year=2015,
+        interest_rate=0.06,
+        discount_rate=0.03,
+        inflation_rate=0.025,
+        bulk_lng_limit=1.0e6,
+        bulk_lng_fixed_cost=1.75,
+        connect_cost_per_mw_km=1000.0,
+        enable_must_run=1,
+        exclude_technologies=('CentralFixedPV',),
+        rps_targets={2020: 0.3, 2025: 0.4},
+        battery_capital_cost_per_mwh_capacity=363000.0,
+        battery_n_cycles=4500,
+    )
+    args.update(kw)
+    return args
+
+@pytest.fixture(scope='session')
+def snapshot_file(tmpdir_factory):
+    snapshot_file = str(tmpdir_factory.mktemp('snapshot').join('switch.sqlite'))
+    make_snapshot(snapshot_file)
+    return snapshot_file
+
+@pytest.fixture
+def export(snapshot_file, tmpdir):
+    """Return a function that exports the test scenario with the specified
+    extra arguments into a new directory and returns the name of the directory."""
+    def export(name='inputs', **kw):
+        inputs_dir = str(tmpdir.join(name))
+        scenario_data.write_tables(**scenario_args(snapshot_file, inputs_dir, **kw))
+        scenario_data.wait_for_archive()
+        return inputs_dir
+    yield export
+    scenario_data.wait_for_archive()
+    memory_inputs.clear()
+
+def read_files(inputs_dir):
+    """Return a dictionary with the contents of each file in inputs_dir
+    (excluding the export records)."""
+    skip = set(['export_manifest.json', 'export_state.json', 'module_inputs.json', 'query_plans.txt'])
+    return dict(
+        (f, open(os.path.join(inputs_dir, f), 'rb').read())
+        for f in sorted(os.listdir(inputs_dir)) 
+        if f not in skip and os.path.isfile(os.path.join(inputs_dir, f))
+    )
+
+@pytest.fixture
+def standard_files(export):
+    """Return the files from a standard serial export of the test scenario."""
+    return read_files(export('standard'))
+
+@pytest.fixture
+def standard_data(export):
+    """Return the model data loaded from a standard export of the test scenario
+    (see model_inputs.py)."""
+    pytest.importorskip('switch_patch')
+    from model_inputs import load_inputs
+    data = load_inputs(export('standard'))
+    assert data['lz_demand_mw'] and data['proj_max_capacity_factor'] and data['proj_min_commit_fraction']
+    return data
+
+def assert_same_files(inputs_dir, expected):
+    """Check that inputs_dir holds the same files as expected (see read_files())."""
+    files = read_files(inputs_dir)
+    assert sorted(files) == sorted(expected)
+    for f in expected:
+        assert files[f] == expected[f], f
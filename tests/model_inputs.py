@@ -0,0 +1,60 @@
+"""
+Load exported inputs into a small model through the patched DataPortal 
+loaders in switch_patch.py, the way the switch modules load them, so tests can
+check that the alternative input formats give the model the same data. This
+needs pyomo and switch_mod, so test modules should import it after 
+pytest.importorskip('switch_patch').
+"""
+
+import os
+import switch_patch
+from pyomo.environ import AbstractModel, DataPortal, Param, Set
+
+def input_model():
+    """Return a model with the components loaded by load_inputs()."""
+    m = AbstractModel()
+    m.TIMEPOINTS = Set()
+    m.tp_timestamp = Param(m.TIMEPOINTS)
+    m.tp_ts = Param(m.TIMEPOINTS)
+    m.LOAD_ZONES = Set()
+    m.lz_demand_mw = Param(m.LOAD_ZONES, m.TIMEPOINTS)
+    m.PROJECTS = Set()
+    m.proj_max_capacity_factor = Param(m.PROJECTS, m.TIMEPOINTS)
+    m.proj_min_commit_fraction = Param(m.PROJECTS, m.TIMEPOINTS)
+    m.proj_max_commit_fraction = Param(m.PROJECTS, m.TIMEPOINTS)
+    m.proj_min_load_fraction = Param(m.PROJECTS, m.TIMEPOINTS)
+    m.GENERATION_TECHNOLOGIES = Set()
+    m.G_MULTI_FUELS = Set(m.GENERATION_TECHNOLOGIES)
+    m.base_financial_year = Param()
+    m.interest_rate = Param()
+    m.discount_rate = Param()
+    return m
+
+def load_inputs(inputs_dir):
+    """Load the inputs from inputs_dir the way the switch modules do, and
+    return the data that would be used to construct the model."""
+    m = input_model()
+    switch_data = DataPortal(model=m)
+    path = lambda f: os.path.join(inputs_dir, f)
+    switch_data.load_aug(
+        filename=path('timepoints.tab'), select=('timepoint_id', 'timestamp', 'timeseries'),
+        index=m.TIMEPOINTS, param=(m.tp_timestamp, m.tp_ts)
+    )
+    switch_data.load_aug(filename=path('loads.tab'), auto_select=True, param=(m.lz_demand_mw,))
+    switch_data.load_aug(
+        optional=True, filename=path('variable_capacity_factors.tab'),
+        select=('PROJECT', 'timepoint', 'proj_max_capacity_factor'),
+        param=(m.proj_max_capacity_factor,)
+    )
+    switch_data.load_aug(
+        optional=True, filename=path('proj_commit_bounds_timeseries.tab'), auto_select=True,
+        param=(m.proj_min_commit_fraction, m.proj_max_commit_fraction, m.proj_min_load_fraction)
+    )
+    switch_data.load(filename=path('financials.dat'))
+    switch_data.load(filename=path('gen_multiple_fuels.dat'))
+    return switch_data._data[None]
+
+def assert_same_data(data, expected):
+    assert sorted(data) == sorted(expected)
+    for name in expected:
+        assert data[name] == expected[name], name
@@ -0,0 +1,43 @@
+"""
+Check that write_batch_tables() writes the same files for each scenario as 
+separate exports, and doesn't touch the scenarios' files until it exports them.
+"""
+
+import os
+import scenario_data
+from conftest import read_files, scenario_args, assert_same_files
+
+def batch_export(snapshot_file, tmpdir, alternatives):
+    scenario_data.write_batch_tables([
+        scenario_args(snapshot_file, str(tmpdir.join('batch_{}'.format(i))), **kw)
+        for i, kw in enumerate(alternatives)
+    ])
+
+def test_same_files(export, snapshot_file, tmpdir):
+    alternatives = [
+        dict(), 
+        dict(load_scen_id='high'),
+        dict(exclude_technologies=('OnshoreWind',), interest_rate=0.07),
+    ]
+    expected = [read_files(export('serial_{}'.format(i), **kw)) for i, kw in enumerate(alternatives)]
+    batch_export(snapshot_file, tmpdir, alternatives)
+    # loads.tab for load_scen_id med and high came from one combined query
+    assert scenario_data.batch_stats['combined'] > 0
+    for i, files in enumerate(expected):
+        assert_same_files(str(tmpdir.join('batch_{}'.format(i))), files)
+
+def test_record_pass(snapshot_file, tmpdir, monkeypatch):
+    # a file that the export removes, since sparse_commit_bounds isn't set
+    stale_file = tmpdir.join('batch_0', 'proj_commit_bounds_defaults.tab')
+    stale_file.write('stale', ensure=True)
+    run_combined_queries = scenario_data.run_combined_queries
+    def check_files(jobs, temp_dir):
+        # only the jobs have been recorded so far
+        assert jobs
+        assert os.listdir(str(tmpdir.join('batch_0'))) == ['proj_commit_bounds_defaults.tab']
+        assert not tmpdir.join('batch_1').check()
+        run_combined_queries(jobs, temp_dir)
+    monkeypatch.setattr(scenario_data, 'run_combined_queries', check_files)
+    batch_export(snapshot_file, tmpdir, [dict(), dict(load_scen_id='high')])
+    assert not stale_file.check()
+    assert tmpdir.join('batch_1', 'loads.tab').check()
@@ -0,0 +1,35 @@
+"""
+Check that the large tables written with compress_tables hold the same text
+as the uncompressed files, replace any older uncompressed copies, and load 
+into the model with the same data.
+"""
+
+import os
+import pytest
+import compression
+
+@pytest.mark.parametrize('method', sorted(e[1:] for e in compression.openers))
+def test_compressed_tables(export, standard_files, method):
+    inputs_dir = export('standard', compress_tables=method)
+    ext = compression.extension(method)
+    for f in ['loads.tab', 'variable_capacity_factors.tab', 'timepoints.tab']:
+        # the uncompressed files from the standard export were replaced
+        assert not os.path.exists(os.path.join(inputs_dir, f))
+        with compression.open_file(os.path.join(inputs_dir, f + ext)) as g:
+            assert g.read() == standard_files[f], f
+
+def test_uncompressed_again(export):
+    export('standard', compress_tables='gz')
+    inputs_dir = export('standard')
+    assert os.path.exists(os.path.join(inputs_dir, 'loads.tab'))
+    assert not os.path.exists(os.path.join(inputs_dir, 'loads.tab.gz'))
+
+def test_unknown_method(export):
+    with pytest.raises(ValueError):
+        export('standard', compress_tables='zip')
+
+def test_loaded_data(export, standard_data):
+    from model_inputs import load_inputs, assert_same_data
+    inputs_dir = export('gz', compress_tables='gz')
+    assert os.path.exists(os.path.join(inputs_dir, 'loads.tab.gz'))
+    assert_same_data(load_inputs(inputs_dir), standard_data)
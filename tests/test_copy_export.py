@@ -0,0 +1,63 @@
+"""
+Check the COPY export path for the large tables. COPY needs a postgres
+server, so these tests check when it is used and the COPY command it sends,
+using a stand-in cursor.
+"""
+
+import pytest
+import scenario_data
+from conftest import assert_same_files
+
+def test_using_copy(monkeypatch):
+    monkeypatch.setattr(scenario_data, 'db_snapshot', None)
+    assert scenario_data.using_copy('loads.tab', dict(use_copy=True))
+    assert not scenario_data.using_copy('loads.tab', dict())
+    assert not scenario_data.using_copy('load_zones.tab', dict(use_copy=True))
+    assert not scenario_data.using_copy('loads.tab', dict(use_copy=True, in_memory=True))
+    monkeypatch.setattr(scenario_data, 'db_snapshot', 'switch.sqlite')
+    assert not scenario_data.using_copy('loads.tab', dict(use_copy=True))
+
+def test_snapshot_ignores_copy(export, standard_files):
+    # SQLite snapshots don't support COPY, so the rows are queried instead
+    assert_same_files(export('copy', use_copy=True), standard_files)
+
+class CopyCursor(object):
+    """Stand-in for a psycopg2 cursor, which reports the columns of a query 
+    and records the COPY command it is given."""
+    def __init__(self, columns, text):
+        self.description = [(name, type_code) for (name, type_code) in columns]
+        self.text = text
+        self.executed = []
+    def execute(self, query, arguments=None):
+        self.executed.append(query)
+    def mogrify(self, query, arguments):
+        return query % dict((k, repr(v)) for k, v in arguments.items())
+    def copy_expert(self, query, f):
+        self.copy_query = query
+        f.write(self.text)
+
+@pytest.mark.parametrize('sort', [False, True])
+def test_copy_table(tmpdir, monkeypatch, sort):
+    cur = CopyCursor([('PROJECT', 25), ('TIMEPOINT', 23), ('cap_factor', 701)], 'Oahu_PV\t1\t0.5\n')
+    monkeypatch.setattr(scenario_data, 'db_cursor', lambda: cur)
+    output_file = str(tmpdir.join('variable_capacity_factors.tab'))
+    scenario_data.copy_table(
+        output_file, 
+        'SELECT * FROM cap_factor WHERE load_zone IN %(load_zones)s;', 
+        dict(load_zones=('Oahu',)), sort=sort
+    )
+    with open(output_file) as f:
+        assert f.read() == 'PROJECT\tTIMEPOINT\tcap_factor\nOahu_PV\t1\t0.5\n'
+    # the arguments are bound into the query, and text columns are quoted like stringify()
+    assert cur.copy_query.startswith('COPY (SELECT CASE WHEN q."PROJECT" ~ ')
+    assert "WHERE load_zone IN ('Oahu',)) AS q" in cur.copy_query
+    assert cur.copy_query.endswith("TO STDOUT WITH NULL AS '.'")
+    order = ' ORDER BY q."PROJECT" COLLATE "C" NULLS FIRST, q."TIMEPOINT" NULLS FIRST, q."cap_factor" NULLS FIRST)'
+    assert (order in cur.copy_query) == sort
+
+def test_copy_column_expr():
+    assert scenario_data.copy_column_expr('period', 23) == 'q."period"'
+    assert scenario_data.copy_column_expr('must_run', 16) == (
+        'CASE WHEN q."must_run" THEN \'True\' WHEN NOT q."must_run" THEN \'False\' END'
+    )
+    assert 'replace(q."a ""b""", \'"\', \'""\')' in scenario_data.copy_column_expr('a "b"', 1043)
@@ -0,0 +1,44 @@
+"""
+Check that dedup_cap_factors writes each distinct capacity factor profile 
+once, with a map from projects to profiles that rebuilds the standard
+variable_capacity_factors.tab, and that these load into the model with the 
+same data as the standard file.
+"""
+
+import collections
+from conftest import read_files
+
+def tab_rows(text):
+    return [l.split('\t') for l in text.splitlines()[1:]]
+
+def test_profiles(export, standard_files):
+    files = read_files(export('standard', dedup_cap_factors=True))
+    # the older standard file is removed
+    assert 'variable_capacity_factors.tab' not in files
+    profiles = collections.OrderedDict()
+    for (profile, tp, cf) in tab_rows(files['cap_factor_profiles.tab']):
+        profiles.setdefault(profile, []).append((tp, cf))
+    project_profile = dict(tab_rows(files['project_cap_factor_profiles.tab']))
+    # each profile is only written once, and numbered in order of first use
+    assert len(set(tuple(p) for p in profiles.values())) == len(profiles)
+    assert profiles.keys() == [str(i + 1) for i in range(len(profiles))]
+    # Site_1 and Site_2 have the same profile on Oahu, and OnshoreWind has 
+    # the same profile in both zones
+    assert project_profile['Oahu_CentralTrackingPV_Site_1_na'] == project_profile['Oahu_CentralTrackingPV_Site_2_na']
+    assert project_profile['Oahu_OnshoreWind_Ridge_na'] == project_profile['Maui_OnshoreWind_Ridge_na']
+    assert len(profiles) < len(project_profile)
+    # expanding the profiles gives the standard table
+    expanded = sorted(
+        (project, tp, cf) 
+        for project, profile in project_profile.items() 
+        for (tp, cf) in profiles[profile]
+    )
+    assert expanded == sorted(tuple(r) for r in tab_rows(standard_files['variable_capacity_factors.tab']))
+    # switching back removes the profile tables
+    files = read_files(export('standard'))
+    assert 'cap_factor_profiles.tab' not in files and 'project_cap_factor_profiles.tab' not in files
+
+def test_loaded_data(export, standard_data):
+    from model_inputs import load_inputs, assert_same_data
+    inputs_dir = export('dedup', dedup_cap_factors=True)
+    assert_same_data(load_inputs(inputs_dir), standard_data)
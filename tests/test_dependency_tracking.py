@@ -0,0 +1,62 @@
+"""
+Check that export_state.json records the arguments each file depends on, so
+skip_unchanged only rewrites the files whose arguments changed, and the 
+export reports which arguments changed.
+"""
+
+import os, json
+import scenario_data
+
+def manifest_sources(inputs_dir):
+    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+        return {k: v['source'] for k, v in json.load(f)['files'].items()}
+
+def rewritten(inputs_dir):
+    return sorted(f for f, s in manifest_sources(inputs_dir).items() if s != 'unchanged')
+
+def test_recorded_arguments(export):
+    inputs_dir = export('standard', skip_unchanged=True)
+    with open(os.path.join(inputs_dir, 'export_state.json')) as f:
+        state = json.load(f)
+    files = {os.path.basename(k): v for k, v in state.items()}
+    assert files['loads.tab']['arguments'] == dict(
+        load_zones=['Oahu', 'Maui'], time_sample='test', load_scen_id='med'
+    )
+    assert files['loads.tab']['source_tables'] == [
+        'study_date', 'study_hour', 'system_load', 'system_load_scale'
+    ]
+    assert files['rps_targets.tab']['arguments'] == dict(rps_targets={'2020': 0.3, '2025': 0.4})
+    assert files['financials.dat']['arguments'] == dict(
+        base_financial_year=2015, interest_rate=0.06, discount_rate=0.03
+    )
+
+def test_changed_arguments(export, capsys):
+    export('standard', skip_unchanged=True)
+    inputs_dir = export('standard', skip_unchanged=True)
+    assert rewritten(inputs_dir) == []
+    assert scenario_data.changed_arguments() == []
+
+    capsys.readouterr()
+    export('standard', skip_unchanged=True, rps_targets={2020: 0.3, 2025: 0.5})
+    assert rewritten(inputs_dir) == ['rps_targets.tab']
+    assert 'Arguments changed since the last export: rps_targets.' in capsys.readouterr()[0]
+
+    export('standard', skip_unchanged=True, rps_targets={2020: 0.3, 2025: 0.5}, battery_n_cycles=5000)
+    assert rewritten(inputs_dir) == ['batteries.dat']
+    assert scenario_data.changed_arguments() == ['battery_n_cycles']
+
+    export(
+        'standard', skip_unchanged=True, rps_targets={2020: 0.3, 2025: 0.5}, battery_n_cycles=5000,
+        load_scen_id='high'
+    )
+    assert rewritten(inputs_dir) == ['loads.tab']
+    assert scenario_data.changed_arguments() == ['load_scen_id']
+
+def test_shared_base(export):
+    # write_tab_file() calls that name their arguments can be shared too
+    base_dir = export('base')
+    export('base', inputs_subdir='rps', alt_args=dict(rps_targets={2020: 0.5}), rps_targets={2020: 0.5})
+    export('base', inputs_subdir='rate', alt_args=dict(interest_rate=0.07), interest_rate=0.07)
+    assert not os.path.islink(os.path.join(base_dir, 'rps', 'rps_targets.tab'))
+    assert os.path.islink(os.path.join(base_dir, 'rps', 'financials.dat'))
+    assert os.path.islink(os.path.join(base_dir, 'rate', 'rps_targets.tab'))
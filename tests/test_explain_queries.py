@@ -0,0 +1,47 @@
+"""
+Check that explain_queries saves a plan for each query in query_plans.txt, 
+flags slow queries, and leaves the exported files unchanged.
+"""
+
+import os, re, json
+from conftest import assert_same_files
+
+def query_plans(inputs_dir):
+    """Return a list of (file name, header line, section text) for each plan
+    in query_plans.txt."""
+    with open(os.path.join(inputs_dir, 'query_plans.txt')) as f:
+        text = f.read()
+    sections = re.split(r'#{80}\n# ', text)[1:]
+    return [(s.split(':')[0], s.split('\n')[0], s) for s in sections]
+
+def test_query_plans(export, standard_files):
+    inputs_dir = export('standard', explain_queries=True)
+    assert_same_files(inputs_dir, standard_files)
+    plans = query_plans(inputs_dir)
+    files = [f for (f, header, text) in plans]
+    assert 'loads.tab' in files and 'project_info.tab' in files
+    # .dat files written from the arguments have no query
+    assert 'financials.dat' not in files
+    for (f, header, text) in plans:
+        assert 'SLOW' not in header
+        # the query is shown with its arguments filled in
+        assert '%(' not in text, f
+    loads = [text for (f, header, text) in plans if f == 'loads.tab'][0]
+    assert "'med'" in loads and 'SCAN' in loads.upper()
+    # slowest first
+    runtimes = [float(re.search(r': ([\d.]+)s', header).group(1)) for (f, header, text) in plans]
+    assert runtimes == sorted(runtimes, reverse=True)
+
+def test_slow_queries(export):
+    inputs_dir = export('standard', explain_queries=True, slow_query_seconds=-1)
+    plans = query_plans(inputs_dir)
+    assert plans and all(header.endswith('(SLOW)') for (f, header, text) in plans)
+    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+        files = json.load(f)['files']
+    assert files['loads.tab']['slow_query'] is True
+    assert files['loads.tab']['explain_runtime'] >= 0
+    assert 'slow_query' not in files['financials.dat']
+
+def test_no_plans(export):
+    inputs_dir = export('standard')
+    assert not os.path.exists(os.path.join(inputs_dir, 'query_plans.txt'))
@@ -0,0 +1,54 @@
+"""
+Check that the in-memory tables kept by scenario_data load into the model 
+with exactly the same data as the standard text files, when loaded through 
+the patched DataPortal loaders in switch_patch.py, and that the tables hold
+the values pyomo would read from the files.
+"""
+
+import os, decimal
+import pytest
+import memory_inputs
+
+def test_in_memory(export, standard_data):
+    from model_inputs import load_inputs, assert_same_data
+    inputs_dir = export('memory', in_memory=True)
+    from_memory = load_inputs(inputs_dir)
+    assert_same_data(from_memory, standard_data)
+    # the archived files give the same data
+    memory_inputs.clear()
+    assert_same_data(load_inputs(inputs_dir), from_memory)
+
+def test_in_memory_only(export, standard_data):
+    from model_inputs import load_inputs, assert_same_data
+    inputs_dir = export('memory', in_memory=True, archive_inputs=False)
+    assert os.listdir(inputs_dir) == []
+    assert_same_data(load_inputs(inputs_dir), standard_data)
+
+def test_tables(export):
+    inputs_dir = export('memory', in_memory=True)
+    table = memory_inputs.find_table(os.path.join(inputs_dir, 'loads.tab'))
+    assert list(table) == ['LOAD_ZONE', 'TIMEPOINT', 'lz_demand_mw']
+    with open(os.path.join(inputs_dir, 'loads.tab')) as f:
+        rows = [l.rstrip('\n').split('\t') for l in f][1:]
+    assert table['LOAD_ZONE'] == [r[0] for r in rows]
+    assert table['TIMEPOINT'] == [int(r[1]) for r in rows]
+    assert table['lz_demand_mw'] == [float(r[2]) for r in rows]
+
+def test_model_values():
+    assert memory_inputs.column_values(
+        [None, 3, 0.1 + 0.2, decimal.Decimal('0.5'), 'Oahu', '2020', True]
+    ) == [None, 3, 0.3, 0.5, 'Oahu', 2020, 'True']
+    # values that compare equal but are written differently are converted separately
+    values = memory_inputs.column_values([decimal.Decimal('1'), True, decimal.Decimal('1.0')])
+    assert [(type(v), v) for v in values] == [(int, 1), (str, 'True'), (float, 1.0)]
+
+def test_wait_for_file(tmpdir):
+    file_name = str(tmpdir.join('loads.tab'))
+    memory_inputs.store(file_name, {}, archived=False)
+    try:
+        with pytest.raises(ValueError):
+            memory_inputs.wait_for_file(file_name)
+        # files that weren't exported in memory don't need to wait
+        memory_inputs.wait_for_file(str(tmpdir.join('timepoints.tab')))
+    finally:
+        memory_inputs.clear()
@@ -0,0 +1,73 @@
+"""
+Check that input_checks.check_inputs() accepts the exported inputs and 
+reports references to items that aren't defined in the other files.
+"""
+
+import os
+import pytest
+import input_checks
+
+@pytest.fixture
+def inputs_dir(export):
+    """Return a directory of exported inputs (already checked by the export)."""
+    return export('standard')
+
+def append(inputs_dir, file, lines):
+    with open(os.path.join(inputs_dir, file), 'a') as f:
+        f.writelines(l + '\n' for l in lines)
+
+def check_problems(inputs_dir):
+    """Return the lines of the error message from check_inputs()."""
+    with pytest.raises(ValueError) as e:
+        input_checks.check_inputs(inputs_dir)
+    return str(e.value).splitlines()[1:]
+
+def test_valid_inputs(inputs_dir):
+    # quoted names are compared without their quotes
+    with open(os.path.join(inputs_dir, 'proj_existing_builds.tab')) as f:
+        assert '"Oahu_Honolulu\'s_IC"' in f.read()
+    input_checks.check_inputs(inputs_dir)
+    # numbers are compared by value, as pyomo does
+    append(inputs_dir, 'timeseries.tab', ['202099911\t2020.0\t1.0\t4\t182.5'])
+    input_checks.check_inputs(inputs_dir)
+
+def test_dangling_references(inputs_dir):
+    append(inputs_dir, 'variable_capacity_factors.tab', ['Ghost_Plant\t202001100\t0.5'])
+    append(inputs_dir, 'loads.tab', ['Kauai\t202001199\t100.0'])
+    assert check_problems(inputs_dir) == [
+        '    loads.tab: 1 value(s) in LOAD_ZONE not found in load_zones.tab (LOAD_ZONES): Kauai',
+        '    loads.tab: 1 value(s) in TIMEPOINT not found in timepoints.tab (TIMEPOINTS): 202001199',
+        '    variable_capacity_factors.tab: 1 value(s) in PROJECT not found in project_info.tab '
+        '(PROJECTS): Ghost_Plant',
+    ]
+
+def test_indexed_sets(inputs_dir):
+    append(inputs_dir, 'gen_multiple_fuels.dat', ['set G_MULTI_FUELS[Kauai_IC] := LSFO Biodiesel ;'])
+    problems = check_problems(inputs_dir)
+    assert len(problems) == 3
+    assert 'gen_multiple_fuels.dat: 1 value(s) in index not found' in problems[0]
+    assert 'in members not found in fuels.tab (FUELS): Biodiesel' in problems[1]
+    assert 'in members not found in fuel_supply_curves.tab (SUPPLIED_FUELS): Biodiesel' in problems[2]
+
+def test_long_lists(inputs_dir):
+    append(inputs_dir, 'proj_build_costs.tab', [
+        'Ghost_{}\t2020\t1.0\t1.0'.format(i) for i in range(input_checks.max_listed + 2)
+    ])
+    assert check_problems(inputs_dir) == [
+        '    proj_build_costs.tab: 7 value(s) in PROJECT not found in project_info.tab (PROJECTS): '
+        'Ghost_0, Ghost_1, Ghost_2, Ghost_3, Ghost_4, ...'
+    ]
+
+def test_missing_files(inputs_dir):
+    # checks that need a missing file are skipped
+    append(inputs_dir, 'proj_build_costs.tab', ['Ghost_Plant\t2020\t1.0\t1.0'])
+    os.remove(os.path.join(inputs_dir, 'project_info.tab'))
+    input_checks.check_inputs(inputs_dir)
+
+def test_export_checks(export, monkeypatch):
+    checked = []
+    monkeypatch.setattr(input_checks, 'check_inputs', checked.append)
+    inputs_dir = export('standard')
+    assert [os.path.normpath(d) for d in checked] == [os.path.normpath(inputs_dir)]
+    export('unchecked', check_inputs=False)
+    assert [os.path.normpath(d) for d in checked] == [os.path.normpath(inputs_dir)]
@@ -0,0 +1,86 @@
+"""
+Check that export_manifest.json describes each exported file correctly, and
+that the checksums are calculated without reading the files back.
+"""
+
+import os, json, hashlib
+import pytest
+import compression
+
+def read_manifest(inputs_dir):
+    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+        return json.load(f)
+
+def assert_correct_entries(inputs_dir):
+    files = read_manifest(inputs_dir)['files']
+    assert 'financials.dat' in files
+    for name, entry in files.items():
+        path = os.path.join(inputs_dir, name)
+        with compression.open_file(path) as f:
+            text = f.read()
+        assert entry['sha1'] == hashlib.sha1(text).hexdigest(), name
+        assert entry['bytes'] == os.path.getsize(path), name
+        if '.tab' in name:
+            assert entry['rows'] == text.count('\n') - 1, name
+        else:
+            assert entry['rows'] is None, name
+    return files
+
+@pytest.fixture
+def file_reads(monkeypatch):
+    """Record the files opened for reading with compression.open_file()."""
+    reads = []
+    open_file = compression.open_file
+    def record_reads(file_name, mode='r'):
+        if 'r' in mode:
+            reads.append(os.path.basename(file_name))
+        return open_file(file_name, mode)
+    monkeypatch.setattr(compression, 'open_file', record_reads)
+    return reads
+
+def test_entries(export, file_reads):
+    inputs_dir = export('standard', check_inputs=False)
+    assert file_reads == []
+    files = assert_correct_entries(inputs_dir)
+    assert files['loads.tab']['source'] == 'query'
+    assert files['loads.tab']['arguments']['load_scen_id'] == 'med'
+    assert files['financials.dat']['source'] == 'arguments'
+    assert read_manifest(inputs_dir)['arguments']['time_sample'] == 'test'
+
+def test_compressed_tables(export, file_reads):
+    inputs_dir = export('gz', compress_tables='gz', check_inputs=False)
+    assert file_reads == []
+    assert 'loads.tab.gz' in assert_correct_entries(inputs_dir)
+
+def test_reused_files(export, tmpdir, file_reads):
+    # (exported files are only read by assert_correct_entries(), after each export)
+    first = export('standard', skip_unchanged=True, check_inputs=False)
+    first_files = read_manifest(first)['files']
+    # unchanged files keep their entries from the last manifest
+    export('standard', skip_unchanged=True, check_inputs=False)
+    assert file_reads == []
+    files = assert_correct_entries(first)
+    assert files['loads.tab']['source'] == 'unchanged'
+    # copies from the query cache are checksummed as they are copied
+    cache_dir = str(tmpdir.join('cache'))
+    export('cached', query_cache_dir=cache_dir, check_inputs=False)
+    del file_reads[:]
+    cached = export('cached', query_cache_dir=cache_dir, check_inputs=False)
+    assert file_reads == []
+    files = assert_correct_entries(cached)
+    assert files['loads.tab']['source'] == 'query cache'
+    # files linked to the base scenario use the base scenario's entries
+    del file_reads[:]
+    export(
+        'standard', inputs_subdir='alt', alt_args=dict(interest_rate=0.07), 
+        interest_rate=0.07, check_inputs=False
+    )
+    assert file_reads == []
+    files = assert_correct_entries(os.path.join(first, 'alt'))
+    assert files['loads.tab']['source'] == 'base scenario'
+    assert files['loads.tab']['sha1'] == first_files['loads.tab']['sha1']
+
+def test_no_manifest(export):
+    inputs_dir = export('standard', write_manifest=False)
+    assert not os.path.exists(os.path.join(inputs_dir, 'export_manifest.json'))
+    assert os.path.exists(os.path.join(inputs_dir, 'loads.tab'))
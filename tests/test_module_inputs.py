@@ -0,0 +1,55 @@
+"""
+Check that exports with a module list only write the optional input files 
+read by those modules, and record them in module_inputs.json.
+"""
+
+import os, json
+import pytest
+import scenario_data
+
+def read_module_inputs(inputs_dir):
+    with open(os.path.join(inputs_dir, 'module_inputs.json')) as f:
+        return json.load(f)
+
+def test_module_inputs(export):
+    # (no hydrogen arguments are set, so hydrogen.dat is in neither list)
+    inputs_dir = export('modules', modules=['switch_mod.timescales', 'switch_mod.fuel_markets'])
+    module_inputs = read_module_inputs(inputs_dir)
+    assert module_inputs['modules'] == ['switch_mod.timescales', 'switch_mod.fuel_markets']
+    assert module_inputs['skipped'] == [
+        'batteries.dat', 'ev_energy.tab', 'proj_commit_bounds_timeseries.tab', 'rps_targets.tab'
+    ]
+    assert 'fuel_supply_curves.tab' in module_inputs['files']
+    assert not os.path.exists(os.path.join(inputs_dir, 'rps_targets.tab'))
+
+def test_modules_file(export, tmpdir):
+    modules_file = tmpdir.join('modules.txt')
+    modules_file.write(
+        '# modules for this scenario\n'
+        'switch_mod.project.unitcommit\n'
+        'switch_hawaii.rps  # reads rps_targets.tab\n'
+        '\n'
+    )
+    inputs_dir = export('modules', modules=str(modules_file))
+    module_inputs = read_module_inputs(inputs_dir)
+    assert module_inputs['modules'] == ['switch_mod.project.unitcommit', 'switch_hawaii.rps']
+    assert 'proj_commit_bounds_timeseries.tab' in module_inputs['files']
+    assert 'rps_targets.tab' in module_inputs['files']
+    assert 'batteries.dat' in module_inputs['skipped']
+
+@pytest.mark.parametrize('module, reader, reads', [
+    ('switch_mod.fuel_markets', 'switch_mod.fuel_markets', True),
+    ('switch_mod.project', 'switch_mod.project.unitcommit.commit', True),
+    ('switch_hawaii.rps', 'rps', True),
+    ('switch_mod.project.unitcommit', 'switch_mod.project.unit', False),
+    ('switch_hawaii.ev_advanced', 'ev', False),
+])
+def test_module_reads(module, reader, reads):
+    assert scenario_data.module_reads(module, reader) == reads
+
+def test_stale_files_removed(export):
+    inputs_dir = export('modules')
+    assert not os.path.exists(os.path.join(inputs_dir, 'module_inputs.json'))
+    assert os.path.exists(os.path.join(inputs_dir, 'rps_targets.tab'))
+    export('modules', modules=['switch_mod.timescales'])
+    assert not os.path.exists(os.path.join(inputs_dir, 'rps_targets.tab'))
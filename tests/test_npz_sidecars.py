@@ -0,0 +1,50 @@
+"""
+Check that the .npz sidecars written with npz_sidecars=True hold the same data
+as the .tab files, and that switch_patch.py loads them only while they match
+the .tab file.
+"""
+
+import os
+import pytest
+
+# npz_tables needs numpy; switch_patch also needs pyomo and switch_mod
+pytest.importorskip('switch_patch')
+import npz_tables
+from model_inputs import load_inputs, assert_same_data
+
+def test_npz_sidecars(export, standard_data, monkeypatch):
+    inputs_dir = export('npz', npz_sidecars=True)
+    loaded = []
+    read_npz = npz_tables.read_npz
+    monkeypatch.setattr(npz_tables, 'read_npz', lambda f: loaded.append(f) or read_npz(f))
+    assert_same_data(load_inputs(inputs_dir), standard_data)
+    assert os.path.join(inputs_dir, 'loads.npz') in loaded
+
+def test_sidecar_from_file(export, monkeypatch):
+    # the sidecars are made from the query results, without reading back the
+    # .tab files, and match the ones made from the .tab files
+    column_array = npz_tables.column_array
+    monkeypatch.setattr(npz_tables, 'column_array', None)
+    inputs_dir = export('npz', npz_sidecars=True)
+    monkeypatch.setattr(npz_tables, 'column_array', column_array)
+    for f in ['loads', 'variable_capacity_factors', 'proj_commit_bounds_timeseries', 'timepoints']:
+        tab_file = os.path.join(inputs_dir, f + '.tab')
+        npz_file = os.path.join(inputs_dir, f + '.npz')
+        from_rows = npz_tables.read_npz(npz_file)
+        os.remove(npz_file)
+        npz_tables.write_npz(tab_file)
+        assert npz_tables.read_npz(npz_file) == from_rows, f
+
+def test_stale_npz_sidecar(export):
+    inputs_dir = export('npz', npz_sidecars=True)
+    # rewrite loads.tab with different values of the same length, without
+    # updating the sidecar
+    tab_file = os.path.join(inputs_dir, 'loads.tab')
+    tab_time = os.path.getmtime(tab_file)
+    with open(tab_file) as f:
+        text = f.read()
+    with open(tab_file, 'w') as f:
+        f.write(text.replace('262.5', '999.5'))
+    os.utime(tab_file, (tab_time + 1, tab_time + 1))
+    assert not npz_tables.sidecar_is_current(tab_file)
+    assert load_inputs(inputs_dir)['lz_demand_mw'][('Maui', 202001100)] == 999.5
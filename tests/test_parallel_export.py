@@ -0,0 +1,23 @@
+"""
+Check that a parallel export (export_workers) writes exactly the same files as
+a standard serial export.
+"""
+
+import pytest
+import scenario_data
+from conftest import assert_same_files
+
+@pytest.mark.parametrize('workers', [2, 4, 20])
+def test_same_files(export, standard_files, workers):
+    assert_same_files(export('parallel', export_workers=workers), standard_files)
+
+def test_worker_error(export, monkeypatch):
+    # an error in one worker stops the export and is raised by write_tables()
+    query_rows = scenario_data.query_rows
+    def failing_query_rows(query, arguments, **kw):
+        if 'lz_demand_mw' in query:
+            raise RuntimeError('query failed')
+        return query_rows(query, arguments, **kw)
+    monkeypatch.setattr(scenario_data, 'query_rows', failing_query_rows)
+    with pytest.raises(RuntimeError):
+        export('parallel', export_workers=4)
@@ -0,0 +1,76 @@
+"""
+Check that aggregate_plants merges small, similar existing plants into 
+aggregate projects, with their total capacity and capacity-weighted capacity
+factors, and that the exported inputs are consistent.
+"""
+
+import os, shutil, sqlite3
+import pytest
+from conftest import read_files
+
+def tab_rows(text):
+    return [l.split('\t') for l in text.splitlines()[1:]]
+
+def project_rows(text, project):
+    return [r for r in tab_rows(text) if r[0] == project]
+
+def test_aggregates(export, standard_files):
+    # (the export also checks that all the files refer to the same projects)
+    files = read_files(export('standard', aggregate_plants=True))
+    assert tab_rows(files['existing_plant_aggregates.tab']) == [
+        ['Maui_Maui_IC_agg1', 'Maui_Kahului_1', '12.0', '0.5'],
+        ['Maui_Maui_IC_agg1', 'Maui_Kahului_2', '12.0', '0.5'],
+    ]
+    for f in ['project_info.tab', 'proj_existing_builds.tab', 'proj_commit_bounds_timeseries.tab']:
+        assert project_rows(files[f], 'Maui_Kahului_1') == [], f
+        assert project_rows(files[f], 'Maui_Maui_IC_agg1') != [], f
+        # plants larger than aggregate_plant_max_mw are left alone
+        assert project_rows(files[f], 'Oahu_Kahe_1') == project_rows(standard_files[f], 'Oahu_Kahe_1'), f
+    capacity = lambda text, projects: sum(
+        float(r[2]) for r in tab_rows(text) if r[0] in projects
+    )
+    assert capacity(files['proj_existing_builds.tab'], ['Maui_Maui_IC_agg1']) == capacity(
+        standard_files['proj_existing_builds.tab'], ['Maui_Kahului_1', 'Maui_Kahului_2']
+    )
+    # one commitment bound per timepoint for the aggregate
+    bounds = project_rows(files['proj_commit_bounds_timeseries.tab'], 'Maui_Maui_IC_agg1')
+    assert len(bounds) == len(set(r[1] for r in bounds)) == len(tab_rows(files['timepoints.tab']))
+
+def test_cap_factors(export, snapshot_file, tmpdir):
+    # give the units different sizes and capacity factors
+    snapshot = str(tmpdir.join('copy.sqlite'))
+    shutil.copyfile(snapshot_file, snapshot)
+    con = sqlite3.connect(snapshot)
+    con.execute("UPDATE existing_plants SET peak_mw = 6.0 WHERE project_id = 'Maui_Kahului_2'")
+    for (project, cf) in [('Maui_Kahului_1', 0.2), ('Maui_Kahului_2', 0.5)]:
+        con.execute("""
+            INSERT INTO existing_plants_cap_factor 
+                SELECT ?, 'Maui', date_time, ? FROM system_load WHERE load_zone = 'Maui'
+        """, (project, cf))
+    con.commit()
+    con.close()
+    files = read_files(export('standard', db_snapshot=snapshot, aggregate_plants=True))
+    assert tab_rows(files['existing_plant_aggregates.tab']) == [
+        ['Maui_Maui_IC_agg1', 'Maui_Kahului_1', '12.0', '0.666666666667'],
+        ['Maui_Maui_IC_agg1', 'Maui_Kahului_2', '6.0', '0.333333333333'],
+    ]
+    cap_factors = project_rows(files['variable_capacity_factors.tab'], 'Maui_Maui_IC_agg1')
+    assert len(cap_factors) == len(tab_rows(files['timepoints.tab']))
+    for (project, tp, cf) in cap_factors:
+        assert float(cf) == pytest.approx((0.2 * 12 + 0.5 * 6) / 18)
+    assert project_rows(files['variable_capacity_factors.tab'], 'Maui_Kahului_1') == []
+
+@pytest.mark.parametrize('options', [
+    dict(aggregate_plant_max_mw=10),
+    # the heat rates differ by 0.5%
+    dict(aggregate_plant_tolerance=0.001),
+])
+def test_no_aggregates(export, standard_files, options):
+    files = read_files(export('standard', aggregate_plants=True, **options))
+    assert tab_rows(files.pop('existing_plant_aggregates.tab')) == []
+    assert files == standard_files
+
+def test_switch_off(export):
+    export('standard', aggregate_plants=True)
+    files = read_files(export('standard'))
+    assert 'existing_plant_aggregates.tab' not in files
@@ -0,0 +1,54 @@
+"""
+Check that exports which prefetch row batches on a separate thread 
+(prefetch_batches) write exactly the same files as a standard export, and 
+that the prefetch thread passes on errors and stops when it isn't needed.
+"""
+
+import threading
+import pytest
+import scenario_data
+from conftest import assert_same_files
+
+@pytest.mark.parametrize('options', [
+    dict(fetch_batch_size=1, prefetch_batches=1),
+    dict(fetch_batch_size=2, prefetch_batches=2),
+    dict(export_shards=3, fetch_batch_size=2, prefetch_batches=1),
+    dict(export_workers=2, fetch_batch_size=3, prefetch_batches=2),
+])
+def test_same_files(export, standard_files, options):
+    assert_same_files(export('prefetched', **options), standard_files)
+
+class Cursor(object):
+    """Cursor that returns the rows 0, 1, ... n - 1, then raises error (if set)."""
+    description = [('n', None)]
+    def __init__(self, n, error=None):
+        self.rows = [(i,) for i in range(n)]
+        self.error = error
+        self.fetched = 0
+    def fetchmany(self, size):
+        batch = self.rows[self.fetched:self.fetched + size]
+        self.fetched += len(batch)
+        if not batch and self.error is not None:
+            raise self.error
+        return batch
+
+def test_rows():
+    columns, rows = scenario_data.prefetched_rows(Cursor(10), 3, 2)
+    assert columns == ['n']
+    assert list(rows) == [(i,) for i in range(10)]
+
+def test_errors():
+    columns, rows = scenario_data.prefetched_rows(Cursor(5, ValueError('lost connection')), 2, 1)
+    with pytest.raises(ValueError) as e:
+        list(rows)
+    assert 'lost connection' in str(e.value)
+
+def test_early_stop():
+    cur = Cursor(1000)
+    threads = threading.active_count()
+    columns, rows = scenario_data.prefetched_rows(cur, 10, 2)
+    assert [r for r, i in zip(rows, range(5))] == [(i,) for i in range(5)]
+    rows.close()
+    # the prefetch thread stopped without fetching the rest of the rows
+    assert threading.active_count() == threads
+    assert cur.fetched < 100
@@ -0,0 +1,51 @@
+"""
+Check that the query cache (query_cache_dir) reuses the files from earlier 
+exports with the same queries and arguments, and stays within its size limit.
+"""
+
+import os, json
+import scenario_data
+from conftest import read_files, assert_same_files
+
+def manifest_sources(inputs_dir):
+    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+        return {k: v['source'] for k, v in json.load(f)['files'].items()}
+
+def test_cache_hits(export, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    first = export('first', query_cache_dir=cache_dir)
+    queried = sorted(f for f, s in manifest_sources(first).items() if s == 'query')
+    assert 'variable_capacity_factors.tab' in queried
+    assert scenario_data.cache_stats['hits'] == 0
+
+    second = export('second', query_cache_dir=cache_dir)
+    assert_same_files(second, read_files(first))
+    sources = manifest_sources(second)
+    assert sorted(f for f, s in sources.items() if s == 'query cache') == queried
+    assert scenario_data.cache_stats['hits'] == len(queried)
+    assert scenario_data.cache_stats['misses'] == 0
+
+def test_changed_arguments(export, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    export('first', query_cache_dir=cache_dir)
+    # only the queries that use exclude_technologies are run again
+    second = export('second', query_cache_dir=cache_dir, exclude_technologies=('OnshoreWind',))
+    sources = manifest_sources(second)
+    assert sources['variable_capacity_factors.tab'] == 'query'
+    assert sources['loads.tab'] == 'query cache'
+    assert 'OnshoreWind' not in read_files(second)['variable_capacity_factors.tab']
+
+def test_trim_least_recently_used(tmpdir):
+    for i, name in enumerate(['c', 'a', 'b']):
+        f = tmpdir.join(name)
+        f.write('x' * 100)
+        os.utime(str(f), (1000 + i, 1000 + i))
+    tmpdir.join('d.tmp').write('x' * 100)     # partly written file; left alone
+    scenario_data.trim_query_cache(str(tmpdir), 250)
+    assert sorted(os.listdir(str(tmpdir))) == ['a', 'b', 'd.tmp']
+
+def test_size_limit(export, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    export('first', query_cache_dir=cache_dir, query_cache_mb=0.002)
+    sizes = [os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)]
+    assert sizes and sum(sizes) <= 0.002 * 1024 * 1024
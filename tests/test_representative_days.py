@@ -0,0 +1,111 @@
+"""
+Check that representative_days chooses a set of representative days from a
+full year of hourly data and exports them in place of the days in 
+time_sample, with weights that preserve the length of each period.
+"""
+
+import os, json, shutil, sqlite3, datetime
+import pytest
+import scenario_data
+from conftest import read_files
+
+# representative days need numpy
+pytest.importorskip('numpy')
+
+n_days = 10     # days of hourly data added to the snapshot
+peak_day = 9
+
+@pytest.fixture(scope='module')
+def hourly_snapshot(snapshot_file, tmpdir_factory):
+    """Return the name of a copy of the test snapshot with n_days full days of
+    hourly data in 2007. Apart from the peak day, days d and d + 3 have the
+    same data, so three clusters of days represent the year exactly."""
+    snapshot = str(tmpdir_factory.mktemp('hourly').join('hourly.sqlite'))
+    shutil.copyfile(snapshot_file, snapshot)
+    con = sqlite3.connect(snapshot)
+    sites = con.execute('SELECT DISTINCT load_zone, technology, site, orientation FROM cap_factor').fetchall()
+    for d in range(n_days):
+        day = datetime.date(2007, 3, 1) + datetime.timedelta(days=d)
+        for h in range(24):
+            date_time = str(datetime.datetime.combine(day, datetime.time(h)))
+            for i, z in enumerate(['Oahu', 'Maui']):
+                load = 500.0 + 100 * (d % 3) + 10 * h + (2000.0 if d == peak_day else 0.0)
+                con.execute('INSERT INTO system_load VALUES (?, ?, ?)', (z, date_time, load / (i + 1)))
+            for (z, tech, site, orientation) in sites:
+                if tech == 'CentralTrackingPV':
+                    cf = max(0.0, 1 - abs(h - 12) / 6.0) * (0.5 + 0.2 * (d % 3))
+                else:
+                    cf = (d % 3) / 5.0 + h / 100.0
+                con.execute(
+                    'INSERT INTO cap_factor VALUES (?, ?, ?, ?, ?, ?)', 
+                    (z, tech, site, orientation, date_time, cf)
+                )
+            con.execute(
+                'INSERT INTO existing_plants_cap_factor VALUES (?, ?, ?, ?)', 
+                ('Oahu_Kahuku_Wind', 'Oahu', date_time, (d % 3) / 4.0)
+            )
+    con.execute("INSERT INTO snapshot_args VALUES ('hourly_years', '[2007]')")
+    con.commit()
+    con.close()
+    return snapshot
+
+def read_json(inputs_dir):
+    with open(os.path.join(inputs_dir, 'representative_days.json')) as f:
+        return json.load(f)
+
+def tab_rows(text):
+    return [l.split('\t') for l in text.splitlines()[1:]]
+
+def test_representative_days(export, hourly_snapshot):
+    inputs_dir = export('rep', db_snapshot=hourly_snapshot, representative_days=4)
+    info = read_json(inputs_dir)
+    assert info['base_time_sample'] == 'test' and info['time_sample'].startswith('test_rep4_')
+    assert info['representative_year'] == 2007
+    # the days in time_sample only have 4 hours of data, so they aren't candidates
+    assert info['candidate_days'] == n_days
+    days = info['days']
+    assert len(days) == 4
+    assert sum(d['days_represented'] for d in days) == n_days
+    assert [d['date'] for d in days if d['peak_day']] == ['2007-03-10']
+    assert sorted(d['days_represented'] for d in days) == [1, 3, 3, 3]
+    # days d and d + 3 are the same, so the representative days are exact
+    for feature, e in info['error'].items():
+        assert e['rmse_scaled'] == pytest.approx(0, abs=1e-9), feature
+        assert e['mean_error'] == pytest.approx(0, abs=1e-9), feature
+
+    files = read_files(inputs_dir)
+    timeseries = tab_rows(files['timeseries.tab'])
+    assert len(timeseries) == 2 * 4
+    for period in ['2020', '2025']:
+        rows = [r for r in timeseries if r[1] == period]
+        assert all(float(r[2]) == 1 and int(r[3]) == 24 for r in rows)
+        # the days still represent the same number of hours in each period 
+        # (the base time_sample has 2 days of 4 one-hour timepoints, each
+        # repeated 182.5 times)
+        assert sum(float(r[4]) * 24 for r in rows) == pytest.approx(2 * 182.5 * 4)
+    assert len(tab_rows(files['timepoints.tab'])) == 2 * 4 * 24
+    assert len(tab_rows(files['loads.tab'])) == 2 * 2 * 4 * 24
+    # the peak day keeps its own load
+    assert max(float(r[2]) for r in tab_rows(files['loads.tab'])) >= 2500
+
+def test_repeatable(export, hourly_snapshot):
+    first = read_files(export('first', db_snapshot=hourly_snapshot, representative_days=4))
+    second = read_files(export('second', db_snapshot=hourly_snapshot, representative_days=4))
+    assert first == second
+
+def test_identical_days(export, hourly_snapshot):
+    # there are only four distinct days, so asking for more gives the same days
+    inputs_dir = export('rep', db_snapshot=hourly_snapshot, representative_days=n_days + 5)
+    days = read_json(inputs_dir)['days']
+    assert sorted(d['days_represented'] for d in days) == [1, 3, 3, 3]
+
+def test_peak_days(export, hourly_snapshot):
+    with pytest.raises(ValueError) as e:
+        export('rep', db_snapshot=hourly_snapshot, representative_days=2, peak_days=2)
+    assert 'greater than peak_days' in str(e.value)
+
+def test_next_export(export, hourly_snapshot):
+    # the next export doesn't set up the representative days on its connection
+    export('rep', db_snapshot=hourly_snapshot, representative_days=4)
+    export('standard')
+    assert scenario_data.con_state['time_samples'] == set(['test'])
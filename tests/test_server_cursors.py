@@ -0,0 +1,31 @@
+"""
+Check that exports using batched server-side cursors (fetch_batch_size) write
+exactly the same files as a standard export.
+"""
+
+import pytest
+import scenario_data
+from conftest import read_files, assert_same_files
+
+@pytest.mark.parametrize('batch_size', [1, 3, 10000])
+def test_same_files(export, standard_files, batch_size):
+    assert_same_files(export('batched', fetch_batch_size=batch_size), standard_files)
+
+def test_indexed_set_member_order(export, standard_files):
+    # streaming mode groups the rows by index without reordering the members
+    assert 'set G_MULTI_FUELS[Oahu_IC] := LSFO Diesel LNG ;' in standard_files['gen_multiple_fuels.dat']
+    files = read_files(export('streaming', fetch_batch_size=2))
+    assert files['gen_multiple_fuels.dat'] == standard_files['gen_multiple_fuels.dat']
+
+def test_grouped_rows(export):
+    export()
+    query = """
+        SELECT * FROM (
+            SELECT 'b' AS k, 1 AS v UNION ALL SELECT 'a', 2 UNION ALL 
+            SELECT 'b', 3 UNION ALL SELECT 'a', 4 UNION ALL SELECT 'c', 5
+        ) AS t;
+    """
+    columns, rows = scenario_data.query_rows(query, dict(fetch_batch_size=2), group_columns=-1)
+    assert columns == ['k', 'v']
+    # groups in the order they first appear, rows in their original order
+    assert [tuple(r) for r in rows] == [('b', 1), ('b', 3), ('a', 2), ('a', 4), ('c', 5)]
@@ -0,0 +1,56 @@
+"""
+Check the settings and the study_timepoint table that scenario_data sets up 
+once per export for use in the queries.
+"""
+
+import scenario_data, sqlite_snapshot
+
+def test_study_settings(snapshot_file, monkeypatch):
+    monkeypatch.setattr(scenario_data, 'session_time_sample', None)
+    scenario_data.set_db_backend(dict(db_snapshot=snapshot_file))
+    args = dict(time_sample='test')
+    scenario_data.set_study_settings(args)
+    assert args == dict(time_sample='test', hours_per_timepoint=1, last_period=2025)
+    args = dict(time_sample='test', hours_per_timepoint=2)
+    scenario_data.set_study_settings(args)
+    assert args['hours_per_timepoint'] == 2
+
+def test_study_timepoint(snapshot_file):
+    con = sqlite_snapshot.connect(snapshot_file)
+    try:
+        scenario_data.prepare_session(con, 'test')
+        cur = con.cursor()
+        cur.execute("""
+            SELECT t.study_date, t.study_hour, t.date_time, t.period, t.hour_index, h.date_time
+            FROM study_timepoint t JOIN study_hour h USING (time_sample, study_hour)
+            WHERE t.time_sample = %(time_sample)s
+            ORDER BY 2;
+        """, dict(time_sample='test'))
+        rows = cur.fetchall()
+        # 2 periods with 2 days of 4 hours
+        assert len(rows) == 16
+        for (study_date, study_hour, date_time, period, hour_index, hour_date_time) in rows:
+            assert date_time == hour_date_time
+            assert period == study_date // 1000
+            assert hour_index == study_hour % 100
+        # other time samples can be added on the same connection
+        scenario_data.prepare_session(con, 'other')
+        cur.execute('SELECT COUNT(*) FROM study_timepoint')
+        assert cur.fetchone()[0] == 16
+    finally:
+        con.close()
+
+def test_session_prepared_once(export, monkeypatch):
+    export('first')
+    prepared = []
+    prepare_session = scenario_data.prepare_session
+    def recording_prepare_session(connection, time_sample):
+        prepared.append(time_sample)
+        prepare_session(connection, time_sample)
+    monkeypatch.setattr(scenario_data, 'prepare_session', recording_prepare_session)
+    # the next export on the same connection reuses its study_timepoint table
+    export('second')
+    assert prepared == []
+    # each worker's connection is prepared once
+    export('parallel', export_workers=2)
+    assert prepared in (['test'], ['test', 'test'])
@@ -0,0 +1,50 @@
+"""
+Check that sharded exports write exactly the same files as a standard serial
+export, and report errors in the shards.
+"""
+
+import pytest
+import scenario_data
+from conftest import read_files, assert_same_files
+
+@pytest.mark.parametrize('options', [
+    dict(export_shards=3),
+    dict(export_shards=2, shard_by='load_zone'),
+    dict(export_shards=2, shard_by='technology'),
+    dict(export_workers=2, export_shards=2),
+])
+def test_same_files(export, standard_files, options):
+    assert_same_files(export('variant', **options), standard_files)
+
+def test_sharded_timepoint_average(export):
+    expected = read_files(export('standard', hours_per_timepoint=2))
+    assert_same_files(export('sharded', hours_per_timepoint=2, export_shards=3), expected)
+
+def test_shard_groups():
+    assert scenario_data.shard_groups(range(5), 2) == [[0, 2, 4], [1, 3]]
+    assert scenario_data.shard_groups(['Oahu'], 3) == [['Oahu']]
+
+def test_unknown_shard_method(export):
+    with pytest.raises(ValueError) as e:
+        export('variant', export_shards=2, shard_by='project')
+    assert 'shard_by must be' in str(e.value)
+
+def test_shard_error(export, monkeypatch):
+    # an error in one shard is raised by the export
+    query_rows = scenario_data.query_rows
+    def failing_query_rows(query, arguments, **kw):
+        if 'hashtext' in query and query.endswith('= 1'):
+            raise RuntimeError('shard failed')
+        return query_rows(query, arguments, **kw)
+    monkeypatch.setattr(scenario_data, 'query_rows', failing_query_rows)
+    with pytest.raises(RuntimeError):
+        export('variant', export_shards=2)
+
+def test_sorted_tables(standard_files):
+    # the tables that can be sharded are sorted the same way without shards
+    for f in scenario_data.sharded_tables:
+        rows = [
+            tuple(float(v) if i > 0 else v for i, v in enumerate(l.split('\t')))
+            for l in standard_files[f].splitlines()[1:]
+        ]
+        assert rows and rows == sorted(rows), f
@@ -0,0 +1,77 @@
+"""
+Check that an alternative scenario exported with inputs_subdir and alt_args
+shares the files that don't depend on alt_args with the base scenario, and 
+gets the same inputs as a standalone export.
+"""
+
+import os
+import pytest
+from conftest import read_files, assert_same_files
+
+def export_alternative(export, **alt_args):
+    """Export the base scenario, then an alternative with alt_args in the 
+    'alternative' subdirectory. Return the name of the subdirectory."""
+    base_dir = export('base')
+    export('base', inputs_subdir='alternative', alt_args=alt_args, **alt_args)
+    return os.path.join(base_dir, 'alternative')
+
+def test_shared_files(export):
+    expected = read_files(export('standalone', interest_rate=0.07))
+    alt_dir = export_alternative(export, interest_rate=0.07)
+    assert os.path.islink(os.path.join(alt_dir, 'loads.tab'))
+    assert os.path.islink(os.path.join(alt_dir, 'variable_capacity_factors.tab'))
+    assert not os.path.islink(os.path.join(alt_dir, 'financials.dat'))
+    assert_same_files(alt_dir, expected)
+
+def test_query_arguments(export):
+    expected = read_files(export('standalone', exclude_technologies=('OnshoreWind',)))
+    alt_dir = export_alternative(export, exclude_technologies=('OnshoreWind',))
+    assert not os.path.islink(os.path.join(alt_dir, 'variable_capacity_factors.tab'))
+    assert os.path.islink(os.path.join(alt_dir, 'loads.tab'))
+    assert_same_files(alt_dir, expected)
+
+def test_loaded_data(export):
+    pytest.importorskip('switch_patch')
+    from model_inputs import load_inputs, assert_same_data
+    expected = load_inputs(export('standalone', interest_rate=0.07))
+    base_dir = export('base', npz_sidecars=True)
+    export(
+        'base', inputs_subdir='alternative', npz_sidecars=True,
+        alt_args=dict(interest_rate=0.07), interest_rate=0.07
+    )
+    alt_dir = os.path.join(base_dir, 'alternative')
+    assert os.path.islink(os.path.join(alt_dir, 'loads.npz'))
+    assert_same_data(load_inputs(alt_dir), expected)
+
+def test_derived_arguments(export):
+    # last_period and the study_timepoint table are derived from time_sample,
+    # so every file that uses either of them depends on time_sample (the same
+    # time_sample is used here, so the files can be compared)
+    expected = read_files(export('standalone'))
+    alt_dir = export_alternative(export, time_sample='test')
+    for f in [
+        'generator_info.tab', 'gen_new_build_costs.tab', 'project_info.tab', 
+        'proj_existing_builds.tab', 'proj_build_costs.tab', 
+        'non_fuel_energy_sources.tab', 'loads.tab', 'timepoints.tab',
+        'variable_capacity_factors.tab'
+    ]:
+        assert not os.path.islink(os.path.join(alt_dir, f)), f
+    assert os.path.islink(os.path.join(alt_dir, 'financials.dat'))
+    assert os.path.islink(os.path.join(alt_dir, 'load_zones.tab'))
+    assert_same_files(alt_dir, expected)
+
+@pytest.mark.parametrize('options', [
+    # these change the existing plants table (and the project names)
+    dict(aggregate_plants=True),
+    # these change the format of some files, or which files are written
+    dict(sparse_commit_bounds=True),
+    dict(dedup_cap_factors=True),
+])
+def test_session_tables_and_formats(export, options):
+    # (the export checks that the alternative's files refer to the same projects)
+    expected = read_files(export('standalone', **options))
+    base_files = read_files(export('base'))
+    alt_dir = export_alternative(export, **options)
+    assert_same_files(alt_dir, expected)
+    # the base scenario didn't get any of the alternative's files
+    assert_same_files(os.path.dirname(alt_dir), base_files)
@@ -0,0 +1,22 @@
+"""
+Check that exports from a SQLite snapshot refuse to run when the snapshot
+doesn't hold the data the scenario needs.
+"""
+
+import pytest
+
+def test_time_sample(export):
+    with pytest.raises(ValueError) as e:
+        export(time_sample='other')
+    assert 'time_sample other' in str(e.value)
+
+def test_load_zones(export):
+    with pytest.raises(ValueError) as e:
+        export(load_zones=('Oahu', 'Kauai'))
+    assert 'load_zones Oahu, Kauai' in str(e.value)
+
+def test_representative_days(export):
+    # the test snapshot only holds the hours in time_sample, not the full year
+    with pytest.raises(ValueError) as e:
+        export(representative_days=2)
+    assert 'full year of hourly data for 2007' in str(e.value)
@@ -0,0 +1,64 @@
+"""
+Check that table fingerprints follow the source data, so the query cache and
+skip_unchanged only reuse files whose source tables haven't changed.
+"""
+
+import os, json, shutil, sqlite3
+import pytest
+import scenario_data
+from conftest import read_files
+
+@pytest.fixture
+def snapshot_copy(snapshot_file, tmpdir):
+    """Return the name of a copy of the test snapshot, which can be edited."""
+    copy = str(tmpdir.join('copy.sqlite'))
+    shutil.copyfile(snapshot_file, copy)
+    return copy
+
+def edit_snapshot(snapshot_file, statement):
+    con = sqlite3.connect(snapshot_file)
+    con.execute(statement)
+    con.commit()
+    con.close()
+
+def manifest_sources(inputs_dir):
+    with open(os.path.join(inputs_dir, 'export_manifest.json')) as f:
+        return {k: v['source'] for k, v in json.load(f)['files'].items()}
+
+def test_fingerprints(export, snapshot_copy, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    export('first', db_snapshot=snapshot_copy, query_cache_dir=cache_dir)
+    before = scenario_data.table_fingerprints(['system_load', 'cap_factor', 'no_such_table'])
+    assert before['no_such_table'] is None
+    edit_snapshot(snapshot_copy, "UPDATE system_load SET system_load = 1.0 WHERE load_zone = 'Maui'")
+    # fingerprints are kept for the rest of the export, then recalculated
+    assert scenario_data.table_fingerprints(['system_load']) == {'system_load': before['system_load']}
+    export('second', db_snapshot=snapshot_copy, query_cache_dir=cache_dir)
+    after = scenario_data.table_fingerprints(['system_load', 'cap_factor'])
+    assert after['system_load'] != before['system_load']
+    assert after['cap_factor'] == before['cap_factor']
+
+def test_cache_invalidation(export, snapshot_copy, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    first = export('first', db_snapshot=snapshot_copy, query_cache_dir=cache_dir)
+    edit_snapshot(snapshot_copy, "UPDATE system_load SET system_load = 1.0 WHERE load_zone = 'Maui'")
+    second = export('second', db_snapshot=snapshot_copy, query_cache_dir=cache_dir)
+    # only the files that use system_load are queried again
+    sources = manifest_sources(second)
+    assert sources['loads.tab'] == 'query'
+    assert sources['project_info.tab'] == 'query'   # lists load zones from system_load
+    assert sources['variable_capacity_factors.tab'] == 'query cache'
+    assert read_files(second)['loads.tab'] != read_files(first)['loads.tab']
+
+def test_skip_unchanged(export, snapshot_copy):
+    inputs_dir = export('inputs', db_snapshot=snapshot_copy, skip_unchanged=True)
+    files = read_files(inputs_dir)
+    export('inputs', db_snapshot=snapshot_copy, skip_unchanged=True)
+    assert set(manifest_sources(inputs_dir).values()) == set(['unchanged'])
+
+    edit_snapshot(snapshot_copy, "UPDATE cap_factor SET cap_factor = 0.5 WHERE technology = 'OnshoreWind'")
+    export('inputs', db_snapshot=snapshot_copy, skip_unchanged=True)
+    sources = manifest_sources(inputs_dir)
+    assert sources['variable_capacity_factors.tab'] == 'query'
+    assert sources['loads.tab'] == 'unchanged'
+    assert read_files(inputs_dir)['variable_capacity_factors.tab'] != files['variable_capacity_factors.tab']
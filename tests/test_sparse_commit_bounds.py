@@ -0,0 +1,33 @@
+"""
+Check that sparse_commit_bounds writes one row of commitment bounds per 
+project instead of one per project and timepoint, and that these load into 
+the model with the same data as the standard file.
+"""
+
+from conftest import read_files
+
+def test_sparse_files(export):
+    inputs_dir = export('standard', sparse_commit_bounds=True)
+    files = read_files(inputs_dir)
+    # the older per-timepoint file is removed
+    assert 'proj_commit_bounds_timeseries.tab' not in files
+    assert files['proj_commit_bounds_defaults.tab'].splitlines() == [
+        'PROJECT\tproj_min_commit_fraction\tproj_max_commit_fraction\tproj_min_load_fraction',
+        'Oahu_Kahe_1\t1.0\t.\t.',
+        'Oahu_Kahe_2\t1.0\t.\t.',
+        'Maui_Kahului_1\t1.0\t.\t.',
+        'Maui_Kahului_2\t1.0\t.\t.',
+    ]
+    # and switching back removes the defaults
+    files = read_files(export('standard'))
+    assert 'proj_commit_bounds_defaults.tab' not in files
+    assert 'proj_commit_bounds_timeseries.tab' in files
+
+def test_must_run_disabled(export):
+    files = read_files(export('standard', sparse_commit_bounds=True, enable_must_run=0))
+    assert files['proj_commit_bounds_defaults.tab'].count('\n') == 1
+
+def test_loaded_data(export, standard_data):
+    from model_inputs import load_inputs, assert_same_data
+    inputs_dir = export('sparse', sparse_commit_bounds=True)
+    assert_same_data(load_inputs(inputs_dir), standard_data)
@@ -0,0 +1,51 @@
+"""
+Check that hours_per_timepoint groups the hours in each timeseries into 
+longer timepoints, averaging the hourly data over each one.
+"""
+
+import os
+import pytest
+from conftest import read_files, assert_same_files
+
+def tab_rows(text):
+    return [l.split('\t') for l in text.splitlines()[1:]]
+
+def test_averages(export, standard_files):
+    files = read_files(export('standard', hours_per_timepoint=2))
+    for (ts, period, duration, num_tps, scale) in tab_rows(files['timeseries.tab']):
+        assert (float(duration), int(num_tps)) == (2, 2)
+    hourly_tps = [r[0] for r in tab_rows(standard_files['timepoints.tab'])]
+    # each timepoint is identified by its first hour
+    assert [r[0] for r in tab_rows(files['timepoints.tab'])] == hourly_tps[::2]
+    hourly = {(z, tp): float(v) for (z, tp, v) in tab_rows(standard_files['loads.tab'])}
+    loads = tab_rows(files['loads.tab'])
+    assert len(loads) == len(hourly) / 2
+    for (z, tp, v) in loads:
+        next_tp = hourly_tps[hourly_tps.index(tp) + 1]
+        assert float(v) == pytest.approx((hourly[z, tp] + hourly[z, next_tp]) / 2)
+    assert len(tab_rows(files['variable_capacity_factors.tab'])) == (
+        len(tab_rows(standard_files['variable_capacity_factors.tab'])) / 2
+    )
+
+def test_uneven_timeseries(export):
+    with pytest.raises(ValueError) as e:
+        export('standard', hours_per_timepoint=3)
+    assert 'not a multiple of hours_per_timepoint (3)' in str(e.value)
+
+def test_shared_base(export):
+    # hours_per_timepoint doesn't appear in the queries when it is 1, but 
+    # all the timepoint-indexed files still depend on it
+    expected = read_files(export('standalone', hours_per_timepoint=1))
+    base_dir = export('base', hours_per_timepoint=2)
+    export(
+        'base', inputs_subdir='alternative', 
+        alt_args=dict(hours_per_timepoint=1), hours_per_timepoint=1
+    )
+    alt_dir = os.path.join(base_dir, 'alternative')
+    for f in [
+        'timepoints.tab', 'loads.tab', 'variable_capacity_factors.tab', 
+        'proj_commit_bounds_timeseries.tab'
+    ]:
+        assert not os.path.islink(os.path.join(alt_dir, f)), f
+    assert os.path.islink(os.path.join(alt_dir, 'project_info.tab'))
+    assert_same_files(alt_dir, expected)
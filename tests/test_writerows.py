@@ -0,0 +1,51 @@
+"""
+Check that scenario_data.writerows() writes exactly the same text as calling
+writerow() for each row.
+"""
+
+from cStringIO import StringIO
+from decimal import Decimal
+import scenario_data, sqlite_snapshot, writer_benchmark
+
+def row_by_row(rows):
+    f = StringIO()
+    for r in rows:
+        scenario_data.writerow(f, r)
+    return f.getvalue()
+
+def chunked(rows):
+    f = StringIO()
+    scenario_data.writerows(f, rows)
+    return f.getvalue()
+
+def test_synthetic_rows():
+    # includes nulls, Decimals and strings that need quoting or escaping
+    rows = writer_benchmark.synthetic_rows(20, 50)
+    assert chunked(rows) == row_by_row(rows)
+
+def test_snapshot_tables(snapshot_file):
+    cur = sqlite_snapshot.connect(snapshot_file).cursor()
+    for table in ['existing_plants', 'generator_costs', 'cap_factor', 'study_hour']:
+        cur.execute('SELECT * FROM ' + table)
+        rows = cur.fetchall()
+        assert chunked(iter(rows)) == row_by_row(rows), table
+
+def test_chunk_boundaries(monkeypatch):
+    monkeypatch.setattr(scenario_data, 'writerows_chunk_size', 3)
+    rows = [
+        ('Kahe 1', 1, 0.1), ('Kahe_2', None, 2.0 / 3), ('Waiau "8"', 3, None),
+        ("Honolulu's CT", 4, True), ('a\tb', 5, 1e-20), ('x', 6, 7),
+        # rows with other widths are written one at a time
+        ('short', 1), ('long', 1, 2, 3),
+    ]
+    assert chunked(rows) == row_by_row(rows)
+    assert chunked([]) == ''
+
+def test_mixed_types():
+    # equal values of different types in a column with strings
+    rows = [('a b',), (True,), (1,), (1.0,), (1L,), ('1',), (None,), (False,), (0,)]
+    assert chunked(rows) == row_by_row(rows)
+    assert chunked(rows).split() == ['"a', 'b"', 'True', '1', '1.0', '1', '1', '.', 'False', '0']
+    rows = [('a b',), (Decimal('1'),), (Decimal('1.00'),), (0.0,), (-0.0,)]
+    assert chunked(rows) == row_by_row(rows)
+    assert chunked(rows).split() == ['"a', 'b"', '1', '1.00', '0.0', '-0.0']
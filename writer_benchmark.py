@@ -0,0 +1,66 @@
+"""
+Compare the speed of scenario_data.writerows() to writing the same rows one
+at a time with scenario_data.writerow(), using synthetic project x timepoint
+data like variable_capacity_factors.tab, and check that both produce exactly
+the same output (including '.' for nulls and quoting/escaping of strings).
+
+Usage: python writer_benchmark.py [projects] [timepoints]
+"""
+
+import sys, time, random, decimal
+from cStringIO import StringIO
+import scenario_data
+
+def synthetic_rows(n_projects, n_timepoints):
+    """Return a list of (project, timepoint, cap_factor, cost, note) rows."""
+    random.seed(0)
+    projects = [
+        'Oahu_{}_{}'.format(t, i) for i in range(n_projects)
+            for t in ['CentralTrackingPV', 'OnshoreWind']
+    ][:n_projects]
+    # a few names that need quoting or escaping
+    projects[:3] = ['Kahe 1', 'Waiau "8"', "Honolulu's CT"][:len(projects)]
+    notes = ['', 'new', 'must run', None]
+    return [
+        (
+            p,
+            tp,
+            None if random.random() < 0.05 else random.random(),
+            decimal.Decimal(i % 1000) / 8,
+            notes[(i + tp) % len(notes)]
+        )
+        for i, p in enumerate(projects)
+            for tp in range(n_timepoints)
+    ]
+
+def old_writerows(f, rows):
+    for r in rows:
+        scenario_data.writerow(f, r)
+
+def time_writer(writer, rows, repeats=3):
+    """Return the best time taken to write the rows, and the output."""
+    best = None
+    for i in range(repeats):
+        f = StringIO()
+        start = time.time()
+        writer(f, rows)
+        dur = time.time() - start
+        best = dur if best is None else min(best, dur)
+    return best, f.getvalue()
+
+if __name__ == '__main__':
+    n_projects = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_timepoints = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rows = synthetic_rows(n_projects, n_timepoints)
+    print "Writing {n} rows ({p} projects x {t} timepoints).".format(
+        n=len(rows), p=n_projects, t=n_timepoints
+    )
+    old_time, old_output = time_writer(old_writerows, rows)
+    new_time, new_output = time_writer(scenario_data.writerows, rows)
+    print "writerow() for each row: {dur:.2f}s".format(dur=old_time)
+    print "writerows(): {dur:.2f}s ({x:.1f}x faster)".format(dur=new_time, x=old_time/max(new_time, 1e-6))
+    if new_output == old_output:
+        print "Output is identical ({n} bytes).".format(n=len(new_output))
+    else:
+        print "ERROR: output differs."
+        sys.exit(1)